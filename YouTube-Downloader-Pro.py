@@ -1,631 +1,1189 @@
-import flet as ft
-import yt_dlp
-import os
-import threading
-import time
-import imageio_ffmpeg
-import platform
-import locale
-import subprocess 
-import ctypes 
-
-# --- Système de Traduction ---
-TRANSLATIONS = {
-    "fr": {
-        "window_title": "YouTube Downloader Pro",
-        "url_label": "Collez le lien ici (Vidéo ou Playlist)",
-        "analyze_btn": "ANALYSER",
-        "col_left_title": "1. Sélectionnez les vidéos",
-        "select_all": "Tout sélectionner",
-        "no_video": "Aucune vidéo chargée",
-        "col_right_title": "2. Options & Progression",
-        "format_label": "Format",
-        "quality_label": "Qualité",
-        "compat_label": "Mode Compatibilité (Tablette/TV)", 
-        "dl_mp4_btn": "TÉLÉCHARGER MP4",
-        "dl_mp3_btn": "CONVERTIR EN MP3",
-        "waiting": "En attente...",
-        "pause_state": "PAUSE",
-        "finished": "Terminé !",
-        "folder_label": "Dossier de sortie : ",
-        "open_folder_btn": "OUVRIR LE DOSSIER",
-        "analyzing": "Analyse en cours...",
-        "videos_found": "{} vidéos trouvées",
-        "error": "Erreur : {}",
-        "error_private": "Vidéo privée/inaccessible détectée.",
-        "skipped": "Ignorée, passage à la suivante...",
-        "processing": "Traitement {}/{}..."
-    },
-    "en": {
-        "window_title": "YouTube Downloader Pro",
-        "url_label": "Paste link here (Video or Playlist)",
-        "analyze_btn": "ANALYZE",
-        "col_left_title": "1. Select Videos",
-        "select_all": "Select All",
-        "no_video": "No video loaded",
-        "col_right_title": "2. Options & Progress",
-        "format_label": "Format",
-        "quality_label": "Quality",
-        "compat_label": "Compatibility Mode (Tablet/TV)",
-        "dl_mp4_btn": "DOWNLOAD MP4",
-        "dl_mp3_btn": "CONVERT TO MP3",
-        "waiting": "Waiting...",
-        "pause_state": "PAUSED",
-        "finished": "Done!",
-        "folder_label": "Output folder: ",
-        "open_folder_btn": "OPEN FOLDER",
-        "analyzing": "Analyzing...",
-        "videos_found": "{} videos found",
-        "error": "Error: {}",
-        "error_private": "Private/Unavailable video detected.",
-        "skipped": "Skipped, moving to next...",
-        "processing": "Processing {}/{}..."
-    }
-}
-
-# --- Détection de la Langue ---
-def get_system_language():
-    os_name = platform.system()
-    detected_lang = "en" 
-    try:
-        if os_name == "Windows":
-            windll = ctypes.windll.kernel32
-            lang_id = windll.GetUserDefaultUILanguage()
-            if (lang_id & 0x3FF) == 0x0C:
-                detected_lang = "fr"
-        elif os_name == "Darwin": 
-            cmd = "defaults read -g AppleLanguages"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-            output = result.stdout
-            if output:
-                head = output.strip().replace('\n', '').replace(' ', '')[:30]
-                if '"fr' in head: 
-                    detected_lang = "fr"
-        else:
-            sys_locale = locale.getdefaultlocale()[0]
-            if sys_locale and sys_locale.startswith("fr"):
-                detected_lang = "fr"
-    except Exception as e:
-        print(f"Erreur détection langue ({e}), fallback sur EN.")
-    return detected_lang
-
-current_lang = get_system_language()
-
-def tr(key, *args):
-    text = TRANSLATIONS[current_lang].get(key, key)
-    if args:
-        return text.format(*args)
-    return text
-
-# --- Configuration Globale ---
-class DownloadState:
-    RUNNING = "running"
-    PAUSED = "paused"
-    CANCELLED = "cancelled"
-    IDLE = "idle"
-
-def main(page: ft.Page):
-    # --- Configuration de la fenêtre ---
-    page.title = tr("window_title")
-    page.theme_mode = "dark"
-    width = 700
-    height = 600 
-
-    page.window_width = width
-    page.window_height = height
-    page.window_min_width = width
-    page.window_max_width = width
-    page.window_min_height = height
-    page.window_max_height = height
-    page.window_resizable = False 
-    page.window_maximizable = False
-    
-    page.vertical_alignment = "start"
-    page.horizontal_alignment = "center"
-    page.padding = 20
-
-    # --- Variables d'état ---
-    home = os.path.expanduser('~')
-    app_folder_name = tr("window_title") 
-
-    # Définition du chemin selon l'OS
-    if platform.system() == "Darwin": # macOS
-        base_folder = os.path.join(home, 'Movies')
-    elif platform.system() == "Windows": # Windows
-        base_folder = os.path.join(home, 'Videos')
-    else: # Linux / Autre
-        base_folder = os.path.join(home, 'Videos')
-
-    download_path = os.path.join(base_folder, app_folder_name)
-
-    if not os.path.exists(download_path):
-        try: 
-            os.makedirs(download_path)
-        except: 
-            download_path = os.path.join(home, 'Downloads', app_folder_name)
-            if not os.path.exists(download_path):
-                try: os.makedirs(download_path)
-                except: pass
-
-    current_state = DownloadState.IDLE
-    video_list_data = []
-    download_queue = []
-    current_video_index = 0
-
-    # --- UI : Zone Recherche ---
-    title_text = ft.Text(tr("window_title"), size=24, weight="bold")
-    
-    url_input = ft.TextField(
-        label=tr("url_label"),
-        expand=True,
-        prefix_icon="link",
-        border_radius=10,
-        height=45,
-        content_padding=10,
-        text_size=14,
-        on_submit=lambda e: analyze_button_click(e)
-    )
-
-    analyze_btn = ft.ElevatedButton(
-        text=tr("analyze_btn"),
-        icon="search",
-        height=45,
-        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=10)),
-        on_click=lambda e: analyze_button_click(e)
-    )
-
-    search_area = ft.Row([url_input, analyze_btn], alignment="center")
-
-    # --- UI : Colonne Gauche ---
-    videos_list_view = ft.ListView(expand=True, spacing=5, padding=10, auto_scroll=False)
-    select_all_checkbox = ft.Checkbox(label=tr("select_all"), value=True, on_change=lambda e: toggle_select_all(e))
-    list_info_text = ft.Text(tr("no_video"), color="grey", italic=True, size=12)
-
-    left_column = ft.Column(
-        [
-            ft.Text(tr("col_left_title"), weight="bold", size=16),
-            ft.Divider(height=10),
-            select_all_checkbox,
-            list_info_text,
-            ft.Container(
-                content=videos_list_view,
-                expand=True, 
-                border=ft.border.all(1, "grey"),
-                border_radius=10,
-                padding=5
-            )
-        ],
-        expand=True
-    )
-
-    # --- UI : Colonne Droite ---
-    
-    def on_format_change(e):
-        if format_dropdown.value == "MP3":
-            resolution_dropdown.visible = False
-            compatibility_checkbox.visible = False 
-            start_download_btn.text = tr("dl_mp3_btn")
-            start_download_btn.icon = "audiotrack"
-        else:
-            resolution_dropdown.visible = True
-            compatibility_checkbox.visible = True
-            start_download_btn.text = tr("dl_mp4_btn")
-            start_download_btn.icon = "download"
-        page.update()
-
-    format_dropdown = ft.Dropdown(
-        label=tr("format_label"),
-        width=130,
-        text_size=14,
-        options=[
-            ft.dropdown.Option("MP4"),
-            ft.dropdown.Option("MP3"),
-        ],
-        value="MP4",
-        border_radius=10,
-        prefix_icon="file_present",
-        on_change=on_format_change
-    )
-
-    resolution_dropdown = ft.Dropdown(
-        label=tr("quality_label"),
-        width=130,
-        text_size=14,
-        options=[
-            ft.dropdown.Option("1080p"),
-            ft.dropdown.Option("720p"),
-            ft.dropdown.Option("480p"),
-            ft.dropdown.Option("360p"),
-            ft.dropdown.Option("240p"),
-        ],
-        value="480p",
-        border_radius=10,
-        prefix_icon="settings"
-    )
-
-    options_row = ft.Row([format_dropdown, resolution_dropdown], alignment="center")
-
-    compatibility_checkbox = ft.Checkbox(
-        label=tr("compat_label"),
-        value=False,
-        label_style=ft.TextStyle(size=12, color="grey")
-    )
-
-    start_download_btn = ft.ElevatedButton(
-        text=tr("dl_mp4_btn"),
-        icon="download",
-        bgcolor="green",
-        color="white",
-        height=45,
-        width=280,
-        disabled=True, 
-        on_click=lambda e: start_download_sequence(e)
-    )
-
-    open_folder_btn = ft.ElevatedButton(
-        text=tr("open_folder_btn"),
-        icon="folder_open",
-        bgcolor="blue",
-        color="white",
-        height=45,
-        width=280,
-        visible=False, 
-        on_click=lambda e: open_destination_folder()
-    )
-
-    current_video_label = ft.Text(tr("waiting"), weight="bold", size=14, text_align="center")
-    progress_bar = ft.ProgressBar(width=300, value=0, color="blue", bgcolor="grey") 
-    speed_text = ft.Text("-", size=11, color="grey")
-    eta_text = ft.Text("-", size=11, color="grey")
-    
-    btn_pause = ft.IconButton(icon="pause", icon_size=24, icon_color="orange", tooltip="Pause", on_click=lambda e: set_state(DownloadState.PAUSED))
-    btn_resume = ft.IconButton(icon="play_arrow", icon_size=24, icon_color="green", tooltip="Resume", visible=False, on_click=lambda e: resume_download(e))
-    btn_cancel = ft.IconButton(icon="stop", icon_size=24, icon_color="red", tooltip="Stop", on_click=lambda e: set_state(DownloadState.CANCELLED))
-    
-    controls_row = ft.Row([btn_pause, btn_resume, btn_cancel], alignment="center", visible=False)
-
-    right_column = ft.Column(
-        [
-            ft.Text(tr("col_right_title"), weight="bold", size=16),
-            ft.Divider(height=10),
-            ft.Container(height=5),
-            
-            options_row,
-            ft.Container(height=5),
-            compatibility_checkbox, 
-            
-            ft.Container(height=10),
-            start_download_btn,
-            ft.Container(height=20), 
-            
-            ft.Container(
-                content=ft.Column([
-                    current_video_label,
-                    ft.Container(height=5),
-                    progress_bar,
-                    ft.Row([speed_text, eta_text], alignment="space_between", width=300)
-                ], horizontal_alignment="center"),
-                padding=15,
-                bgcolor="#222222", 
-                border_radius=10,
-                width=340
-            ),
-            
-            ft.Container(height=10),
-            controls_row,
-            ft.Container(height=10), 
-            open_folder_btn, 
-            ft.Container(height=5),
-            ft.Text(tr("folder_label") + download_path, size=10, color="grey", text_align="center")
-        ],
-        horizontal_alignment="center",
-        expand=True
-    )
-
-    main_content = ft.Row(
-        [
-            ft.Container(content=left_column, expand=1, padding=10),
-            ft.VerticalDivider(width=1, color="grey"),
-            ft.Container(content=right_column, expand=1, padding=10)
-        ],
-        expand=True,
-        visible=False 
-    )
-
-    # --- Logique Métier ---
-
-    def open_destination_folder():
-        path = download_path
-        try:
-            sys_os = platform.system()
-            if sys_os == "Windows":
-                os.startfile(path)
-            elif sys_os == "Darwin": 
-                subprocess.Popen(["open", path])
-            else: 
-                subprocess.Popen(["xdg-open", path])
-        except Exception as e:
-            print(f"Erreur ouverture dossier: {e}")
-
-    def play_finish_sound():
-        try:
-            sys_os = platform.system()
-            if sys_os == "Darwin":
-                os.system('afplay /System/Library/Sounds/Glass.aiff')
-            elif sys_os == "Windows":
-                import winsound
-                winsound.MessageBeep()
-            else:
-                print('\a')
-        except Exception as e:
-            print(f"Impossible de jouer le son: {e}")
-
-    def set_state(new_state):
-        nonlocal current_state
-        current_state = new_state
-        
-        if new_state == DownloadState.PAUSED:
-            btn_pause.visible = False
-            btn_resume.visible = True
-            current_video_label.value = tr("pause_state")
-            current_video_label.color = "orange"
-        elif new_state == DownloadState.RUNNING:
-            btn_pause.visible = True
-            btn_resume.visible = False
-            current_video_label.color = "white"
-        
-        page.update()
-
-    def analyze_button_click(e):
-        url = url_input.value
-        if not url: return
-
-        analyze_btn.disabled = True
-        list_info_text.value = tr("analyzing")
-        videos_list_view.controls.clear()
-        
-        main_content.visible = True
-        start_download_btn.disabled = True
-        page.update()
-
-        threading.Thread(target=run_analyze, args=(url,), daemon=True).start()
-
-    def run_analyze(url):
-        nonlocal video_list_data
-        ydl_opts = {'extract_flat': True, 'quiet': True}
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if 'entries' in info: video_list_data = list(info['entries'])
-                else: video_list_data = [info]
-            
-            videos_list_view.controls.clear()
-            for vid in video_list_data:
-                title = vid.get('title', 'Sans titre')
-                
-                vid_id = vid.get('id')
-                if vid_id:
-                    vid_url = f"https://www.youtube.com/watch?v={vid_id}"
-                else:
-                    vid_url = vid.get('webpage_url') or vid.get('url')
-
-                cb = ft.Checkbox(label=title, value=True, data=vid_url)
-                videos_list_view.controls.append(cb)
-
-            list_info_text.value = tr("videos_found", len(video_list_data))
-            analyze_btn.disabled = False
-            start_download_btn.disabled = False
-            page.update()
-
-        except Exception as e:
-            error_msg = str(e)
-            if "Private video" in error_msg or "Sign in" in error_msg:
-                list_info_text.value = tr("error_private")
-            else:
-                list_info_text.value = tr("error", error_msg)
-            
-            analyze_btn.disabled = False
-            page.update()
-
-    def toggle_select_all(e):
-        for ctrl in videos_list_view.controls:
-            if isinstance(ctrl, ft.Checkbox): ctrl.value = select_all_checkbox.value
-        page.update()
-
-    def progress_hook(d):
-        if current_state == DownloadState.CANCELLED: raise Exception("CANCELLED")
-        if current_state == DownloadState.PAUSED: raise Exception("PAUSED")
-
-        if d['status'] == 'downloading':
-            try:
-                total = d.get('total_bytes') or d.get('total_bytes_estimate')
-                downloaded = d.get('downloaded_bytes', 0)
-                percent_str = "0%"
-                if total:
-                    ratio = downloaded / total
-                    progress_bar.value = ratio
-                    percent_str = f"{int(ratio * 100)}%"
-                else:
-                    p = d.get('_percent_str', '0%').replace('%', '')
-                    import re
-                    ansi_escape = re.compile(r'\x1b[^m]*m')
-                    p = ansi_escape.sub('', p)
-                    try:
-                        progress_bar.value = float(p) / 100
-                        percent_str = f"{p}%"
-                    except: pass
-                current_video_label.value = f"Downloading : {percent_str}"
-                speed_text.value = f"Speed: {d.get('_speed_str', '-')}"
-                eta_text.value = f"ETA: {d.get('_eta_str', '-')}"
-                page.update()
-            except Exception as e: 
-                pass
-
-    def run_download_loop():
-        nonlocal current_video_index, current_state
-        ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
-
-        selected_format = format_dropdown.value
-        res_value = resolution_dropdown.value.replace("p", "")
-        force_compatibility = compatibility_checkbox.value
-
-        while current_video_index < len(download_queue):
-            if current_state == DownloadState.CANCELLED: break
-            if current_state == DownloadState.PAUSED: break
-
-            # Récupération de l'objet Checkbox actuel pour mise à jour UI
-            current_checkbox_item = download_queue[current_video_index]
-            url = current_checkbox_item.data # On récupère l'URL stockée dans l'objet
-
-            # --- MISE A JOUR UI : EN COURS (⏩) ---
-            # On nettoie d'abord les éventuels symboles précédents pour ne garder que le titre
-            clean_title = current_checkbox_item.label.replace("⏩ ", "").replace("✔️ ", "").replace("❌ ", "")
-            current_checkbox_item.label = f"⏩ {clean_title}"
-            current_checkbox_item.update()
-
-            current_video_label.value = tr("processing", current_video_index + 1, len(download_queue))
-            current_video_label.color = "white" 
-            progress_bar.value = 0 
-            page.update()
-
-            ydl_opts = {
-                'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-                'progress_hooks': [progress_hook],
-                'ffmpeg_location': ffmpeg_path,
-                'noplaylist': True,
-                'ignoreerrors': True,
-                # Force le client 'default' (Android/iOS) pour contourner le manque de JS runtime
-                'extractor_args': {'youtube': {'player_client': ['default']}}
-            }
-
-            if selected_format == "MP3":
-                ydl_opts.update({
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                })
-            else:
-                if force_compatibility:
-                    format_string = f'bestvideo[height<={res_value}][vcodec^=avc1]+bestaudio[ext=m4a]/bestvideo[height<={res_value}][ext=mp4]+bestaudio[ext=m4a]/best[height<={res_value}][ext=mp4]/best[height<={res_value}]'
-                else:
-                    format_string = f'bestvideo[height<={res_value}][ext=mp4]+bestaudio[ext=m4a]/best[height<={res_value}][ext=mp4]/best[height<={res_value}]'
-                
-                ydl_opts.update({
-                    'format': format_string,
-                })
-
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                
-                # --- SUCCÈS : MISE A JOUR UI LISTE (✔️) ---
-                current_checkbox_item.value = False
-                current_checkbox_item.label = f"✔️ {clean_title}"
-                current_checkbox_item.update() 
-
-                current_video_index += 1
-                progress_bar.value = 1 
-                page.update()
-
-            except Exception as e:
-                # --- ÉCHEC : MISE A JOUR UI LISTE (❌) ---
-                current_checkbox_item.value = False # On décoche pour dire "traité"
-                current_checkbox_item.label = f"❌ {clean_title}"
-                current_checkbox_item.update()
-
-                # GESTION DES ERREURS DANS LA BOUCLE
-                error_msg = str(e)
-                
-                if "PAUSED" in error_msg: 
-                    return 
-                elif "CANCELLED" in error_msg:
-                    reset_ui_after_download()
-                    return
-                
-                if "Private video" in error_msg or "Sign in" in error_msg:
-                    current_video_label.value = f"{tr('error_private')} {tr('skipped')}"
-                else:
-                    current_video_label.value = f"Erreur : {error_msg}. {tr('skipped')}"
-                
-                current_video_label.color = "red"
-                progress_bar.value = 0
-                page.update()
-                
-                time.sleep(1.5)
-                current_video_index += 1 
-
-        if current_video_index >= len(download_queue):
-            current_video_label.value = tr("finished")
-            current_video_label.color = "green"
-            play_finish_sound()
-            reset_ui_after_download()
-
-    def start_download_sequence(e):
-        nonlocal download_queue, current_video_index
-        download_queue = []
-        for ctrl in videos_list_view.controls:
-            if isinstance(ctrl, ft.Checkbox) and ctrl.value:
-                # --- MODIFICATION : On stocke l'objet Checkbox entier ---
-                download_queue.append(ctrl)
-        
-        if not download_queue: return
-
-        current_video_index = 0
-        set_state(DownloadState.RUNNING)
-        
-        start_download_btn.disabled = True 
-        open_folder_btn.visible = False 
-        
-        resolution_dropdown.disabled = True 
-        format_dropdown.disabled = True 
-        compatibility_checkbox.disabled = True 
-        controls_row.visible = True
-        analyze_btn.disabled = True
-        url_input.disabled = True
-        videos_list_view.disabled = True 
-        select_all_checkbox.disabled = True
-        
-        page.update()
-        threading.Thread(target=run_download_loop, daemon=True).start()
-
-    def resume_download(e):
-        set_state(DownloadState.RUNNING)
-        threading.Thread(target=run_download_loop, daemon=True).start()
-
-    def reset_ui_after_download():
-        nonlocal current_state
-        current_state = DownloadState.IDLE
-        controls_row.visible = False
-        
-        start_download_btn.visible = True 
-        start_download_btn.disabled = False 
-        open_folder_btn.visible = True 
-        
-        resolution_dropdown.disabled = False 
-        format_dropdown.disabled = False 
-        compatibility_checkbox.disabled = False 
-        analyze_btn.disabled = False
-        url_input.disabled = False
-        videos_list_view.disabled = False
-        select_all_checkbox.disabled = False
-        progress_bar.value = 0
-        speed_text.value = "-"
-        eta_text.value = "-"
-        page.update()
-
-    # --- Assemblage final ---
-    page.add(
-        ft.Column([
-            ft.Row([ft.Icon("video_library", size=40, color="red"), title_text], alignment="center"),
-            ft.Divider(color="transparent", height=10),
-            search_area,
-            ft.Divider(),
-            main_content 
-        ], expand=True)
-    )
-
-if __name__ == "__main__":
-    ft.app(target=main)
+import flet as ft
+import os
+import threading
+import time
+import platform
+import locale
+import subprocess 
+import ctypes 
+from downloader_engine import (
+    DownloadState, DownloadEngine, EngineListener, DownloadJob, ProgressBus, MetadataCache, JobJournal, DownloadArchive, BandwidthLimiter, DiskBudget, AUDIO_FORMATS,
+    ErrorClass, MultiSourceAnalysis, AnalysisListener, AnalysisSource, SyncState, load_config, save_config, serve_metrics, warm_up, find_ffmpeg, classify_error,
+    entry_from_info, video_entry_key, parse_url_list, ANSI_ESCAPE, CACHE_FILE, JOURNAL_FILE, ARCHIVE_FILE, SYNC_FILE, METRICS_FILE, SUMMARY_FILE,
+)
+
+# --- Système de Traduction ---
+TRANSLATIONS = {
+    "fr": {
+        "window_title": "YouTube Downloader Pro",
+        "url_label": "Collez un ou plusieurs liens (vidéos, playlists, chaînes)",
+        "url_file": "Charger une liste de liens (.txt)",
+        "analyze_btn": "ANALYSER",
+        "col_left_title": "1. Sélectionnez les vidéos",
+        "select_all": "Tout sélectionner",
+        "no_video": "Aucune vidéo chargée",
+        "col_right_title": "2. Options & Progression",
+        "format_label": "Format",
+        "quality_label": "Qualité",
+        "compat_label": "Mode Compatibilité (Tablette/TV)", 
+        "dl_mp4_btn": "TÉLÉCHARGER MP4",
+        "dl_mp3_btn": "CONVERTIR EN MP3",
+        "dl_audio_btn": "EXTRAIRE L'AUDIO ({})",
+        "format_audio_auto": "AUDIO (auto)",
+        "waiting": "En attente...",
+        "pause_state": "PAUSE",
+        "finished": "Terminé !",
+        "folder_label": "Dossier de sortie : ",
+        "open_folder_btn": "OUVRIR LE DOSSIER",
+        "analyzing": "Analyse en cours...",
+        "videos_found": "{} vidéos trouvées",
+        "error": "Erreur : {}",
+        "error_private": "Vidéo privée/inaccessible détectée.",
+        "skipped": "Ignorée, passage à la suivante...",
+        "processing": "Traitement {}/{}...",
+        "workers_label": "Simultanés",
+        "queued": "En file d'attente",
+        "cancelled": "Annulé",
+        "batch_progress": "{} / {} terminés",
+        "speed_total": "Vitesse : {}",
+        "speed_limited": "Vitesse : {} (limite {})",
+        "force_refresh": "Forcer l'actualisation",
+        "cache_stats": "Cache : {} trouvés / {} manqués",
+        "from_cache": "{} vidéos trouvées (cache)",
+        "analyzing_count": "Analyse en cours... {} vidéos",
+        "start_early": "Démarrer pendant l'analyse",
+        "list_window": "{}-{} sur {}",
+        "journal_resumed": "Reprise de {} téléchargements ({} partiels)",
+        "archived_skipped": "{} vidéos déjà téléchargées, ignorées",
+        "convert_waiting": "En attente de conversion...",
+        "converting": "Conversion...",
+        "stage_status": "Conversion : {} en cours, {} en attente",
+        "retrying": "Nouvel essai dans {} s (tentative {})...",
+        "no_space": "Espace disque insuffisant : {} vidéos écartées ({} libres)",
+        "analyzing_sources": "Analyse : {} / {} sources, {} vidéos",
+        "sources_found": "{} vidéos trouvées dans {} sources ({} doublons écartés)",
+        "source_queued": "en attente",
+        "source_running": "{} vidéos...",
+        "source_done": "{} vidéos",
+        "source_duplicates": "{} vidéos, {} doublons",
+        "sync_new": "Nouveautés seulement",
+        "sync_found": "{} nouvelles vidéos depuis la dernière synchronisation",
+        "source_new": "{} nouvelles vidéos"
+    },
+    "en": {
+        "window_title": "YouTube Downloader Pro",
+        "url_label": "Paste one or more links (videos, playlists, channels)",
+        "url_file": "Load a list of links (.txt)",
+        "analyze_btn": "ANALYZE",
+        "col_left_title": "1. Select Videos",
+        "select_all": "Select All",
+        "no_video": "No video loaded",
+        "col_right_title": "2. Options & Progress",
+        "format_label": "Format",
+        "quality_label": "Quality",
+        "compat_label": "Compatibility Mode (Tablet/TV)",
+        "dl_mp4_btn": "DOWNLOAD MP4",
+        "dl_mp3_btn": "CONVERT TO MP3",
+        "dl_audio_btn": "EXTRACT AUDIO ({})",
+        "format_audio_auto": "AUDIO (auto)",
+        "waiting": "Waiting...",
+        "pause_state": "PAUSED",
+        "finished": "Done!",
+        "folder_label": "Output folder: ",
+        "open_folder_btn": "OPEN FOLDER",
+        "analyzing": "Analyzing...",
+        "videos_found": "{} videos found",
+        "error": "Error: {}",
+        "error_private": "Private/Unavailable video detected.",
+        "skipped": "Skipped, moving to next...",
+        "processing": "Processing {}/{}...",
+        "workers_label": "Parallel",
+        "queued": "Queued",
+        "cancelled": "Cancelled",
+        "batch_progress": "{} / {} done",
+        "speed_total": "Speed: {}",
+        "speed_limited": "Speed: {} (limit {})",
+        "force_refresh": "Force refresh",
+        "cache_stats": "Cache: {} hits / {} misses",
+        "from_cache": "{} videos found (cached)",
+        "analyzing_count": "Analyzing... {} videos",
+        "start_early": "Start while analyzing",
+        "list_window": "{}-{} of {}",
+        "journal_resumed": "Resuming {} downloads ({} partial)",
+        "archived_skipped": "{} videos already downloaded, skipped",
+        "convert_waiting": "Waiting for conversion...",
+        "converting": "Converting...",
+        "stage_status": "Converting: {} running, {} waiting",
+        "retrying": "Retrying in {} s (attempt {})...",
+        "no_space": "Not enough disk space: {} videos left out ({} free)",
+        "analyzing_sources": "Analyzing: {} / {} sources, {} videos",
+        "sources_found": "{} videos found in {} sources ({} duplicates removed)",
+        "source_queued": "waiting",
+        "source_running": "{} videos...",
+        "source_done": "{} videos",
+        "source_duplicates": "{} videos, {} duplicates",
+        "sync_new": "New videos only",
+        "sync_found": "{} new videos since the last sync",
+        "source_new": "{} new videos"
+    }
+}
+
+# --- Détection de la Langue ---
+def get_system_language():
+    os_name = platform.system()
+    detected_lang = "en" 
+    try:
+        if os_name == "Windows":
+            windll = ctypes.windll.kernel32
+            lang_id = windll.GetUserDefaultUILanguage()
+            if (lang_id & 0x3FF) == 0x0C:
+                detected_lang = "fr"
+        elif os_name == "Darwin": 
+            # Lecture directe des préférences globales : "defaults read" coûtait un processus au démarrage
+            import plistlib
+            with open(os.path.expanduser('~/Library/Preferences/.GlobalPreferences.plist'), 'rb') as f:
+                languages = plistlib.load(f).get("AppleLanguages") or []
+            if languages and languages[0].startswith("fr"):
+                detected_lang = "fr"
+        else:
+            sys_locale = locale.getdefaultlocale()[0]
+            if sys_locale and sys_locale.startswith("fr"):
+                detected_lang = "fr"
+    except Exception as e:
+        print(f"Erreur détection langue ({e}), fallback sur EN.")
+    return detected_lang
+
+current_lang = get_system_language()
+
+def tr(key, *args):
+    text = TRANSLATIONS[current_lang].get(key, key)
+    if args:
+        return text.format(*args)
+    return text
+
+# --- Configuration Globale ---
+MAX_WORKERS = 8
+DEFAULT_CONFIG = {
+    "workers": 3,
+    "cache_ttl_hours": 24,
+    "cache_max_mb": 64,
+    # Débits au format "2M", "500K"... (null = illimité), plages : {"start": "08:00", "end": "19:00", "limit": "2M"}
+    "bandwidth_limit": None,
+    "bandwidth_windows": [],
+    "job_bandwidth_limit": None,
+    # Port local du point d'accès /metrics (null = désactivé) ; metrics.prom est écrit à chaque fin de lot
+    "metrics_port": None,
+    # Connexions parallèles par fichier (plages d'octets ou fragments DASH), réduites sur HTTP 429
+    "connections": 4,
+}
+
+# --- Modèle de la liste des vidéos ---
+# La liste peut contenir des dizaines de milliers d'entrées (chaînes complètes) : on ne garde
+# qu'un enregistrement compact par vidéo, et seules les lignes visibles existent en contrôles Flet.
+LIST_WINDOW_SIZE = 50
+
+class SelectionModel:
+    # Sélection compacte : un état par défaut + l'ensemble des indices qui y dérogent.
+    # "Tout (dé)sélectionner" se fait donc en O(1), quelle que soit la taille de la liste.
+    __slots__ = ('count', 'default', 'exceptions')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.default = True
+        self.exceptions = set()
+
+    def append(self, n, selected=True):
+        start = self.count
+        self.count += n
+        if selected != self.default:
+            self.exceptions.update(range(start, self.count))
+
+    def is_selected(self, index):
+        return self.default != (index in self.exceptions)
+
+    def set(self, index, value):
+        if value == self.default:
+            self.exceptions.discard(index)
+        else:
+            self.exceptions.add(index)
+
+    def set_range(self, start, end, value):
+        # Case d'en-tête d'une source : toutes ses entrées d'un coup
+        for index in range(start, end):
+            self.set(index, value)
+
+    def select_all(self, value):
+        self.default = value
+        self.exceptions = set()
+
+    def iter_selected(self):
+        if self.default:
+            return (i for i in range(self.count) if i not in self.exceptions)
+        return iter(sorted(self.exceptions))
+
+
+def main(page: ft.Page):
+    # --- Configuration de la fenêtre ---
+    page.title = tr("window_title")
+    page.theme_mode = "dark"
+    width = 700
+    height = 600 
+
+    page.window_width = width
+    page.window_height = height
+    page.window_min_width = width
+    page.window_max_width = width
+    page.window_min_height = height
+    page.window_max_height = height
+    page.window_resizable = False 
+    page.window_maximizable = False
+    
+    page.vertical_alignment = "start"
+    page.horizontal_alignment = "center"
+    page.padding = 20
+
+    # --- Variables d'état ---
+    home = os.path.expanduser('~')
+    app_folder_name = tr("window_title") 
+
+    # Définition du chemin selon l'OS
+    if platform.system() == "Darwin": # macOS
+        base_folder = os.path.join(home, 'Movies')
+    elif platform.system() == "Windows": # Windows
+        base_folder = os.path.join(home, 'Videos')
+    else: # Linux / Autre
+        base_folder = os.path.join(home, 'Videos')
+
+    download_path = os.path.join(base_folder, app_folder_name)
+
+    if not os.path.exists(download_path):
+        try: 
+            os.makedirs(download_path)
+        except: 
+            download_path = os.path.join(home, 'Downloads', app_folder_name)
+            if not os.path.exists(download_path):
+                try: os.makedirs(download_path)
+                except: pass
+
+    config = load_config(DEFAULT_CONFIG, MAX_WORKERS)
+    batch_options = {}
+    archived_skipped = 0     # Vidéos du lot ignorées car déjà dans l'archive
+    disk_budget = None       # Espace libre du lot, consommé par les vidéos admises
+    batch_lock = threading.Lock()    # Sérialise le démarrage d'un lot et l'arrivée de nouvelles entrées
+    analysis_running = False
+    video_entries = []       # Un VideoEntry par vidéo analysée
+    analysis_sources = []    # Sources de la dernière analyse (en-têtes de groupe s'il y en a plusieurs)
+    current_analysis = None
+    selection = SelectionModel()
+    window_start = 0         # Index de la première ligne affichée
+    entry_rows = []          # Cases des entrées, réutilisées d'une page à l'autre
+    visible_rows = {}        # Index d'entrée -> case affichée
+    header_rows = {}         # Index de source -> case d'en-tête
+    progress_bus = ProgressBus(lambda batch: apply_progress(batch), fps=10)
+    metadata_cache = None
+    try:
+        metadata_cache = MetadataCache(CACHE_FILE, config["cache_ttl_hours"] * 3600, config["cache_max_mb"] * 1024 * 1024)
+    except Exception as e:
+        print(f"Cache des analyses indisponible: {e}")
+    job_journal = None
+    try:
+        job_journal = JobJournal(JOURNAL_FILE)
+    except Exception as e:
+        print(f"Journal des téléchargements indisponible: {e}")
+    download_archive = None
+    try:
+        download_archive = DownloadArchive(ARCHIVE_FILE)
+    except Exception as e:
+        print(f"Archive des téléchargements indisponible: {e}")
+    sync_state = None
+    try:
+        sync_state = SyncState(SYNC_FILE)
+    except Exception as e:
+        print(f"État de synchronisation indisponible: {e}")
+    # File, workers et conversion : tout passe par le moteur, l'interface n'en est qu'un client
+    bandwidth_limiter = None
+    try:
+        bandwidth_limiter = BandwidthLimiter.from_config(config)
+    except (ValueError, KeyError, AttributeError) as e:
+        print(f"Erreur limites de débit ({e}), débit illimité.")
+    engine = DownloadEngine(download_path, config["workers"], journal=job_journal, archive=download_archive, limiter=bandwidth_limiter, metrics_file=METRICS_FILE, summary_file=SUMMARY_FILE, connections=config["connections"])
+    if config.get("metrics_port"):
+        try:
+            serve_metrics(engine.metrics, int(config["metrics_port"]))
+        except Exception as e:
+            print(f"Erreur point d'accès des métriques: {e}")
+
+    # --- UI : Zone Recherche ---
+    title_text = ft.Text(tr("window_title"), size=24, weight="bold")
+    
+    url_input = ft.TextField(
+        label=tr("url_label"),
+        expand=True,
+        prefix_icon="link",
+        border_radius=10,
+        height=45,
+        content_padding=10,
+        text_size=14,
+        on_submit=lambda e: analyze_button_click(e)
+    )
+
+    url_file_picker = ft.FilePicker(on_result=lambda e: on_url_file_picked(e))
+    url_file_btn = ft.IconButton(
+        icon="upload_file",
+        tooltip=tr("url_file"),
+        on_click=lambda e: url_file_picker.pick_files(allowed_extensions=["txt"])
+    )
+
+    analyze_btn = ft.ElevatedButton(
+        text=tr("analyze_btn"),
+        icon="search",
+        height=45,
+        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=10)),
+        on_click=lambda e: analyze_button_click(e)
+    )
+
+    force_refresh_checkbox = ft.Checkbox(
+        label=tr("force_refresh"),
+        value=False,
+        label_style=ft.TextStyle(size=12, color="grey")
+    )
+    cache_stats_text = ft.Text("", size=11, color="grey")
+
+    start_early_checkbox = ft.Checkbox(
+        label=tr("start_early"),
+        value=False,
+        label_style=ft.TextStyle(size=12, color="grey")
+    )
+
+    # Chaînes suivies : l'analyse s'arrête sur les vidéos vues à la synchronisation précédente
+    sync_checkbox = ft.Checkbox(
+        label=tr("sync_new"),
+        value=False,
+        disabled=sync_state is None,
+        label_style=ft.TextStyle(size=12, color="grey")
+    )
+
+    search_area = ft.Column([
+        ft.Row([url_input, url_file_btn, analyze_btn], alignment="center"),
+        ft.Row([force_refresh_checkbox, start_early_checkbox, sync_checkbox, cache_stats_text], alignment="spaceBetween")
+    ], spacing=2)
+
+    # --- UI : Colonne Gauche ---
+    # Liste virtualisée : au plus LIST_WINDOW_SIZE lignes, réutilisées d'une page à l'autre
+    videos_list_view = ft.ListView(expand=True, spacing=5, padding=10, auto_scroll=False)
+    select_all_checkbox = ft.Checkbox(label=tr("select_all"), value=True, on_change=lambda e: toggle_select_all(e))
+    list_info_text = ft.Text(tr("no_video"), color="grey", italic=True, size=12)
+    window_text = ft.Text("", size=11, color="grey")
+    prev_page_btn = ft.IconButton(icon="chevron_left", icon_size=18, disabled=True, on_click=lambda e: change_page(-1))
+    next_page_btn = ft.IconButton(icon="chevron_right", icon_size=18, disabled=True, on_click=lambda e: change_page(1))
+
+    left_column = ft.Column(
+        [
+            ft.Text(tr("col_left_title"), weight="bold", size=16),
+            ft.Divider(height=10),
+            select_all_checkbox,
+            list_info_text,
+            ft.Container(
+                content=videos_list_view,
+                expand=True, 
+                border=ft.border.all(1, "grey"),
+                border_radius=10,
+                padding=5
+            ),
+            ft.Row([prev_page_btn, window_text, next_page_btn], alignment="center")
+        ],
+        expand=True
+    )
+
+    # --- UI : Colonne Droite ---
+    
+    def on_format_change(e):
+        if format_dropdown.value in AUDIO_FORMATS:
+            resolution_dropdown.visible = False
+            compatibility_checkbox.visible = False 
+            # Seul MP3 réencode ; les autres profils copient le flux audio de la source
+            if format_dropdown.value == "MP3":
+                start_download_btn.text = tr("dl_mp3_btn")
+            else:
+                start_download_btn.text = tr("dl_audio_btn", format_dropdown.value if format_dropdown.value != "AUDIO" else "auto")
+            start_download_btn.icon = "audiotrack"
+        else:
+            resolution_dropdown.visible = True
+            compatibility_checkbox.visible = True
+            start_download_btn.text = tr("dl_mp4_btn")
+            start_download_btn.icon = "download"
+        page.update()
+
+    format_dropdown = ft.Dropdown(
+        label=tr("format_label"),
+        width=160,
+        text_size=14,
+        options=[
+            ft.dropdown.Option("MP4"),
+            ft.dropdown.Option("AUDIO", tr("format_audio_auto")),
+            ft.dropdown.Option("M4A"),
+            ft.dropdown.Option("OPUS"),
+            ft.dropdown.Option("MP3"),
+        ],
+        value="MP4",
+        border_radius=10,
+        prefix_icon="file_present",
+        on_change=on_format_change
+    )
+
+    resolution_dropdown = ft.Dropdown(
+        label=tr("quality_label"),
+        width=130,
+        text_size=14,
+        options=[
+            ft.dropdown.Option("1080p"),
+            ft.dropdown.Option("720p"),
+            ft.dropdown.Option("480p"),
+            ft.dropdown.Option("360p"),
+            ft.dropdown.Option("240p"),
+        ],
+        value="480p",
+        border_radius=10,
+        prefix_icon="settings"
+    )
+
+    options_row = ft.Row([format_dropdown, resolution_dropdown], alignment="center")
+
+    compatibility_checkbox = ft.Checkbox(
+        label=tr("compat_label"),
+        value=False,
+        label_style=ft.TextStyle(size=12, color="grey")
+    )
+
+    def on_workers_change(e):
+        config["workers"] = int(workers_dropdown.value)
+        save_config(config)
+        engine.set_workers(config["workers"])
+
+    workers_dropdown = ft.Dropdown(
+        label=tr("workers_label"),
+        width=130,
+        text_size=14,
+        options=[ft.dropdown.Option(str(n)) for n in range(1, MAX_WORKERS + 1)],
+        value=str(config["workers"]),
+        border_radius=10,
+        prefix_icon="layers",
+        on_change=on_workers_change
+    )
+
+    start_download_btn = ft.ElevatedButton(
+        text=tr("dl_mp4_btn"),
+        icon="download",
+        bgcolor="green",
+        color="white",
+        height=45,
+        width=280,
+        disabled=True, 
+        on_click=lambda e: start_download_sequence(e)
+    )
+
+    open_folder_btn = ft.ElevatedButton(
+        text=tr("open_folder_btn"),
+        icon="folder_open",
+        bgcolor="blue",
+        color="white",
+        height=45,
+        width=280,
+        visible=False, 
+        on_click=lambda e: open_destination_folder()
+    )
+
+    current_video_label = ft.Text(tr("waiting"), weight="bold", size=14, text_align="center")
+    progress_bar = ft.ProgressBar(width=300, value=0, color="blue", bgcolor="grey") 
+    speed_text = ft.Text("-", size=11, color="grey")
+    eta_text = ft.Text("-", size=11, color="grey")
+    stage_text = ft.Text("", size=11, color="grey")
+    
+    # Une ligne de progression par téléchargement actif
+    jobs_list_view = ft.ListView(height=130, spacing=5, auto_scroll=False)
+    
+    btn_pause = ft.IconButton(icon="pause", icon_size=24, icon_color="orange", tooltip="Pause", on_click=lambda e: pause_download(e))
+    btn_resume = ft.IconButton(icon="play_arrow", icon_size=24, icon_color="green", tooltip="Resume", visible=False, on_click=lambda e: resume_download(e))
+    btn_cancel = ft.IconButton(icon="stop", icon_size=24, icon_color="red", tooltip="Stop", on_click=lambda e: engine.cancel_all())
+    
+    controls_row = ft.Row([btn_pause, btn_resume, btn_cancel], alignment="center", visible=False)
+
+    right_column = ft.Column(
+        [
+            ft.Text(tr("col_right_title"), weight="bold", size=16),
+            ft.Divider(height=10),
+            ft.Container(height=5),
+            
+            options_row,
+            ft.Container(height=5),
+            compatibility_checkbox, 
+            ft.Row([workers_dropdown], alignment="center"),
+            
+            ft.Container(height=10),
+            start_download_btn,
+            ft.Container(height=20), 
+            
+            ft.Container(
+                content=ft.Column([
+                    current_video_label,
+                    ft.Container(height=5),
+                    progress_bar,
+                    ft.Row([speed_text, eta_text], alignment="space_between", width=300),
+                    stage_text,
+                    jobs_list_view
+                ], horizontal_alignment="center"),
+                padding=15,
+                bgcolor="#222222", 
+                border_radius=10,
+                width=340
+            ),
+            
+            ft.Container(height=10),
+            controls_row,
+            ft.Container(height=10), 
+            open_folder_btn, 
+            ft.Container(height=5),
+            ft.Text(tr("folder_label") + download_path, size=10, color="grey", text_align="center")
+        ],
+        horizontal_alignment="center",
+        scroll="auto",
+        expand=True
+    )
+
+    main_content = ft.Row(
+        [
+            ft.Container(content=left_column, expand=1, padding=10),
+            ft.VerticalDivider(width=1, color="grey"),
+            ft.Container(content=right_column, expand=1, padding=10)
+        ],
+        expand=True,
+        visible=False 
+    )
+
+    # --- Logique Métier ---
+
+    def open_destination_folder():
+        path = download_path
+        try:
+            sys_os = platform.system()
+            if sys_os == "Windows":
+                os.startfile(path)
+            elif sys_os == "Darwin": 
+                subprocess.Popen(["open", path])
+            else: 
+                subprocess.Popen(["xdg-open", path])
+        except Exception as e:
+            print(f"Erreur ouverture dossier: {e}")
+
+    def play_finish_sound():
+        try:
+            sys_os = platform.system()
+            if sys_os == "Darwin":
+                os.system('afplay /System/Library/Sounds/Glass.aiff')
+            elif sys_os == "Windows":
+                import winsound
+                winsound.MessageBeep()
+            else:
+                print('\a')
+        except Exception as e:
+            print(f"Impossible de jouer le son: {e}")
+
+    def show_state(new_state):
+        if new_state == DownloadState.PAUSED:
+            btn_pause.visible = False
+            btn_resume.visible = True
+            current_video_label.value = tr("pause_state")
+            current_video_label.color = "orange"
+        elif new_state == DownloadState.RUNNING:
+            btn_pause.visible = True
+            btn_resume.visible = False
+            current_video_label.color = "white"
+        
+        page.update()
+
+    def analyze_button_click(e):
+        nonlocal analysis_running
+        # Une ou plusieurs URLs (bloc collé : retours à la ligne devenus espaces)
+        urls = parse_url_list(url_input.value or "")
+        if not urls or analysis_running: return
+        analysis_running = True
+
+        analyze_btn.disabled = True
+        list_info_text.value = tr("analyzing")
+        clear_entries()
+        
+        main_content.visible = True
+        start_download_btn.disabled = True
+        page.update()
+
+        threading.Thread(target=run_analyze, args=(urls,), daemon=True).start()
+
+    def on_url_file_picked(e):
+        if not e.files or analysis_running: return
+        try:
+            with open(e.files[0].path, 'r', encoding='utf-8') as f:
+                url_input.value = " ".join(parse_url_list(f.read()))
+        except OSError as ex:
+            list_info_text.value = tr("error", ex)
+            page.update()
+            return
+        analyze_button_click(e)
+
+    # --- Liste virtualisée ---
+    def format_entry_label(entry):
+        return f"{entry.status} {entry.title}" if entry.status else entry.title
+
+    def format_source_label(source):
+        name = source.title or source.url
+        if source.state == AnalysisSource.FAILED:
+            return f"❌ {name} — {tr('error', ANSI_ESCAPE.sub('', source.error or ''))}"
+        if source.state == AnalysisSource.QUEUED:
+            return f"⏳ {name} — {tr('source_queued')}"
+        if source.state == AnalysisSource.RUNNING:
+            return f"🔄 {name} — {tr('source_running', source.found)}"
+        if source.duplicates:
+            return f"📂 {name} — {tr('source_duplicates', source.added, source.duplicates)}"
+        if source.synced:
+            return f"📂 {name} — {tr('source_new', source.added)}"
+        return f"📂 {name} — {tr('source_done', source.added)}"
+
+    def on_row_change(e):
+        selection.set(e.control.data, e.control.value)
+
+    def on_header_change(e):
+        source = e.control.data
+        selection.set_range(source.start, source.start + source.added, e.control.value)
+        render_window()
+        page.update()
+
+    def source_header(source):
+        header = header_rows.get(source.index)
+        if header is None:
+            header = header_rows[source.index] = ft.Checkbox(
+                value=select_all_checkbox.value, data=source, on_change=on_header_change,
+                label_style=ft.TextStyle(size=12, weight="bold", color="blue")
+            )
+        header.label = format_source_label(source)
+        header.disabled = not source.added
+        return header
+
+    def render_window():
+        count = len(video_entries)
+        end = min(window_start + LIST_WINDOW_SIZE, count)
+        while len(entry_rows) < end - window_start:
+            entry_rows.append(ft.Checkbox(value=True, on_change=on_row_change))
+        # En-têtes de groupe dès que plusieurs sources sont analysées : avant la première entrée
+        # de chaque source, et en haut de page pour la source en cours
+        sources = analysis_sources if len(analysis_sources) > 1 else []
+        groups = sorted((s for s in sources if s.start is not None), key=lambda s: (s.start, s.added > 0))
+        rows = []
+        visible_rows.clear()
+        for offset, index in enumerate(range(window_start, end)):
+            for source in groups:
+                if source.start == index or (index == window_start and source.start < index < source.start + source.added):
+                    rows.append(source_header(source))
+            entry = video_entries[index]
+            cb = entry_rows[offset]
+            cb.data = entry.index
+            cb.label = format_entry_label(entry)
+            cb.value = selection.is_selected(entry.index)
+            rows.append(cb)
+            visible_rows[entry.index] = cb
+        if end == count:
+            # Sources vides, en échec ou dont les entrées attendent leur tour : en fin de liste
+            rows.extend(source_header(s) for s in groups if s.start == count)
+            rows.extend(source_header(s) for s in sources if s.start is None)
+        videos_list_view.controls[:] = rows
+        window_text.value = tr("list_window", window_start + 1 if count else 0, end, count)
+        prev_page_btn.disabled = window_start == 0
+        next_page_btn.disabled = end >= count
+
+    def change_page(delta):
+        nonlocal window_start
+        last_start = max(0, (len(video_entries) - 1) // LIST_WINDOW_SIZE * LIST_WINDOW_SIZE)
+        window_start = max(0, min(window_start + delta * LIST_WINDOW_SIZE, last_start))
+        render_window()
+        page.update()
+
+    def refresh_entry(entry):
+        # Seule la ligne visible (s'il y en a une) est mise à jour
+        cb = visible_rows.get(entry.index)
+        if cb is not None and cb.data == entry.index:
+            cb.label = format_entry_label(entry)
+            cb.value = selection.is_selected(entry.index)
+            cb.update()
+
+    def clear_entries():
+        nonlocal window_start
+        with batch_lock:
+            video_entries.clear()
+            analysis_sources.clear()
+            header_rows.clear()
+            selection.reset()
+            select_all_checkbox.value = True
+            window_start = 0
+            render_window()
+
+    def add_entries(entries):
+        # Ajoute un lot d'entrées à la liste (et au lot de téléchargement s'il tourne déjà)
+        with batch_lock:
+            start = len(video_entries)
+            new_entries = [entry_from_info(start + i, vid) for i, vid in enumerate(entries)]
+            video_entries.extend(new_entries)
+            selection.append(len(new_entries), True)
+            render_window()
+            if engine.state in (DownloadState.RUNNING, DownloadState.PAUSED):
+                append_to_batch(new_entries)
+
+    def run_analyze(urls):
+        nonlocal analysis_running, current_analysis
+        auto_start = start_early_checkbox.value
+
+        def on_entries(source, entries):
+            nonlocal auto_start
+            flush_analyze_batch(entries)
+            # Option : on démarre dès les premières entrées, la suite rejoindra le lot
+            if auto_start and engine.state == DownloadState.IDLE:
+                auto_start = False
+                start_download_sequence(None)
+
+        listener = AnalysisListener(
+            on_source_started=update_source, on_source_progress=update_source,
+            on_source_opened=update_source, on_entries=on_entries, on_source_finished=update_source,
+        )
+        # Le cache est relu sauf actualisation forcée, et mis à jour dans tous les cas
+        sync = sync_state if sync_checkbox.value else None
+        analysis = MultiSourceAnalysis(engine.pool, urls, listener, cache=metadata_cache, refresh=force_refresh_checkbox.value, sync=sync)
+        with batch_lock:
+            current_analysis = analysis
+            analysis_sources[:] = analysis.sources
+            render_window()
+        try:
+            analysis.run()
+            # Vidéos déjà archivées : le point de synchronisation avance même si rien n'est lancé
+            save_sync_state()
+            if auto_start and engine.state == DownloadState.IDLE:
+                start_download_sequence(None)
+
+            if metadata_cache:
+                cache_stats_text.value = tr("cache_stats", metadata_cache.hits, metadata_cache.misses)
+            source = analysis.sources[0]
+            if len(analysis.sources) > 1:
+                list_info_text.value = tr("sources_found", len(video_entries), len(analysis.sources), analysis.duplicates)
+            elif source.state == AnalysisSource.FAILED:
+                if classify_error(source.error) in (ErrorClass.PRIVATE, ErrorClass.AGE):
+                    list_info_text.value = tr("error_private")
+                else:
+                    list_info_text.value = tr("error", source.error)
+            elif source.synced:
+                list_info_text.value = tr("sync_found", len(video_entries))
+            else:
+                list_info_text.value = tr("from_cache" if source.cached else "videos_found", len(video_entries))
+        except Exception as e:
+            list_info_text.value = tr("error", str(e))
+        finally:
+            analysis_running = False
+
+        if engine.state == DownloadState.IDLE:
+            analyze_btn.disabled = False
+            url_input.disabled = False
+            url_file_btn.disabled = False
+            start_download_btn.disabled = not video_entries
+        page.update()
+        # Le lot a pu se vider pendant que la pagination continuait
+        engine.end_of_input()
+
+    def show_analysis_progress():
+        analysis = current_analysis
+        if analysis is not None and len(analysis.sources) > 1:
+            finished = sum(s.state in (AnalysisSource.DONE, AnalysisSource.FAILED) for s in analysis.sources)
+            list_info_text.value = tr("analyzing_sources", finished, len(analysis.sources), len(video_entries))
+        else:
+            list_info_text.value = tr("analyzing_count", len(video_entries))
+
+    def update_source(source):
+        # Avancement d'une source : son en-tête (s'il est affiché) et le compteur global
+        with batch_lock:
+            render_window()
+            show_analysis_progress()
+        page.update()
+
+    def flush_analyze_batch(batch):
+        if not batch: return
+        add_entries(batch)
+        show_analysis_progress()
+        if engine.state == DownloadState.IDLE:
+            start_download_btn.disabled = False
+        page.update()
+
+    def append_to_batch(entries):
+        # Appelé sous batch_lock : les nouvelles entrées cochées rejoignent le lot en cours
+        jobs = []
+        for entry in entries:
+            if selection.is_selected(entry.index) and not skip_if_archived(entry, batch_options) and not exceeds_disk_space(entry, batch_options):
+                jobs.append(DownloadJob(entry, len(engine.jobs) + len(jobs), batch_options))
+        show_skipped_info()
+        engine.add(jobs)
+
+    def toggle_select_all(e):
+        # O(1) sur le modèle, puis seules les lignes visibles sont redessinées
+        selection.select_all(select_all_checkbox.value)
+        for header in header_rows.values():
+            header.value = select_all_checkbox.value
+        render_window()
+        page.update()
+
+    def build_job_row(job):
+        # --- Ligne de progression individuelle (titre, barre, vitesse, boutons) ---
+        job.title_text = ft.Text(job.title, size=11, no_wrap=True, overflow="ellipsis", expand=True)
+        job.progress_bar = ft.ProgressBar(value=0, color="blue", bgcolor="grey")
+        job.status_text = ft.Text(tr("queued"), size=10, color="grey")
+        job.btn_pause = ft.IconButton(icon="pause", icon_size=16, icon_color="orange", tooltip="Pause", on_click=lambda e: engine.pause_job(job))
+        job.btn_resume = ft.IconButton(icon="play_arrow", icon_size=16, icon_color="green", tooltip="Resume", visible=False, on_click=lambda e: engine.resume_job(job))
+        job.btn_cancel = ft.IconButton(icon="close", icon_size=16, icon_color="red", tooltip="Stop", on_click=lambda e: engine.cancel_job(job))
+        job.row = ft.Container(
+            content=ft.Column([
+                ft.Row([job.title_text, job.btn_pause, job.btn_resume, job.btn_cancel], spacing=0),
+                job.progress_bar,
+                job.status_text
+            ], spacing=2),
+            padding=5,
+            bgcolor="#2a2a2a",
+            border_radius=5
+        )
+        return job.row
+
+    def set_if_changed(control, attr, value, changed):
+        if getattr(control, attr) != value:
+            setattr(control, attr, value)
+            changed.append(control)
+
+    def update_batch_status():
+        # Renvoie les contrôles modifiés pour que la pompe ne pousse que ceux-là
+        from yt_dlp.utils import format_bytes
+        changed = []
+        done = engine.finished
+        total = len(engine.jobs)
+        set_if_changed(progress_bar, "value", done / total if total else 0, changed)
+        set_if_changed(eta_text, "value", tr("batch_progress", done, total), changed)
+        if engine.state == DownloadState.RUNNING and current_video_label.color == "white":
+            set_if_changed(current_video_label, "value", tr("processing", min(done + 1, total), total), changed)
+        total_speed = sum(job.speed for job in engine.active_jobs())
+        speed_str = format_bytes(total_speed) + "/s" if total_speed else "-"
+        # Limite de débit en vigueur (elle peut changer en cours de lot selon la plage horaire)
+        rate_limit = engine.limiter.current_rate() if engine.limiter else None
+        if rate_limit:
+            speed_str = tr("speed_limited", speed_str, format_bytes(rate_limit) + "/s")
+        elif total_speed:
+            speed_str = tr("speed_total", speed_str)
+        set_if_changed(speed_text, "value", speed_str, changed)
+        # Deuxième étage du pipeline, suivi séparément des téléchargements
+        stage = engine.stage
+        converting = stage.active + stage.waiting
+        set_if_changed(stage_text, "value", tr("stage_status", stage.active, stage.waiting) if converting else "", changed)
+        return changed
+
+    def apply_progress(batch):
+        # Exécuté par la pompe du ProgressBus (un seul thread, ~10 fois par seconde)
+        from yt_dlp.utils import format_bytes, formatSeconds
+        changed = []
+        for job, (downloaded, total, speed, eta, percent_str) in batch.items():
+            if job.state != DownloadState.RUNNING: continue
+            if total:
+                ratio = downloaded / total
+                percent_str = f"{int(ratio * 100)}%"
+            else:
+                p = ANSI_ESCAPE.sub('', percent_str or '0%').replace('%', '').strip()
+                try:
+                    ratio = float(p) / 100
+                    percent_str = f"{p}%"
+                except ValueError:
+                    ratio = job.progress_bar.value
+            job.speed = speed or 0
+            speed_str = format_bytes(speed) + "/s" if speed else "-"
+            eta_str = formatSeconds(eta) if eta is not None else "-"
+            set_if_changed(job.progress_bar, "value", ratio, changed)
+            set_if_changed(job.status_text, "value", f"{percent_str} - {speed_str} - ETA {eta_str}", changed)
+        changed.extend(update_batch_status())
+        if changed:
+            page.update(*changed)
+
+    def set_job_label(job, symbol):
+        job.entry.status = symbol
+        refresh_entry(job.entry)
+
+    def skip_if_archived(entry, options):
+        # Une vidéo déjà récupérée dans ce profil est marquée comme faite sans créer de job
+        nonlocal archived_skipped
+        if not engine.is_archived(entry, options):
+            return False
+        archived_skipped += 1
+        entry.status = "✔️"
+        selection.set(entry.index, False)
+        return True
+
+    def exceeds_disk_space(entry, options):
+        # La vidéo reste cochée : elle pourra être relancée une fois de la place libérée
+        if disk_budget is None or disk_budget.admit(entry, options):
+            return False
+        entry.status = "💾"
+        return True
+
+    def show_skipped_info():
+        from yt_dlp.utils import format_bytes
+        if disk_budget is not None and disk_budget.refused:
+            list_info_text.value = tr("no_space", disk_budget.refused, format_bytes(disk_budget.free))
+        elif archived_skipped:
+            list_info_text.value = tr("archived_skipped", archived_skipped)
+
+    # --- Rappels du moteur (appelés depuis ses threads, jamais sous batch_lock) ---
+    def on_job_started(job):
+        # --- MISE A JOUR UI : EN COURS (⏩) ---
+        set_job_label(job, "⏩")
+        if job.row is None:
+            build_job_row(job)
+        job.progress_bar.value = 0
+        job.status_text.value = tr("processing", job.index + 1, len(engine.jobs))
+        job.status_text.color = "grey"
+        job.btn_pause.visible = True
+        job.btn_resume.visible = False
+        if job.row not in jobs_list_view.controls:
+            jobs_list_view.controls.append(job.row)
+        page.update()
+
+    def on_job_progress(job, d):
+        # Aucun accès à l'UI ici : on publie les valeurs brutes, la pompe formate et affiche
+        progress_bus.publish(job, (
+            d.get('downloaded_bytes', 0),
+            d.get('total_bytes') or d.get('total_bytes_estimate'),
+            d.get('speed'),
+            d.get('eta'),
+            d.get('_percent_str'),
+        ))
+
+    def on_job_paused(job):
+        set_job_label(job, "⏸️")
+        if job.row is not None:
+            job.btn_pause.visible = False
+            job.btn_resume.visible = True
+            job.status_text.value = tr("pause_state")
+            job.status_text.color = "orange"
+        page.update()
+
+    def on_job_resumed(job):
+        set_job_label(job, "⏩" if job.state == DownloadState.RUNNING else None)
+        if job.row is not None:
+            job.btn_pause.visible = True
+            job.btn_resume.visible = False
+            job.status_text.color = "grey"
+            if job.state == DownloadState.QUEUED:
+                job.status_text.value = tr("queued")
+        page.update()
+
+    def on_job_converting(job, started):
+        # --- TÉLÉCHARGÉ : PASSAGE À L'ÉTAPE DE CONVERSION ---
+        if started:
+            job.status_text.value = tr("converting")
+        else:
+            job.progress_bar.value = None
+            job.status_text.value = tr("convert_waiting")
+            job.btn_pause.visible = False
+        update_batch_status()
+        page.update()
+
+    def on_job_retrying(job, delay):
+        # --- ERREUR TRANSITOIRE : LE JOB REVIENDRA DANS LA FILE APRÈS L'ATTENTE (🔁) ---
+        set_job_label(job, "🔁")
+        if job.row is not None:
+            job.progress_bar.value = 0
+            job.status_text.value = tr("retrying", round(delay), job.attempts)
+            job.status_text.color = "orange"
+        update_batch_status()
+        page.update()
+
+    def on_job_finished(job):
+        # On décoche pour dire "traité"
+        selection.set(job.entry.index, False)
+        if job.state == DownloadState.DONE:
+            # --- SUCCÈS : MISE A JOUR UI LISTE (✔️) ---
+            set_job_label(job, "✔️")
+        elif job.state == DownloadState.FAILED:
+            # --- ÉCHEC : MISE A JOUR UI LISTE (❌) ---
+            error_msg = job.error or tr("skipped")
+            if job.error_class in (ErrorClass.PRIVATE, ErrorClass.AGE):
+                current_video_label.value = f"{tr('error_private')} {tr('skipped')}"
+            else:
+                current_video_label.value = tr("error", error_msg)
+            current_video_label.color = "red"
+            set_job_label(job, "❌")
+        else:
+            set_job_label(job, None)
+        if job.row in jobs_list_view.controls:
+            jobs_list_view.controls.remove(job.row)
+        update_batch_status()
+        page.update()
+
+    def save_sync_state():
+        # Le point de synchronisation n'avance que sur les vidéos téléchargées ou déjà archivées
+        analysis = current_analysis
+        if analysis is None or analysis.sync is None: return
+        settled = {video_entry_key(job.entry) for job in engine.jobs if job.state == DownloadState.DONE}
+        options = read_options()
+        settled.update(video_entry_key(entry) for entry in list(video_entries) if engine.is_archived(entry, options))
+        analysis.save_sync(settled.__contains__)
+
+    def on_batch_finished(outcome):
+        save_sync_state()
+        if outcome == DownloadState.DONE:
+            current_video_label.value = tr("finished")
+            current_video_label.color = "green"
+            play_finish_sound()
+        reset_ui_after_download()
+
+    engine.listener = EngineListener(
+        on_job_started=on_job_started,
+        on_job_progress=on_job_progress,
+        on_job_paused=on_job_paused,
+        on_job_resumed=on_job_resumed,
+        on_job_converting=on_job_converting,
+        on_job_retrying=on_job_retrying,
+        on_job_finished=on_job_finished,
+        on_batch_finished=on_batch_finished,
+    )
+
+    # --- Contrôles globaux (tout le pool) ---
+    def pause_download(e):
+        engine.pause()
+        show_state(DownloadState.PAUSED)
+
+    def read_options():
+        return {
+            "format": format_dropdown.value,
+            "resolution": resolution_dropdown.value.replace("p", ""),
+            "compatibility": compatibility_checkbox.value,
+        }
+
+    def start_download_sequence(e):
+        with batch_lock:
+            begin_batch()
+
+    def begin_batch(jobs=None):
+        nonlocal batch_options, archived_skipped, disk_budget
+        batch_options = read_options()
+        archived_skipped = 0
+        # Vérification de l'espace libre avant tout téléchargement (les jobs repris du journal
+        # sont déjà en partie sur le disque : ils ne sont pas comptés)
+        disk_budget = DiskBudget(engine.out_dir)
+        if jobs is None:
+            jobs = []
+            # list() : skip_if_archived modifie la sélection pendant le parcours
+            for index in list(selection.iter_selected()):
+                entry = video_entries[index]
+                if skip_if_archived(entry, batch_options) or exceeds_disk_space(entry, batch_options): continue
+                jobs.append(DownloadJob(entry, len(jobs), batch_options))
+
+        if archived_skipped or disk_budget.refused:
+            render_window()
+            show_skipped_info()
+        if not jobs:
+            # Tout était déjà archivé : aucun lot ne se terminera, le point de synchronisation avance ici
+            save_sync_state()
+            page.update()
+            return
+
+        engine.ffmpeg_path = find_ffmpeg()
+        jobs_list_view.controls.clear()
+        progress_bus.start()
+
+        show_state(DownloadState.RUNNING)
+        
+        start_download_btn.disabled = True 
+        open_folder_btn.visible = False 
+        
+        resolution_dropdown.disabled = True 
+        format_dropdown.disabled = True 
+        compatibility_checkbox.disabled = True 
+        controls_row.visible = True
+        analyze_btn.disabled = True
+        url_input.disabled = True
+        url_file_btn.disabled = True
+        videos_list_view.disabled = True 
+        select_all_checkbox.disabled = True
+        
+        # Tant que l'analyse tourne, le lot reste ouvert aux nouvelles entrées
+        engine.start(jobs, more_coming=analysis_running)
+        update_batch_status()
+        page.update()
+
+    def resume_download(e):
+        show_state(DownloadState.RUNNING)
+        update_batch_status()
+        page.update()
+        engine.resume()
+
+    def reset_ui_after_download():
+        progress_bus.stop()
+        controls_row.visible = False
+        
+        start_download_btn.visible = True 
+        start_download_btn.disabled = False 
+        open_folder_btn.visible = True 
+        
+        resolution_dropdown.disabled = False 
+        format_dropdown.disabled = False 
+        compatibility_checkbox.disabled = False 
+        analyze_btn.disabled = analysis_running
+        url_input.disabled = analysis_running
+        url_file_btn.disabled = analysis_running
+        videos_list_view.disabled = False
+        select_all_checkbox.disabled = False
+        jobs_list_view.controls.clear()
+        progress_bar.value = 0
+        speed_text.value = "-"
+        eta_text.value = "-"
+        page.update()
+
+    def resume_from_journal():
+        # Reprend les jobs laissés en suspens par une fermeture ou un crash, sans ré-analyser
+        with batch_lock:
+            jobs = engine.resume_jobs(len(video_entries))
+            if not jobs: return
+            video_entries.extend(job.entry for job in jobs)
+            selection.append(len(jobs), True)
+
+            # Les réglages du lot repris redeviennent ceux de l'interface
+            options = jobs[0].options
+            format_dropdown.value = options["format"]
+            resolution_dropdown.value = f"{options['resolution']}p"
+            compatibility_checkbox.value = options["compatibility"]
+            on_format_change(None)
+
+            partial = [job for job in jobs if job.part_path and os.path.exists(job.part_path)]
+            list_info_text.value = tr("journal_resumed", len(jobs), len(partial))
+            main_content.visible = True
+            render_window()
+            begin_batch(jobs)
+
+    # --- Assemblage final ---
+    page.overlay.append(url_file_picker)
+    page.add(
+        ft.Column([
+            ft.Row([ft.Icon("video_library", size=40, color="red"), title_text], alignment="center"),
+            ft.Divider(color="transparent", height=10),
+            search_area,
+            ft.Divider(),
+            main_content 
+        ], expand=True)
+    )
+    # yt-dlp et ffmpeg se chargent en arrière-plan, une fois la fenêtre affichée
+    warm_up()
+    if os.environ.get("YDP_STARTUP_TRACE"):
+        # Repère lu par benchmark_startup.py --launch
+        print(f"YDP_FIRST_PAINT {time.time():.6f}", flush=True)
+    resume_from_journal()
+
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,272 @@
+import os
+import sys
+import time
+import json
+import re
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import multiprocessing
+import http.server
+import socketserver
+from xml.sax.saxutils import escape
+
+import yt_dlp
+from downloader_engine import DownloadEngine, EngineListener, DownloadJob, DownloadState, iter_entries, entry_from_info, find_ffmpeg
+
+# --- Banc d'essai du moteur de téléchargement ---
+# Un serveur HTTP local (processus séparé, pour ne pas fausser le temps CPU) sert des fichiers
+# synthétiques, en liens directs ou via un flux RSS que l'extracteur générique de yt-dlp
+# traite comme une playlist. Le moteur les télécharge comme un vrai lot, et le résultat
+# (vidéos/s, Mo/s, surcoût par vidéo, temps CPU) est enregistré en JSON pour comparer deux versions.
+#
+#   python benchmark_engine.py --count 20 --size 4M --workers 4 --rate 8M --latency 0.05 --save resultats.json
+#   python benchmark_engine.py ... --compare resultats.json
+
+MEDIA_TYPES = {"m4a": "audio/mp4", "mp4": "video/mp4"}
+
+# --- Serveur de médias ---
+class MediaHandler(http.server.BaseHTTPRequestHandler):
+    media_dir = None
+    rate = None      # Octets/s par connexion (None : illimité)
+    latency = 0.0    # Délai avant chaque réponse, en secondes
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        time.sleep(self.latency)
+        path = os.path.join(self.media_dir, os.path.basename(self.path.split("?")[0]))
+        if not os.path.isfile(path):
+            self.send_response(404)
+            self.end_headers()
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            if match.group(2): end = min(int(match.group(2)), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        ext = path.rsplit(".", 1)[-1]
+        self.send_header("Content-Type", MEDIA_TYPES.get(ext, "application/rss+xml"))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head: return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            sent_at = time.monotonic()
+            try:
+                while remaining > 0:
+                    chunk = f.read(min(65536, remaining))
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+                    if self.rate:
+                        # Mise en forme du débit : on ne prend pas d'avance sur le rythme prévu
+                        sent_at += len(chunk) / self.rate
+                        delay = sent_at - time.monotonic()
+                        if delay > 0: time.sleep(delay)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+class MediaServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+def serve_media(media_dir, rate, latency, port_queue):
+    handler = type("Handler", (MediaHandler,), {"media_dir": media_dir, "rate": rate, "latency": latency})
+    server = MediaServer(("127.0.0.1", 0), handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+# --- Médias synthétiques ---
+def make_media(media_dir, count, size, ext, ffmpeg_path=None):
+    # Octets aléatoires (aucune conversion à faire) ou vrai flux AAC si le format exige ffmpeg
+    names = []
+    for i in range(count):
+        name = f"bench{i:04d}.{ext}"
+        path = os.path.join(media_dir, name)
+        if ffmpeg_path:
+            duration = max(1, size * 8 // 128000)
+            subprocess.run(
+                [ffmpeg_path, "-v", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency={440 + i}:duration={duration}", "-c:a", "aac", "-b:a", "128k", path],
+                check=True
+            )
+        else:
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+        names.append(name)
+    return names
+
+def write_feed(media_dir, names, base_url):
+    # Flux RSS : l'extracteur générique le présente comme une playlist d'entrées "url"
+    items = "".join(
+        f"<item><title>{escape(name)}</title><link>{base_url}/{name}</link>"
+        f"<enclosure url=\"{base_url}/{name}\" type=\"{MEDIA_TYPES[name.rsplit('.', 1)[-1]]}\"/></item>"
+        for name in names
+    )
+    with open(os.path.join(media_dir, "feed.xml"), "w", encoding="utf-8") as f:
+        f.write(f"<?xml version=\"1.0\"?><rss version=\"2.0\"><channel><title>bench</title>{items}</channel></rss>")
+    return f"{base_url}/feed.xml"
+
+# --- Mesure ---
+class JobTimer:
+    # Horodatage des étapes de chaque job, à partir des rappels du moteur
+    def __init__(self):
+        self.started = {}
+        self.first_byte = {}
+        self.last_byte = {}
+        self.finished = {}
+        self.bytes = {}
+
+    def on_job_started(self, job):
+        self.started[job] = time.perf_counter()
+
+    def on_job_progress(self, job, d):
+        now = time.perf_counter()
+        self.first_byte.setdefault(job, now)
+        self.last_byte[job] = now
+        self.bytes[job] = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+
+    def on_job_finished(self, job):
+        self.finished[job] = time.perf_counter()
+
+    def overheads(self):
+        # Temps passé hors transfert : extraction, ouverture de la connexion, finalisation
+        return [
+            (self.first_byte[job] - self.started[job]) + (self.finished[job] - self.last_byte[job])
+            for job in self.finished if job in self.first_byte and job in self.started
+        ]
+
+def run_once(urls, args, ffmpeg_path, out_dir):
+    timer = JobTimer()
+    listener = EngineListener(on_job_started=timer.on_job_started, on_job_progress=timer.on_job_progress, on_job_finished=timer.on_job_finished)
+    engine = DownloadEngine(out_dir, args.workers, listener=listener, ffmpeg_path=ffmpeg_path, ydl_params={"quiet": True, "noprogress": True})
+    options = {"format": args.format, "resolution": None, "compatibility": False}
+
+    cpu_before = os.times()
+    t0 = time.perf_counter()
+    engine.start([], more_coming=True)
+    index = 0
+    for url in urls:
+        jobs = []
+        for vid in iter_entries(engine.pool, url):
+            jobs.append(DownloadJob(entry_from_info(index, vid), index, options))
+            index += 1
+        engine.add(jobs)
+    analysis = time.perf_counter() - t0
+    engine.end_of_input()
+    engine.wait()
+    elapsed = time.perf_counter() - t0
+    cpu_after = os.times()
+    engine.pool.close()
+
+    done = sum(1 for job in engine.jobs if job.state == DownloadState.DONE)
+    total_bytes = sum(timer.bytes.values())
+    overheads = timer.overheads()
+    return {
+        "items": len(engine.jobs),
+        "done": done,
+        "elapsed_s": round(elapsed, 3),
+        "analysis_s": round(analysis, 3),
+        "items_per_s": round(done / elapsed, 3) if elapsed else None,
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 3) if elapsed else None,
+        "overhead_per_item_s": round(statistics.mean(overheads), 4) if overheads else None,
+        "cpu_s": round((cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system), 3),
+        "cpu_children_s": round((cpu_after.children_user - cpu_before.children_user) + (cpu_after.children_system - cpu_before.children_system), 3),
+    }
+
+def summarize(runs):
+    keys = [key for key, value in runs[0].items() if isinstance(value, (int, float))]
+    return {key: round(statistics.median(run[key] for run in runs if run[key] is not None), 4) for key in keys if any(run[key] is not None for run in runs)}
+
+def compare(summary, path):
+    with open(path, "r", encoding="utf-8") as f:
+        previous = json.load(f)["summary"]
+    print(f"Comparaison avec {path} :", file=sys.stderr)
+    for key in ("items_per_s", "mb_per_s", "overhead_per_item_s", "cpu_s", "elapsed_s"):
+        if summary.get(key) and previous.get(key):
+            print(f"  {key:22} {previous[key]:>10} -> {summary[key]:<10} ({summary[key] / previous[key] - 1:+.1%})", file=sys.stderr)
+
+def parse_size(value):
+    size = yt_dlp.utils.parse_bytes(value)
+    if not size:
+        raise argparse.ArgumentTypeError(f"taille invalide : {value}")
+    return int(size)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai du moteur de téléchargement (serveur local, médias synthétiques).")
+    parser.add_argument("--count", type=int, default=10, help="nombre de fichiers (défaut : 10)")
+    parser.add_argument("--size", type=parse_size, default=parse_size("2M"), help="taille de chaque fichier (défaut : 2M)")
+    parser.add_argument("--workers", type=int, default=3, help="téléchargements simultanés (défaut : 3)")
+    parser.add_argument("--format", type=str.upper, choices=["AUDIO", "MP4", "M4A", "MP3"], default="AUDIO", help="M4A et MP3 génèrent de vrais fichiers AAC et passent par ffmpeg (copie du flux ou réencodage)")
+    parser.add_argument("--rate", type=parse_size, help="débit du serveur par connexion (ex : 8M ; défaut : illimité)")
+    parser.add_argument("--latency", type=float, default=0.0, help="délai du serveur avant chaque réponse, en secondes")
+    parser.add_argument("--playlist", action="store_true", help="une seule URL (flux RSS) au lieu d'une URL par fichier")
+    parser.add_argument("--runs", type=int, default=3, help="nombre de passes, le résumé en prend la médiane (défaut : 3)")
+    parser.add_argument("--save", metavar="FICHIER", help="enregistre la configuration et les résultats en JSON")
+    parser.add_argument("--compare", metavar="FICHIER", help="compare le résumé à un résultat enregistré")
+    args = parser.parse_args(argv)
+    if args.count < 1 or args.workers < 1 or args.runs < 1:
+        parser.error("--count, --workers et --runs doivent être supérieurs ou égaux à 1")
+
+    ffmpeg_path = find_ffmpeg()
+    if args.format in ("M4A", "MP3") and not ffmpeg_path:
+        parser.error(f"ffmpeg est nécessaire pour le format {args.format}")
+
+    work_dir = tempfile.mkdtemp(prefix="ydp-bench-")
+    media_dir = os.path.join(work_dir, "media")
+    os.makedirs(media_dir)
+    ext = "mp4" if args.format == "MP4" else "m4a"
+    names = make_media(media_dir, args.count, args.size, ext, ffmpeg_path if args.format in ("M4A", "MP3") else None)
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_media, args=(media_dir, args.rate, args.latency, port_queue), daemon=True)
+    server.start()
+    runs = []
+    try:
+        base_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+        urls = [write_feed(media_dir, names, base_url)] if args.playlist else [f"{base_url}/{name}" for name in names]
+        for i in range(args.runs):
+            out_dir = os.path.join(work_dir, f"run{i}")
+            result = run_once(urls, args, ffmpeg_path, out_dir)
+            print(json.dumps(result), file=sys.stderr)
+            runs.append(result)
+            shutil.rmtree(out_dir, ignore_errors=True)
+    finally:
+        server.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "yt_dlp": yt_dlp.version.__version__,
+        },
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+    print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(report["summary"], args.compare)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    # Code 1 si des téléchargements ont échoué : le résultat n'est pas comparable
+    return 0 if all(run["done"] == run["items"] == args.count for run in runs) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
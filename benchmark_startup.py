@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+import subprocess
+
+# --- Mesure du démarrage de l'interface ---
+# Chaque passe importe l'application dans un interpréteur neuf (sans ouvrir de fenêtre) et
+# vérifie que les modules lourds ne sont pas chargés à l'import : ils doivent l'être en tâche
+# de fond, une fois la fenêtre affichée. Avec --launch, l'application est réellement lancée
+# et le délai jusqu'au premier affichage est mesuré (écran requis).
+# Code 1 si le budget est dépassé : à lancer avant de fusionner une modification du démarrage.
+#
+#   python benchmark_startup.py --runs 5 --budget 0.5
+#   python benchmark_startup.py --launch --paint-budget 1.5
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "YouTube-Downloader-Pro.py")
+# Ces modules ne doivent pas être importés avant le premier affichage
+DEFERRED_MODULES = ("yt_dlp", "imageio_ffmpeg")
+
+# Exécuté dans l'interpréteur neuf : importe l'application sans appeler main()
+IMPORT_PROBE = """
+import os, sys, time, json, importlib.util
+sys.path.insert(0, os.path.dirname(sys.argv[1]))
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location("ydp_app", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - t0
+print(json.dumps({"import_s": elapsed, "loaded": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+def measure_import():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_PROBE, APP_FILE, *DEFERRED_MODULES],
+        capture_output=True, text=True
+    )
+    if result.returncode:
+        # Dernière ligne de la trace (ex : dépendance manquante)
+        raise RuntimeError(f"import de l'application impossible : {result.stderr.strip().splitlines()[-1]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["slowest"] = slowest_imports(result.stderr)
+    return report
+
+def slowest_imports(importtime_log, count=8):
+    # Lignes "import time: self [us] | cumulative | package" de -X importtime
+    modules = []
+    for line in importtime_log.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit(): continue
+        # Les sous-modules sont indentés sous leur parent, dont le cumul les compte déjà
+        name = parts[2][1:]
+        if not name.startswith(" "):
+            modules.append((int(parts[1]), name.strip()))
+    return [{"module": name, "cumulative_s": round(cumulative / 1e6, 4)} for cumulative, name in sorted(modules, reverse=True)[:count]]
+
+def measure_first_paint(timeout):
+    # L'application affiche "YDP_FIRST_PAINT <horodatage>" juste après son premier page.add()
+    env = dict(os.environ, YDP_STARTUP_TRACE="1")
+    launched = time.time()
+    process = subprocess.Popen([sys.executable, APP_FILE], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+    try:
+        deadline = time.monotonic() + timeout
+        for line in process.stdout:
+            if line.startswith("YDP_FIRST_PAINT"):
+                return float(line.split()[1]) - launched
+            if time.monotonic() > deadline: break
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure du temps de démarrage de l'interface, avec budget.")
+    parser.add_argument("--runs", type=int, default=5, help="nombre de passes, la médiane est comparée au budget (défaut : 5)")
+    parser.add_argument("--budget", type=float, default=0.5, help="durée maximale de l'import de l'application, en secondes (défaut : 0.5)")
+    parser.add_argument("--launch", action="store_true", help="lance aussi l'application et mesure le premier affichage (écran requis)")
+    parser.add_argument("--paint-budget", type=float, default=1.5, help="délai maximal jusqu'au premier affichage, en secondes (défaut : 1.5)")
+    parser.add_argument("--timeout", type=float, default=30, help="attente maximale de la fenêtre avec --launch (défaut : 30)")
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs doit être supérieur ou égal à 1")
+
+    try:
+        runs = [measure_import() for _ in range(args.runs)]
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    import_s = statistics.median(run["import_s"] for run in runs)
+    eager = sorted({name for run in runs for name in run["loaded"]})
+    report = {
+        "import_s": round(import_s, 4),
+        "import_runs_s": [round(run["import_s"], 4) for run in runs],
+        "budget_s": args.budget,
+        "eager_imports": eager,
+        "slowest_imports": runs[-1]["slowest"],
+    }
+    failures = []
+    if import_s > args.budget:
+        failures.append(f"import en {import_s:.3f} s (budget {args.budget} s)")
+    if eager:
+        failures.append(f"modules chargés à l'import : {', '.join(eager)}")
+
+    if args.launch:
+        paints = [measure_first_paint(args.timeout) for _ in range(args.runs)]
+        if None in paints:
+            failures.append(f"pas de premier affichage en {args.timeout} s")
+        else:
+            first_paint = statistics.median(paints)
+            report["first_paint_s"] = round(first_paint, 4)
+            report["paint_budget_s"] = args.paint_budget
+            if first_paint > args.paint_budget:
+                failures.append(f"premier affichage en {first_paint:.3f} s (budget {args.paint_budget} s)")
+
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f"Régression du démarrage : {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2743 @@
+import os
+import sys
+import threading
+import time
+import random
+import json
+import re
+import contextlib
+import io
+import errno
+import sqlite3
+import urllib.parse
+import queue
+import shutil
+import tempfile
+import subprocess
+import argparse
+from collections import deque
+
+# --- Moteur de téléchargement (sans interface) ---
+# Analyse, file de téléchargement, post-traitement, journal et archive. Les interfaces Flet
+# (bureau, Android) et le mode ligne de commande en sont de simples clients.
+
+# --- Configuration Globale ---
+class DownloadState:
+    RUNNING = "running"
+    PAUSED = "paused"
+    CANCELLED = "cancelled"
+    IDLE = "idle"
+    # États propres à chaque élément de la file
+    QUEUED = "queued"
+    CONVERTING = "converting"
+    DONE = "done"
+    FAILED = "failed"
+
+FINAL_STATES = (DownloadState.DONE, DownloadState.FAILED, DownloadState.CANCELLED)
+
+# --- Fichier de configuration (préférences persistantes) ---
+APP_DATA_DIR = os.path.join(os.path.expanduser('~'), '.youtube-downloader-pro')
+CONFIG_FILE = os.path.join(APP_DATA_DIR, 'config.json')
+
+def load_config(defaults, max_workers):
+    config = dict(defaults)
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Erreur lecture config ({e}), valeurs par défaut.", file=sys.stderr)
+    config["workers"] = max(1, min(max_workers, int(config.get("workers") or 1)))
+    config["connections"] = max(1, min(MAX_CONNECTIONS, int(config.get("connections") or DEFAULT_CONNECTIONS)))
+    return config
+
+def save_config(config):
+    try:
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+    except Exception as e:
+        print(f"Erreur sauvegarde config: {e}", file=sys.stderr)
+
+ANSI_ESCAPE = re.compile(r'\x1b[^m]*m')
+
+# --- Bus d'événements de progression ---
+# Les hooks yt-dlp sont appelés des dizaines de fois par seconde et par téléchargement.
+# Les workers se contentent de publier le dernier état connu (un dict écrasé à chaque
+# appel, donc coalescé) et un seul thread "pompe" l'applique à l'UI à fréquence fixe.
+class ProgressBus:
+    def __init__(self, apply, fps=10):
+        self.apply = apply
+        self.interval = 1.0 / fps
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, key, record):
+        with self._lock:
+            self._pending[key] = record
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if batch:
+            try:
+                self.apply(batch)
+            except Exception as e:
+                print(f"Erreur mise à jour progression: {e}", file=sys.stderr)
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._pending.clear()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+# --- Classe YoutubeDL du moteur ---
+class StagedPostProcessing:
+    # Mélangé à yt_dlp.YoutubeDL par ydl_class(). Quand 'deferred' est une liste, post_process()
+    # (conversion MP3, fusion MP4) n'est pas exécuté : il y est mis de côté pour l'étape de
+    # post-traitement, et le worker réseau peut passer à la vidéo suivante.
+    deferred = None
+    last_error = None
+
+    def post_process(self, filename, info, files_to_move=None):
+        # Rien à convertir ni à fusionner : le simple déplacement du fichier se fait sur place
+        if self.deferred is None or not (info.get('__postprocessors') or self._pps['post_process']):
+            return super().post_process(filename, info, files_to_move)
+        info['filepath'] = filename
+        self.deferred.append((filename, dict(info), files_to_move))
+        return info
+
+    def report_error(self, message, *args, **kwargs):
+        # Avec 'ignoreerrors', l'erreur n'est pas levée : on la garde pour le résultat du job
+        self.last_error = str(message)
+        return super().report_error(message, *args, **kwargs)
+
+    def dl(self, name, info, subtitle=False, test=False):
+        # Fichier http(s) d'un seul tenant : téléchargé en plages parallèles (RangedDownload).
+        # Les fragments DASH/HLS passent par yt-dlp (concurrent_fragment_downloads).
+        from yt_dlp.utils import determine_protocol
+        if (subtitle or test or name == '-' or not info.get('url') or self.params.get('external_downloader')
+                or determine_protocol(info) not in ('http', 'https')):
+            return super().dl(name, info, subtitle, test)
+        fd = _ranged_fd_class(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
+
+    def process_info(self, info_dict):
+        # Fusion en flux (RangedDownload.stream_merge) : le fichier final existe déjà quand yt-dlp
+        # le cherche, il saute alors le téléchargement des pistes et leur fusion
+        if self.params.get('ydp_stream_merge') and info_dict.get('requested_formats') and not self.params.get('skip_download'):
+            try:
+                self._stream_merge(info_dict)
+            except Exception as e:
+                if str(e) == "CANCELLED": raise
+                self.report_error(f'unable to download video data: {e}')
+                return
+        return super().process_info(info_dict)
+
+    def _stream_merge(self, info_dict):
+        filename = self.prepare_filename(info_dict, 'temp')
+        if not filename or filename == '-' or os.path.exists(filename):
+            return False
+        base = os.path.splitext(filename)[0]
+        formats = []
+        for fmt in info_dict['requested_formats']:
+            # Une fusion par fichiers déjà commencée (pistes .fNNN) est reprise par yt-dlp
+            track = f"{base}.f{fmt['format_id']}.{fmt['ext']}"
+            if os.path.exists(track) or os.path.exists(track + '.part'):
+                return False
+            new_info = dict(info_dict)
+            del new_info['requested_formats']
+            new_info.update(fmt)
+            if new_info.get('http_headers') is None:
+                new_info['http_headers'] = self._calc_headers(new_info)
+            formats.append(new_info)
+        if not self._ensure_dir_exists(filename):
+            return False
+        fd = _ranged_fd_class(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        return fd.stream_merge(filename, info_dict, formats)
+
+# yt-dlp coûte quelques centaines de ms à l'import : il n'est chargé qu'à la création du premier
+# YoutubeDL (ou par warm_up(), en tâche de fond), pas à l'import du moteur
+_ydl_class = None
+_ranged_fd_class = None
+
+def ydl_class():
+    global _ydl_class, _ranged_fd_class
+    if _ydl_class is None:
+        import yt_dlp
+        from yt_dlp.downloader.http import HttpFD
+        _ranged_fd_class = type("RangedHttpFD", (RangedDownload, HttpFD), {})
+        _ydl_class = type("StagedYoutubeDL", (StagedPostProcessing, yt_dlp.YoutubeDL), {})
+    return _ydl_class
+
+def warm_up():
+    # Appelé une fois la fenêtre affichée : la première analyse trouve yt-dlp et ffmpeg déjà prêts
+    def run():
+        try:
+            ydl_class()
+            ffmpeg_capabilities(find_ffmpeg())
+        except Exception as e:
+            print(f"Erreur préchargement: {e}", file=sys.stderr)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+# --- Pool d'instances YoutubeDL ---
+# Recréer un YoutubeDL par vidéo coûte cher : nouveau cookie jar, extracteurs réinitialisés,
+# nouvelles poignées de main TLS. On garde donc des instances longue durée par profil
+# d'options (MP4, MP3, mode compatibilité...). Une instance n'est prêtée qu'à un seul
+# worker à la fois (YoutubeDL n'est pas thread-safe) et conserve ses connexions keep-alive
+# d'un élément de la file à l'autre.
+class PooledYoutubeDL:
+    def __init__(self, opts):
+        self.hook = None
+        self.pp_hook = None
+        self.ydl = ydl_class()(dict(opts, progress_hooks=[self._dispatch], postprocessor_hooks=[self._dispatch_pp]))
+
+    def _dispatch(self, d):
+        if self.hook: self.hook(d)
+
+    def _dispatch_pp(self, d):
+        if self.pp_hook: self.pp_hook(d)
+
+class YoutubeDLPool:
+    def __init__(self):
+        self._free = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def lease(self, profile, make_opts, hook=None, pp_hook=None):
+        with self._lock:
+            free = self._free.setdefault(profile, [])
+            entry = free.pop() if free else None
+        if entry is None:
+            entry = PooledYoutubeDL(make_opts())
+        entry.hook = hook
+        entry.pp_hook = pp_hook
+        # download() renvoie un code cumulatif : on le remet à zéro pour chaque élément
+        entry.ydl._download_retcode = 0
+        entry.ydl.last_error = None
+        try:
+            yield entry.ydl
+        except GeneratorExit:
+            # Pagination abandonnée avant la fin (synchronisation) : l'instance reste saine
+            self._release(profile, entry)
+            raise
+        except BaseException:
+            # Instance interrompue en plein transfert : on ne la remet pas dans le pool
+            entry.hook = entry.pp_hook = None
+            entry.ydl.close()
+            raise
+        self._release(profile, entry)
+
+    def _release(self, profile, entry):
+        entry.hook = entry.pp_hook = None
+        with self._lock:
+            self._free[profile].append(entry)
+
+    def close(self):
+        with self._lock:
+            entries = [entry for free in self._free.values() for entry in free]
+            self._free.clear()
+        for entry in entries:
+            entry.ydl.close()
+
+# --- Téléchargement multi-connexions ---
+# YouTube et la plupart des CDN brident chaque connexion bien en dessous du débit de la ligne.
+# Un fichier d'un seul tenant (MP4 progressif, piste DASH servie en https) est donc découpé en
+# plages d'octets récupérées en parallèle et écrites directement à leur place dans le .part
+# pré-alloué : pas de réassemblage ni de copie à la fin. Le nombre de connexions est celui des
+# fragments DASH (concurrent_fragment_downloads) ; chaque connexion refusée par un HTTP 429 est
+# retirée pour l'hôte (les survivantes donnent sa vraie limite), et une connexion est rendue
+# après chaque fichier reçu sans refus.
+DEFAULT_CONNECTIONS = 4
+MAX_CONNECTIONS = 16
+RANGE_MIN_SIZE = 2 * 1024 * 1024       # En dessous, une seule connexion suffit
+RANGE_CHUNK_MIN = 1024 * 1024
+RANGE_CHUNK_MAX = 10 * 1024 * 1024     # Au-delà, YouTube bride les requêtes (http_chunk_size de yt-dlp)
+RANGE_BLOCK = 256 * 1024
+RANGE_RETRIES = 3                       # Reprises d'une plage avant d'abandonner le fichier
+
+# Fusion en flux : la vidéo et l'audio d'un format "bestvideo+bestaudio" sont passés à ffmpeg par
+# des tubes à mesure qu'ils arrivent, au lieu d'écrire deux fichiers que ffmpeg relit pour en
+# écrire un troisième (environ trois fois la taille finale en écritures). Seules les pistes DASH
+# fragmentées se lisent sans retour en arrière ; sinon, fusion par fichiers habituelle.
+STREAMABLE_CONTAINERS = ('mp4_dash', 'm4a_dash', 'webm_dash')
+STREAM_MUXERS = {'mp4': 'mp4', 'webm': 'webm', 'mkv': 'matroska'}
+STREAM_CHUNK = 2 * 1024 * 1024          # Plages plus petites : elles sont gardées en mémoire jusqu'à leur tour
+STREAM_WINDOW = 2                       # Plages d'avance par connexion sur l'écriture dans le tube
+
+class ConnectionGovernor:
+    def __init__(self):
+        self._limits = {}   # Hôte -> connexions autorisées après un 429
+        self._lock = threading.Lock()
+
+    def allowed(self, host, wanted):
+        with self._lock:
+            return min(wanted, self._limits.get(host, wanted))
+
+    def throttled(self, host, current):
+        # current : connexions ouvertes sur l'hôte, celle qui vient d'être refusée comprise
+        with self._lock:
+            limit = max(1, min(current - 1, self._limits.get(host, current)))
+            self._limits[host] = limit
+            return limit
+
+    def succeeded(self, host, wanted):
+        with self._lock:
+            if host not in self._limits: return
+            if self._limits[host] + 1 >= wanted:
+                del self._limits[host]
+            else:
+                self._limits[host] += 1
+
+connection_governor = ConnectionGovernor()
+
+def read_range_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state.get("size"), int) and isinstance(state.get("chunk"), int) else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Erreur lecture {path}: {e}", file=sys.stderr)
+        return None
+
+class RangedDownload:
+    # Mélangé à HttpFD de yt-dlp par ydl_class(). L'avancement est noté dans "<fichier>.part.ranges"
+    # pour reprendre plage par plage après une erreur ou un crash ; sans ce fichier, un .part
+    # existant a été commencé d'un seul tenant et HttpFD le reprend comme d'habitude.
+    def real_download(self, filename, info_dict):
+        tmpfilename = self.temp_name(filename)
+        state_file = tmpfilename + '.ranges'
+        state = read_range_state(state_file) if self.params.get('continuedl', True) else None
+        if state is not None and (state.get("format_id") != info_dict.get('format_id') or not os.path.isfile(tmpfilename)):
+            state = None
+        if state is None and (info_dict.get('request_data') or self._get_impersonate_target(info_dict) is not None
+                              or (self.params.get('continuedl', True) and os.path.isfile(tmpfilename))):
+            return super().real_download(filename, info_dict)
+
+        url = info_dict['url']
+        host = urllib.parse.urlsplit(url).hostname
+        wanted = self.params.get('concurrent_fragment_downloads') or 1
+        connections = connection_governor.allowed(host, wanted)
+        headers = dict(info_dict.get('http_headers') or {}, **{'Accept-Encoding': 'identity'})
+        if state is None:
+            size = self._probe_size(url, headers)
+            # Même avec une seule connexion, la taille connue permet la pré-allocation
+            if not size or size < RANGE_MIN_SIZE:
+                return super().real_download(filename, info_dict)
+            cap = (info_dict.get('downloader_options') or {}).get('http_chunk_size') or RANGE_CHUNK_MAX
+            chunk = max(RANGE_CHUNK_MIN, min(RANGE_CHUNK_MAX, cap, size // (connections * 4)))
+            state = {"format_id": info_dict.get('format_id'), "size": size, "chunk": chunk, "done": []}
+
+        self.report_destination(filename)
+        progress = TransferProgress(self, info_dict, filename, tmpfilename, state["size"])
+        transfer = FileRangeTransfer(self, url, headers, host, progress, tmpfilename, state_file, state)
+        with open(tmpfilename, 'r+b' if state["done"] else 'wb') as f:
+            # Pré-allocation : chaque connexion écrit à son offset dans un fichier déjà à la bonne taille
+            preallocate(f, state["size"])
+        transfer.run(connections)
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(state_file)
+        self.try_rename(tmpfilename, filename)
+        if not transfer.throttled:
+            connection_governor.succeeded(host, wanted)
+        progress.finished()
+        return True
+
+    def stream_merge(self, filename, info, formats):
+        # formats : un info dict par flux (vidéo, audio), en-têtes compris. Renvoie False quand la
+        # fusion en flux ne s'applique pas : yt-dlp télécharge alors les fichiers et les fusionne.
+        from yt_dlp.utils import determine_protocol
+        ffmpeg = self.params.get('ffmpeg_location')
+        muxer = STREAM_MUXERS.get(info.get('ext'))
+        if os.name != 'posix' or muxer is None or not ffmpeg or not os.path.isfile(ffmpeg):
+            return False
+        for fmt in formats:
+            # Un MP4 progressif peut avoir son index (moov) à la fin : ffmpeg devrait revenir en arrière
+            if (fmt.get('container') not in STREAMABLE_CONTAINERS or determine_protocol(fmt) not in ('http', 'https')
+                    or fmt.get('request_data') or self._get_impersonate_target(fmt) is not None):
+                return False
+        streams = []
+        for fmt in formats:
+            headers = dict(fmt.get('http_headers') or {}, **{'Accept-Encoding': 'identity'})
+            size = self._probe_size(fmt['url'], headers)
+            if not size: return False
+            streams.append((fmt, headers, size))
+
+        tmpfilename = self.temp_name(filename)
+        self.report_destination(filename)
+        pipes = [os.pipe() for _ in streams]
+        cmd = [ffmpeg, '-y', '-loglevel', 'error', '-nostdin', '-xerror']
+        for read_fd, _ in pipes:
+            cmd += ['-i', f'pipe:{read_fd}']
+        for i, (fmt, _, _) in enumerate(streams):
+            if fmt.get('acodec') != 'none': cmd += ['-map', f'{i}:a:0']
+            if fmt.get('vcodec') != 'none': cmd += ['-map', f'{i}:v:0']
+        # Pas de +faststart : il relirait et réécrirait tout le fichier ; un moov en fin de MP4 reste valide
+        cmd += ['-c', 'copy', '-f', muxer, 'file:' + tmpfilename]
+
+        with tempfile.TemporaryFile() as errors:
+            try:
+                process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=errors, pass_fds=[read_fd for read_fd, _ in pipes])
+            except OSError as e:
+                for _, write_fd in pipes: os.close(write_fd)
+                print(f"Erreur ffmpeg ({e}), fusion par fichiers", file=sys.stderr)
+                return False
+            finally:
+                for read_fd, _ in pipes: os.close(read_fd)
+
+            failures = []
+            failure_lock = threading.Lock()
+            def fail(error):
+                # Un flux arrêté bloquerait ffmpeg : l'autre flux et ffmpeg s'arrêtent aussi
+                with failure_lock:
+                    if failures: return
+                    failures.append(error)
+                for transfer, _, _ in transfers:
+                    if transfer.error is None: transfer.error = error
+                process.kill()
+
+            wanted = self.params.get('concurrent_fragment_downloads') or 1
+            # L'audio pèse une fraction de la vidéo : une connexion sur quatre lui suffit
+            audio_share = max(1, wanted // 4)
+            progress = TransferProgress(self, info, filename, tmpfilename, sum(size for _, _, size in streams))
+            transfers = []
+            for (fmt, headers, size), (_, write_fd) in zip(streams, pipes):
+                host = urllib.parse.urlsplit(fmt['url']).hostname
+                share = audio_share if fmt.get('vcodec') == 'none' else max(1, wanted - audio_share)
+                connections = connection_governor.allowed(host, share)
+                transfer = StreamRangeTransfer(self, fmt['url'], headers, size, host, progress, os.fdopen(write_fd, 'wb'), connections * STREAM_WINDOW, fail)
+                transfers.append((transfer, share, connections))
+            for transfer, _, connections in transfers:
+                transfer.start(connections)
+            for transfer, _, _ in transfers:
+                try:
+                    transfer.join()
+                except Exception as e:
+                    fail(e)
+            returncode = process.wait()
+
+            if failures and not isinstance(failures[0], BrokenPipeError):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmpfilename)
+                raise failures[0]
+            if failures or returncode:
+                # ffmpeg a refusé les flux (conteneur à relire, codec inattendu...)
+                errors.seek(0)
+                message = (errors.read().decode('utf-8', 'replace').strip().splitlines() or [f"code {returncode}"])[0]
+                print(f"Fusion en flux impossible ({message}), fusion par fichiers", file=sys.stderr)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmpfilename)
+                return False
+
+        self.try_rename(tmpfilename, filename)
+        for transfer, share, _ in transfers:
+            if not transfer.throttled:
+                connection_governor.succeeded(transfer.host, share)
+        progress.finished()
+        return True
+
+    def _probe_size(self, url, headers):
+        # Une requête sur le premier octet : taille totale et prise en charge des plages
+        from yt_dlp.networking import Request
+        try:
+            with self.ydl.urlopen(Request(url, headers=dict(headers, Range='bytes=0-0'))) as response:
+                content_range = response.headers.get('Content-Range') or ''
+                if response.status != 206: return None
+        except Exception as e:
+            print(f"Erreur sonde plages ({e}), téléchargement en une connexion", file=sys.stderr)
+            return None
+        match = re.match(r'bytes 0-0/(\d+)', content_range)
+        return int(match.group(1)) if match else None
+
+class TransferProgress:
+    # Avancement d'un fichier pour les hooks de yt-dlp, partagé par tous ses flux (vidéo et audio
+    # d'une fusion en flux)
+    def __init__(self, fd, info, filename, path, total):
+        self.fd = fd
+        self.info = info
+        self.filename = filename
+        self.path = path
+        self.total = total
+        self.downloaded = self.resumed = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def resume(self, done):
+        # Octets déjà présents dans un .part repris : comptés, mais pas dans la vitesse
+        with self._lock:
+            self.downloaded += done
+            self.resumed += done
+
+    def add(self, new):
+        # Hooks appelés un à la fois : une pause ou la limite de débit y bloquent toutes les connexions
+        with self._lock:
+            self.downloaded += new
+            now = time.time()
+            speed = self.fd.calc_speed(self.started, now, self.downloaded - self.resumed)
+            self.fd._hook_progress({
+                'status': 'downloading',
+                'downloaded_bytes': self.downloaded,
+                'total_bytes': self.total,
+                'tmpfilename': self.path,
+                'filename': self.filename,
+                'speed': speed,
+                'eta': self.fd.calc_eta(speed, self.total - self.downloaded),
+                'elapsed': now - self.started,
+                'ctx_id': self.info.get('ctx_id'),
+            }, self.info)
+
+    def finished(self):
+        self.fd._hook_progress({
+            'status': 'finished',
+            'filename': self.filename,
+            'downloaded_bytes': self.total,
+            'total_bytes': self.total,
+            'elapsed': time.time() - self.started,
+            'ctx_id': self.info.get('ctx_id'),
+        }, self.info)
+
+class RangeTransfer:
+    # Plages d'un flux réparties entre plusieurs connexions. Les sous-classes décident de ce que
+    # devient une plage reçue : écrite à sa place dans le .part, ou passée à ffmpeg dans l'ordre.
+    def __init__(self, fd, url, headers, size, chunk, host, progress, done=()):
+        self.fd = fd
+        self.url = url
+        self.headers = headers
+        self.host = host
+        self.progress = progress
+        self.chunks = [(start, min(start + chunk, size) - 1) for start in range(0, size, chunk)]
+        done = set(done)
+        self.todo = deque(i for i in range(len(self.chunks)) if i not in done)
+        self.seen = {}            # Plage -> octets déjà signalés (une plage reprise ne compte pas deux fois)
+        progress.resume(sum(end + 1 - start for i, (start, end) in enumerate(self.chunks) if i in done))
+        self.error = None
+        self.throttled = False
+        self._threads = []
+        self._active = 0
+        self._lock = threading.Condition()
+
+    def run(self, connections):
+        self.start(connections)
+        self.join()
+
+    def start(self, connections):
+        with self._lock:
+            self._active = min(connections, len(self.todo))
+        for _ in range(self._active):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.todo:
+            raise RuntimeError("Plages incomplètes")
+
+    def _fail(self, error):
+        # Appelé sous self._lock : seule la première erreur compte
+        if self.error is None: self.error = error
+
+    def _ready(self, index):
+        return True
+
+    def _worker(self):
+        from yt_dlp.networking.exceptions import HTTPError
+        failures = {}
+        while True:
+            with self._lock:
+                while self.error is None and self.todo and not self._ready(self.todo[0]):
+                    self._lock.wait(0.5)
+                if self.error is not None or not self.todo:
+                    self._active -= 1
+                    return
+                index = self.todo.popleft()
+            try:
+                complete = self._fetch(index)
+            except HTTPError as e:
+                if e.status == 429:
+                    # Trop de connexions pour l'hôte : la plage revient dans la file et ce worker
+                    # s'arrête ; le dernier restant abandonne, le moteur reprendra plus tard
+                    with self._lock:
+                        self.throttled = True
+                        self.todo.appendleft(index)
+                        limit = connection_governor.throttled(self.host, self._active)
+                        last = self._active == 1
+                        if last:
+                            self._fail(e)
+                        else:
+                            self._active -= 1
+                    print(f"HTTP 429 sur {self.host} : {limit} connexion(s) au plus", file=sys.stderr)
+                    if last: continue
+                    return
+                self._retry(index, failures, e)
+                continue
+            except Exception as e:
+                if str(e) == "CANCELLED":
+                    with self._lock:
+                        self._fail(e)
+                else:
+                    self._retry(index, failures, e)
+                continue
+            if not complete: continue
+            with self._lock:
+                self._completed(index)
+
+    def _retry(self, index, failures, error):
+        # Coupure passagère sur une plage : elle est reprise quelques fois avant d'abandonner
+        from yt_dlp.networking.exceptions import HTTPError
+        failures[index] = failures.get(index, 0) + 1
+        if failures[index] > RANGE_RETRIES or (isinstance(error, HTTPError) and error.status < 500):
+            with self._lock:
+                self._fail(error)
+            return False
+        time.sleep(failures[index])
+        with self._lock:
+            self.todo.appendleft(index)
+        return True
+
+    def _fetch(self, index):
+        from yt_dlp.networking import Request
+        from yt_dlp.utils import ContentTooShortError
+        start, end = self.chunks[index]
+        # Plage reprise après une coupure : on repart des octets déjà reçus, pas de son début
+        pos = start + self.seen.get(index, 0)
+        request = Request(self.url, headers=dict(self.headers, Range=f'bytes={pos}-{end}'))
+        with self.fd.ydl.urlopen(request) as response, self._open(index, pos) as f:
+            if response.status != 206:
+                raise RuntimeError(f"Plage {pos}-{end} refusée (HTTP {response.status})")
+            while pos <= end:
+                # Un autre worker a échoué : inutile de finir la plage
+                if self.error is not None: return False
+                block = response.read(min(RANGE_BLOCK, end + 1 - pos))
+                if not block:
+                    raise ContentTooShortError(pos - start, end + 1 - start)
+                f.write(block)
+                pos += len(block)
+                self._report(index, pos - start)
+        return True
+
+    def _report(self, index, received):
+        # Une plage n'est tenue que par un worker à la fois : seen n'a pas besoin du verrou
+        new = received - self.seen.get(index, 0)
+        if new <= 0: return
+        self.seen[index] = received
+        self.progress.add(new)
+
+class FileRangeTransfer(RangeTransfer):
+    # Chaque plage est écrite à son offset dans le .part pré-alloué, puis notée dans state_file
+    def __init__(self, fd, url, headers, host, progress, path, state_file, state):
+        super().__init__(fd, url, headers, state["size"], state["chunk"], host, progress, state["done"])
+        self.path = path
+        self.state_file = state_file
+        self.state = state
+
+    def start(self, connections):
+        # État écrit avant la première plage : sans lui, HttpFD prendrait le .part pré-alloué
+        # pour un fichier complet et reprendrait à offset=taille (HTTP 416)
+        self._save_state()
+        super().start(connections)
+
+    def _open(self, index, pos):
+        f = open(self.path, 'r+b', buffering=0)
+        f.seek(pos)
+        return f
+
+    def _completed(self, index):
+        self.state["done"].append(index)
+        self._save_state()
+
+    def _save_state(self):
+        # Appelé avant le départ des workers, puis sous self._lock après chaque plage terminée
+        try:
+            tmp = self.state_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            print(f"Erreur état des plages: {e}", file=sys.stderr)
+
+class StreamRangeTransfer(RangeTransfer):
+    # Les plages sont reçues en parallèle mais écrites dans le tube de ffmpeg dans l'ordre, par
+    # un thread dédié. Les workers ne prennent pas plus de 'window' plages d'avance : la mémoire
+    # reste bornée même si ffmpeg lit ce flux moins vite que l'autre.
+    def __init__(self, fd, url, headers, size, host, progress, pipe, window, on_fail):
+        super().__init__(fd, url, headers, size, STREAM_CHUNK, host, progress)
+        self.pipe = pipe
+        self.window = window
+        self.on_fail = on_fail
+        self.buffers = {}         # Plage en cours de réception -> tampon
+        self.ready = {}           # Plage reçue -> octets en attente d'écriture
+        self.written = 0          # Plages déjà passées à ffmpeg
+        self._writer = threading.Thread(target=self._write, daemon=True)
+
+    def start(self, connections):
+        self._writer.start()
+        super().start(connections)
+
+    def join(self):
+        try:
+            super().join()
+        finally:
+            self._writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def _fail(self, error):
+        super()._fail(error)
+        self.on_fail(error)
+
+    def _ready(self, index):
+        return index < self.written + self.window
+
+    def _open(self, index, pos):
+        # Plage gardée en mémoire jusqu'à son tour d'écriture ; une plage reprise complète son tampon
+        return contextlib.nullcontext(self.buffers.setdefault(index, io.BytesIO()))
+
+    def _completed(self, index):
+        self.ready[index] = self.buffers.pop(index).getvalue()
+        self._lock.notify_all()
+
+    def _write(self):
+        # La fermeture du tube (fin ou erreur) signale la fin du flux à ffmpeg
+        try:
+            with self.pipe:
+                for index in range(len(self.chunks)):
+                    with self._lock:
+                        while self.error is None and index not in self.ready:
+                            self._lock.wait(0.5)
+                        if self.error is not None: return
+                        data = self.ready.pop(index)
+                    self.pipe.write(data)
+                    with self._lock:
+                        self.written = index + 1
+                        self._lock.notify_all()
+        except Exception as e:
+            # BrokenPipeError : ffmpeg s'est arrêté de lui-même
+            with self._lock:
+                self._fail(e)
+
+# --- Étape de post-traitement ---
+# Pipeline en deux étages : les workers réseau téléchargent les fichiers bruts, puis les
+# confient à cette étape dont chaque worker pilote un processus ffmpeg (un par cœur).
+# La file est bornée : si la conversion prend du retard, les workers réseau attendent
+# avant de prendre une nouvelle vidéo (contre-pression).
+POSTPROCESS_WORKERS = max(1, os.cpu_count() or 1)
+POSTPROCESS_BACKLOG = 2 * POSTPROCESS_WORKERS
+
+class PostProcessStage:
+    def __init__(self, run, workers, backlog):
+        self.run = run
+        self.workers = workers
+        self.waiting = 0   # Tâches en file ou bloquées par la contre-pression
+        self.active = 0
+        self._tasks = queue.Queue(maxsize=backlog)
+        self._lock = threading.Lock()
+        self._started = False
+
+    def submit(self, task, cancelled):
+        # Bloque tant que la file est pleine ; renvoie False si l'attente a été annulée
+        self._start()
+        with self._lock:
+            self.waiting += 1
+        while not cancelled():
+            try:
+                self._tasks.put(task, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        with self._lock:
+            self.waiting -= 1
+        return False
+
+    def _start(self):
+        with self._lock:
+            if self._started: return
+            self._started = True
+        for _ in range(self.workers):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            with self._lock:
+                self.waiting -= 1
+                self.active += 1
+            try:
+                self.run(task)
+            except Exception as e:
+                print(f"Erreur post-traitement: {e}", file=sys.stderr)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+# --- Cache disque des analyses ---
+# Résultats "extract_flat" des playlists et métadonnées des vidéos, indexés par URL canonique.
+# Les entrées expirent après un TTL et le fichier est borné en taille (éviction LRU).
+CACHE_FILE = os.path.join(APP_DATA_DIR, 'metadata_cache.sqlite3')
+# Nombre d'entrées ajoutées à la liste à la fois pendant une analyse en continu
+ANALYZE_BATCH_SIZE = 50
+# Seuls ces champs sont utiles à l'interface : on évite de stocker les formats complets
+CACHED_ENTRY_FIELDS = ('id', 'title', 'url', 'webpage_url', 'ie_key', 'extractor_key', 'duration', 'filesize', 'filesize_approx')
+
+def canonical_url(url):
+    url = url.strip()
+    parsed = urllib.parse.urlparse(url if "://" in url else "https://" + url)
+    host = parsed.netloc.lower().removeprefix("www.").removeprefix("m.")
+    query = urllib.parse.parse_qs(parsed.query)
+    if host in ("youtube.com", "music.youtube.com", "youtu.be"):
+        # Même logique que l'analyse : une URL avec "list=" désigne la playlist
+        if query.get("list"):
+            return f"youtube:playlist:{query['list'][0]}"
+        if host == "youtu.be" and parsed.path.strip("/"):
+            return f"youtube:video:{parsed.path.strip('/')}"
+        if query.get("v"):
+            return f"youtube:video:{query['v'][0]}"
+    path = parsed.path.rstrip("/") or "/"
+    return urllib.parse.urlunparse((parsed.scheme.lower(), host, path, "", urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query))), ""))
+
+def compact_entry(info):
+    return {key: info[key] for key in CACHED_ENTRY_FIELDS if info.get(key) is not None}
+
+class MetadataCache:
+    def __init__(self, path, ttl_seconds, max_bytes):
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT data, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, data, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes: return
+        # Les entrées les moins récemment consultées partent en premier
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes: break
+
+# --- Analyse ---
+class VideoEntry:
+    # Enregistrement compact par vidéo : la liste peut en contenir des dizaines de milliers
+    __slots__ = ('index', 'id', 'title', 'url', 'extractor', 'status', 'duration', 'filesize')
+
+    def __init__(self, index, video_id, title, url, extractor=None, duration=None, filesize=None):
+        self.index = index
+        self.id = video_id
+        self.title = title
+        self.url = url
+        self.extractor = extractor
+        self.status = None  # Symbole affiché devant le titre (⏩, ✔️, ❌, ⏸️)
+        self.duration = duration  # Secondes, pour estimer la taille (None : inconnue)
+        self.filesize = filesize
+
+def iter_entries(pool, url, on_info=None):
+    # Générateur : avec process=False, yt-dlp renvoie les entrées de la playlist de façon
+    # paresseuse et ne télécharge la page suivante que lorsqu'on la consomme.
+    # on_info : reçoit les infos de la playlist (titre...) avant la première entrée
+    ydl_opts = {'extract_flat': True, 'quiet': True}
+    with pool.lease("analyze", lambda: ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Suivi des redirections (ex : lien court vers une chaîne ou une playlist)
+        for _ in range(5):
+            if info.get('_type') not in ('url', 'url_transparent'): break
+            info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        if on_info: on_info(info)
+        if 'entries' in info:
+            for vid in info['entries']:
+                if vid: yield compact_entry(vid)
+        else:
+            yield compact_entry(info)
+
+def entry_url(vid):
+    vid_id = vid.get('id')
+    # Entrée de playlist ('ie_key') ou vidéo seule ('extractor_key')
+    if vid_id and (vid.get('ie_key') or vid.get('extractor_key') or 'Youtube') == 'Youtube':
+        return f"https://www.youtube.com/watch?v={vid_id}"
+    return vid.get('webpage_url') or vid.get('url')
+
+def entry_extractor(vid):
+    extractor = vid.get('ie_key') or vid.get('extractor_key')
+    return extractor.lower() if extractor else None
+
+def entry_from_info(index, vid):
+    return VideoEntry(
+        index, vid.get('id'), vid.get('title') or 'Sans titre', entry_url(vid), entry_extractor(vid),
+        vid.get('duration'), vid.get('filesize') or vid.get('filesize_approx'),
+    )
+
+def entry_identity(video_id, extractor, url):
+    # (extracteur, identifiant) d'une vidéo, le même qu'elle vienne d'une playlist à plat ou d'une
+    # analyse directe. L'extracteur générique tire son id du nom de fichier et une entrée de flux
+    # RSS n'en a pas : l'URL normalisée sert alors d'identifiant.
+    if video_id and extractor and extractor != 'generic':
+        return (extractor, video_id)
+    if url:
+        return ('url', canonical_url(url))
+    return None
+
+def entry_key(vid):
+    # Clé de dédoublonnage : la même vidéo peut figurer dans plusieurs playlists
+    identity = entry_identity(vid.get('id'), entry_extractor(vid), entry_url(vid))
+    return ":".join(identity) if identity else None
+
+def video_entry_key(entry):
+    # Même clé qu'entry_key, pour un VideoEntry (job du lot)
+    identity = entry_identity(entry.id, entry.extractor, entry.url)
+    return ":".join(identity) if identity else None
+
+def parse_url_list(text):
+    # Bloc collé ou fichier texte : URLs séparées par des retours à la ligne ou des espaces,
+    # lignes commençant par "#" ignorées, doublons retirés
+    urls = [word for line in text.splitlines() if not line.lstrip().startswith("#") for word in line.split()]
+    return list(dict.fromkeys(urls))
+
+# --- Journal persistant de la file ---
+# Chaque job y est inscrit (URL, réglages, état, fichier partiel) : après une fermeture ou un
+# crash, les jobs non terminés sont repris au démarrage sans relancer l'analyse.
+JOURNAL_FILE = os.path.join(APP_DATA_DIR, 'jobs.sqlite3')
+
+class JobJournal:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL : chaque écriture est durable sans bloquer les lectures, synchronous=NORMAL suffit
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, title TEXT, video_id TEXT, extractor TEXT,"
+            " options TEXT NOT NULL, state TEXT NOT NULL, part_path TEXT, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def add(self, jobs):
+        now = time.time()
+        with self._lock:
+            for job in jobs:
+                cursor = self._db.execute(
+                    "INSERT INTO jobs (url, title, video_id, extractor, options, state, part_path, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.url, job.title, job.entry.id, job.entry.extractor, json.dumps(job.options), job.state, job.part_path, now)
+                )
+                job.journal_id = cursor.lastrowid
+            self._db.commit()
+
+    def update(self, job):
+        if job.journal_id is None: return
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, part_path = ?, updated = ? WHERE id = ?",
+                (job.state, job.part_path, time.time(), job.journal_id)
+            )
+            self._db.commit()
+
+    def unfinished(self):
+        # Un job en cours ou en pause au moment du crash est simplement remis en file
+        placeholders = ", ".join("?" * len(FINAL_STATES))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, url, title, video_id, extractor, options, part_path FROM jobs WHERE state NOT IN ({placeholders}) ORDER BY id",
+                FINAL_STATES
+            ).fetchall()
+        return [
+            {"id": row[0], "url": row[1], "title": row[2], "video_id": row[3], "extractor": row[4], "options": json.loads(row[5]), "part_path": row[6]}
+            for row in rows
+        ]
+
+    def purge_finished(self):
+        placeholders = ", ".join("?" * len(FINAL_STATES))
+        with self._lock:
+            self._db.execute(f"DELETE FROM jobs WHERE state IN ({placeholders})", FINAL_STATES)
+            self._db.commit()
+
+# --- Archive des téléchargements ---
+# Index persistant des vidéos déjà récupérées, par (extracteur, id, profil de format).
+# Il est chargé en mémoire au démarrage : relancer une playlist de milliers de vidéos
+# ne touche le réseau que pour les nouvelles entrées.
+ARCHIVE_FILE = os.path.join(APP_DATA_DIR, 'download_archive.sqlite3')
+
+def archive_profile(options):
+    # Une même vidéo peut être archivée une fois par profil (MP3, MP4 720p, MP4 720p compat...)
+    if options["format"] != "MP4":
+        return options["format"]
+    if not options.get("resolution"):
+        return "MP4"
+    return f"MP4-{options['resolution']}" + ("-compat" if options.get("compatibility") else "")
+
+def archive_key(entry, options):
+    identity = entry_identity(entry.id, entry.extractor, entry.url)
+    return identity + (archive_profile(options),) if identity else None
+
+class DownloadArchive:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS archive ("
+            " extractor TEXT NOT NULL, video_id TEXT NOT NULL, profile TEXT NOT NULL, added REAL NOT NULL,"
+            " PRIMARY KEY (extractor, video_id, profile)) WITHOUT ROWID"
+        )
+        self._db.commit()
+        self._keys = set(self._db.execute("SELECT extractor, video_id, profile FROM archive"))
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        with self._lock:
+            if key in self._keys: return
+            # Transaction : l'index en mémoire n'est mis à jour qu'une fois l'écriture validée
+            with self._db:
+                self._db.execute("INSERT OR IGNORE INTO archive VALUES (?, ?, ?, ?)", key + (time.time(),))
+            self._keys.add(key)
+
+# --- Limitation de bande passante ---
+# Seau à jetons partagé par tous les workers : chaque bloc reçu (signalé par le hook de
+# progression) est "payé" en jetons, et le worker qui s'endette attend dans le hook le temps
+# de rembourser. Le débit total reste donc sous la limite quel que soit le nombre de jobs, et
+# la part d'un job qui se termine revient aussitôt aux autres. Un second seau par job borne
+# en plus chaque téléchargement. La limite globale peut varier selon l'heure (plages horaires).
+BANDWIDTH_BURST_SECONDS = 1.0   # Rafale tolérée, en secondes de débit
+# Même syntaxe que --limit-rate de yt-dlp (1K = 1024), sans avoir à l'importer au démarrage
+RATE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([KMGTPEZY]?)')
+RATE_UNITS = {unit: 1024 ** i for i, unit in enumerate(['', *'KMGTPEZY'])}
+
+def parse_rate(value):
+    # "2M", "500K", 1048576... ; None, 0 ou "unlimited" : pas de limite
+    if value in (None, "", 0, "0") or str(value).lower() in ("none", "unlimited", "illimité"):
+        return None
+    if isinstance(value, (int, float)):
+        rate = value
+    else:
+        match = RATE_PATTERN.fullmatch(str(value).strip().upper())
+        rate = round(float(match.group(1)) * RATE_UNITS[match.group(2)]) if match else None
+    if not rate or rate <= 0:
+        raise ValueError(f"Débit invalide : {value}")
+    return rate
+
+def parse_clock(value):
+    hours, sep, minutes = value.strip().partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit() or int(hours) > 24 or int(minutes) >= 60:
+        raise ValueError(f"Heure invalide : {value}")
+    return int(hours) * 60 + int(minutes)
+
+def parse_bandwidth_window(spec):
+    # {"start": "08:00", "end": "19:00", "limit": "2M"} (config) ou "08:00-19:00=2M" (CLI)
+    if isinstance(spec, str):
+        hours, _, limit = spec.partition("=")
+        start, _, end = hours.partition("-")
+        spec = {"start": start, "end": end, "limit": limit}
+    return (parse_clock(spec["start"]), parse_clock(spec["end"]), parse_rate(spec.get("limit")))
+
+class BandwidthLimiter:
+    def __init__(self, rate=None, windows=(), job_rate=None, clock=time.monotonic, now=time.localtime):
+        self.rate = rate            # Limite globale hors plages horaires
+        self.windows = list(windows)  # (début, fin, limite) en minutes depuis minuit
+        self.job_rate = job_rate
+        self._clock = clock
+        self._now = now
+        self._lock = threading.Lock()
+        self._global = [0.0, None]  # [jetons, dernier remplissage]
+        self._jobs = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            parse_rate(config.get("bandwidth_limit")),
+            [parse_bandwidth_window(w) for w in config.get("bandwidth_windows") or []],
+            parse_rate(config.get("job_bandwidth_limit")),
+        )
+
+    def __bool__(self):
+        return bool(self.rate or self.job_rate or self.windows)
+
+    def current_rate(self):
+        t = self._now()
+        minute = t.tm_hour * 60 + t.tm_min
+        for start, end, rate in self.windows:
+            # Une plage peut passer minuit (ex : 22:00-06:00)
+            if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                return rate
+        return self.rate
+
+    def _take(self, bucket, rate, nbytes, now):
+        if bucket[1] is None:
+            bucket[0] = rate * BANDWIDTH_BURST_SECONDS
+        else:
+            bucket[0] = min(rate * BANDWIDTH_BURST_SECONDS, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        bucket[0] -= nbytes
+        return -bucket[0] / rate if bucket[0] < 0 else 0
+
+    def consume(self, key, nbytes, cancelled=lambda: False):
+        # Bloque le worker appelant jusqu'à ce que nbytes soient couverts par les deux seaux
+        if nbytes <= 0: return
+        rate = self.current_rate()
+        with self._lock:
+            now = self._clock()
+            wait = 0
+            if rate:
+                wait = self._take(self._global, rate, nbytes, now)
+            if self.job_rate:
+                wait = max(wait, self._take(self._jobs.setdefault(key, [0.0, None]), self.job_rate, nbytes, now))
+        deadline = self._clock() + wait
+        while not cancelled():
+            remaining = deadline - self._clock()
+            if remaining <= 0: break
+            time.sleep(min(remaining, 0.5))
+
+    def release(self, key):
+        with self._lock:
+            self._jobs.pop(key, None)
+
+# --- Métriques ---
+# Temps passé par chaque job dans chaque phase (file d'attente, extraction, transfert, attente
+# de conversion, fusion, transcodage, déplacement...) et octets reçus. Agrégés en histogrammes
+# au format texte Prometheus (fichier pour node_exporter ou point d'accès /metrics local) et
+# résumés en JSON à la fin de chaque lot.
+PHASES = ("queue", "extract", "transfer", "stage_wait", "merge", "transcode", "move", "postprocess", "retry_wait")
+# Post-processeurs yt-dlp (pp_key, sans le préfixe FFmpeg) rattachés à une phase ; les autres
+# (corrections, métadonnées...) comptent en "postprocess"
+POSTPROCESSOR_PHASES = {
+    "Merger": "merge",
+    "ExtractAudio": "transcode",
+    "VideoConvertor": "transcode",
+    "VideoRemuxer": "transcode",
+    "MoveFilesAfterDownload": "move",
+}
+METRICS_FILE = os.path.join(APP_DATA_DIR, 'metrics.prom')
+SUMMARY_FILE = os.path.join(APP_DATA_DIR, 'batch_metrics.jsonl')
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(METRICS_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(METRICS_BUCKETS):
+            if value <= bound: self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class EngineMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phase_seconds = {phase: Histogram() for phase in PHASES}
+        self.job_seconds = Histogram()
+        self.jobs_total = {}
+        self.bytes_total = 0
+        self.errors_total = {}    # (classe d'erreur, "retried" ou "failed") -> nombre
+        self._batch = []
+        self._batch_errors = {}
+        self._batch_started = time.time()
+
+    def begin_batch(self):
+        with self._lock:
+            self._batch = []
+            self._batch_errors = {}
+            self._batch_started = time.time()
+
+    def observe_error(self, error_class, retried):
+        key = (error_class, "retried" if retried else "failed")
+        with self._lock:
+            self.errors_total[key] = self.errors_total.get(key, 0) + 1
+            self._batch_errors[key] = self._batch_errors.get(key, 0) + 1
+
+    def observe(self, job):
+        total = sum(job.phases.values())
+        with self._lock:
+            for phase, seconds in job.phases.items():
+                self.phase_seconds[phase].observe(seconds)
+            self.job_seconds.observe(total)
+            self.jobs_total[job.state] = self.jobs_total.get(job.state, 0) + 1
+            self.bytes_total += job.bytes
+            self._batch.append({
+                "url": job.url,
+                "title": job.title,
+                "state": job.state,
+                "bytes": job.bytes,
+                "seconds": round(total, 3),
+                "phases": {phase: round(seconds, 3) for phase, seconds in job.phases.items()},
+            })
+
+    def batch_summary(self, outcome):
+        with self._lock:
+            jobs = list(self._batch)
+            elapsed = time.time() - self._batch_started
+            errors = {}
+            for (error_class, result), count in sorted(self._batch_errors.items()):
+                errors.setdefault(error_class, {})[result] = count
+        phases = {}
+        for phase in PHASES:
+            values = sorted(job["phases"][phase] for job in jobs if phase in job["phases"])
+            if not values: continue
+            phases[phase] = {
+                "total": round(sum(values), 3),
+                "mean": round(sum(values) / len(values), 3),
+                "median": values[len(values) // 2],
+                "max": values[-1],
+            }
+        states = {}
+        for job in jobs:
+            states[job["state"]] = states.get(job["state"], 0) + 1
+        return {
+            "outcome": outcome,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._batch_started)),
+            "elapsed": round(elapsed, 3),
+            "jobs": states,
+            "bytes": sum(job["bytes"] for job in jobs),
+            "phases": phases,
+            "errors": errors,
+            "items": jobs,
+        }
+
+    def render(self):
+        # Format d'exposition texte de Prometheus
+        lines = []
+        def histogram(name, hist, labels=""):
+            cumulative = [f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {count}' for bound, count in zip(METRICS_BUCKETS, hist.counts)]
+            lines.extend(cumulative)
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {hist.count}')
+            lines.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}" if labels else f"{name}_sum {hist.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {hist.count}" if labels else f"{name}_count {hist.count}")
+        with self._lock:
+            lines.append("# HELP ydp_job_phase_seconds Temps passé par les jobs dans chaque phase.")
+            lines.append("# TYPE ydp_job_phase_seconds histogram")
+            for phase in PHASES:
+                histogram("ydp_job_phase_seconds", self.phase_seconds[phase], f'phase="{phase}"')
+            lines.append("# HELP ydp_job_duration_seconds Durée totale des jobs, de la mise en file à la fin.")
+            lines.append("# TYPE ydp_job_duration_seconds histogram")
+            histogram("ydp_job_duration_seconds", self.job_seconds)
+            lines.append("# HELP ydp_jobs_total Jobs terminés, par état final.")
+            lines.append("# TYPE ydp_jobs_total counter")
+            for state, count in sorted(self.jobs_total.items()):
+                lines.append(f'ydp_jobs_total{{state="{state}"}} {count}')
+            lines.append("# HELP ydp_downloaded_bytes_total Octets téléchargés.")
+            lines.append("# TYPE ydp_downloaded_bytes_total counter")
+            lines.append(f"ydp_downloaded_bytes_total {self.bytes_total}")
+            lines.append("# HELP ydp_job_errors_total Échecs de téléchargement par classe d'erreur, repris ou définitifs.")
+            lines.append("# TYPE ydp_job_errors_total counter")
+            for (error_class, outcome), count in sorted(self.errors_total.items()):
+                lines.append(f'ydp_job_errors_total{{class="{error_class}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Écriture atomique : le collecteur ne lit jamais un fichier à moitié écrit
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    # Point d'accès /metrics local, servi par un thread de fond
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Localisation et capacités de ffmpeg ---
+# Le binaire et ce qu'il sait faire (version, encodeurs, muxers) ne sont sondés qu'une fois :
+# le résultat est gardé en mémoire et dans un fichier cache, invalidé dès que le binaire change
+# (date de modification, taille). Les options yt-dlp en déduisent la conversion la moins chère.
+FFMPEG_CACHE_FILE = os.path.join(APP_DATA_DIR, 'ffmpeg_probe.json')
+_ffmpeg_path = None      # "" : aucun ffmpeg trouvé
+_ffmpeg_caps = {}        # Chemin du binaire -> FFmpegCapabilities (None si la sonde a échoué)
+_ffmpeg_lock = threading.RLock()
+
+class FFmpegCapabilities:
+    def __init__(self, path, version, encoders, muxers):
+        self.path = path
+        self.version = version
+        self.encoders = frozenset(encoders)
+        self.muxers = frozenset(muxers)
+
+    def can_encode(self, encoder):
+        return encoder in self.encoders
+
+    def can_mux(self, muxer):
+        return muxer in self.muxers
+
+    def to_dict(self):
+        return {"path": self.path, "version": self.version, "encoders": sorted(self.encoders), "muxers": sorted(self.muxers)}
+
+def ffmpeg_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+def read_ffmpeg_cache(cache_file=FFMPEG_CACHE_FILE):
+    # Entrée valide seulement si le binaire enregistré n'a pas changé depuis la sonde
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Erreur lecture cache ffmpeg ({e}), nouvelle sonde.", file=sys.stderr)
+        return None
+    if not isinstance(cached, dict) or ffmpeg_stamp(cached.get("path") or "") != cached.get("stamp"):
+        return None
+    return cached
+
+def write_ffmpeg_cache(caps, cache_file=FFMPEG_CACHE_FILE):
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_path = cache_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(caps.to_dict(), stamp=ffmpeg_stamp(caps.path)), f, indent=2)
+        os.replace(tmp_path, cache_file)
+    except Exception as e:
+        print(f"Erreur sauvegarde cache ffmpeg: {e}", file=sys.stderr)
+
+def find_ffmpeg():
+    # Une seule recherche par processus ; le binaire du cache est repris tel quel s'il n'a pas
+    # changé (sauf si IMAGEIO_FFMPEG_EXE en impose un autre)
+    global _ffmpeg_path
+    with _ffmpeg_lock:
+        if _ffmpeg_path is None:
+            cached = None if os.environ.get("IMAGEIO_FFMPEG_EXE") else read_ffmpeg_cache()
+            if cached:
+                _ffmpeg_path = cached["path"]
+            else:
+                try:
+                    import imageio_ffmpeg
+                    _ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
+                except Exception:
+                    _ffmpeg_path = shutil.which("ffmpeg") or ""
+        return _ffmpeg_path or None
+
+def probe_ffmpeg(path):
+    def run(*args):
+        return subprocess.run([path, "-hide_banner", *args], capture_output=True, text=True, timeout=30, check=True).stdout
+
+    match = re.match(r"\S+ version (\S+)", run("-version"))
+    # " A....D libmp3lame  ..." (encodeurs) et "  E  mp4  ..." / " DE matroska  ..." (formats)
+    encoders = [name for name in re.findall(r"^ [VAS][A-Z.]{5} (\S+)", run("-encoders"), re.M) if name != "="]
+    muxers = re.findall(r"^ [D ]E[d ] (\S+)", run("-muxers"), re.M)
+    return FFmpegCapabilities(path, match.group(1) if match else None, encoders, muxers)
+
+def ffmpeg_capabilities(path):
+    # None : pas de ffmpeg ou sonde impossible
+    if not path: return None
+    with _ffmpeg_lock:
+        if path not in _ffmpeg_caps:
+            cached = read_ffmpeg_cache()
+            if cached and cached["path"] == path and "muxers" in cached:
+                _ffmpeg_caps[path] = FFmpegCapabilities(path, cached.get("version"), cached["encoders"], cached["muxers"])
+            else:
+                try:
+                    _ffmpeg_caps[path] = probe_ffmpeg(path)
+                    write_ffmpeg_cache(_ffmpeg_caps[path])
+                except Exception as e:
+                    print(f"Erreur sonde ffmpeg ({path}): {e}", file=sys.stderr)
+                    _ffmpeg_caps[path] = None
+        return _ffmpeg_caps[path]
+
+# --- Options yt-dlp ---
+# Profils audio : format demandé à yt-dlp, codec visé par FFmpegExtractAudio, muxers ffmpeg
+# nécessaires et encodeur utilisé quand la source est dans un autre codec. Quand la source est
+# déjà dans le codec visé, yt-dlp copie simplement le flux (remux, aucun réencodage) : une
+# playlist se termine au rythme du réseau. Seul MP3 réencode systématiquement.
+AUDIO_PROFILES = {
+    # Codec de la source conservé, conteneur choisi d'après lui (AAC -> .m4a, Opus -> .opus...)
+    "AUDIO": ('bestaudio/best', 'best', ('ipod', 'opus', 'ogg'), None),
+    "M4A": ('bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best', 'm4a', ('ipod',), 'aac'),
+    "OPUS": ('bestaudio[acodec=opus]/bestaudio/best', 'opus', ('opus',), 'libopus'),
+}
+AUDIO_FORMATS = ("AUDIO", "M4A", "OPUS", "MP3")
+
+def build_ydl_opts(options, out_dir, ffmpeg_path=None, capabilities=None):
+    # capabilities : résultat de ffmpeg_capabilities() ; sans sonde, ffmpeg est supposé complet
+    ydl_opts = {
+        'outtmpl': os.path.join(out_dir, '%(title)s.%(ext)s'),
+        'noplaylist': True,
+        'ignoreerrors': True,
+        # Force le client 'default' (Android/iOS) pour contourner le manque de JS runtime
+        'extractor_args': {'youtube': {'player_client': ['default']}}
+    }
+    if ffmpeg_path:
+        ydl_opts['ffmpeg_location'] = ffmpeg_path
+
+    res_value = options.get("resolution")
+    can_merge = ffmpeg_path and (capabilities is None or capabilities.can_mux("mp4"))
+    audio_format = options["format"]
+    if audio_format == "MP3" and capabilities is not None and not capabilities.can_encode("libmp3lame"):
+        # ffmpeg sans encodeur MP3 : la conversion échouerait après le téléchargement, on garde
+        # l'AAC d'origine
+        audio_format = "M4A"
+    if audio_format in AUDIO_PROFILES and capabilities is not None:
+        encoder = AUDIO_PROFILES[audio_format][3]
+        if encoder and not capabilities.can_encode(encoder):
+            # Sans cet encodeur, une source dans un autre codec échouerait à la conversion : on
+            # garde le codec de la source (AUDIO ne fait que copier le flux)
+            audio_format = "AUDIO"
+    if audio_format == "MP3":
+        ydl_opts.update({
+            'format': 'bestaudio/best',
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': '192',
+            }],
+        })
+    elif audio_format in AUDIO_PROFILES:
+        format_string, codec, muxers, _ = AUDIO_PROFILES[audio_format]
+        ydl_opts['format'] = format_string
+        # Sans ffmpeg (Android) ou sans le muxer voulu : le flux téléchargé est gardé tel quel
+        if ffmpeg_path and (capabilities is None or all(capabilities.can_mux(muxer) for muxer in muxers)):
+            ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': codec}]
+    elif not can_merge or not res_value:
+        # Sans ffmpeg (ou sans muxer MP4), pas de fusion possible : un seul fichier MP4 déjà multiplexé
+        ydl_opts.update({'format': 'best[ext=mp4]'})
+    else:
+        if options.get("compatibility"):
+            format_string = f'bestvideo[height<={res_value}][vcodec^=avc1]+bestaudio[ext=m4a]/bestvideo[height<={res_value}][ext=mp4]+bestaudio[ext=m4a]/best[height<={res_value}][ext=mp4]/best[height<={res_value}]'
+        else:
+            format_string = f'bestvideo[height<={res_value}][ext=mp4]+bestaudio[ext=m4a]/best[height<={res_value}][ext=mp4]/best[height<={res_value}]'
+
+        ydl_opts.update({
+            'format': format_string,
+        })
+    return ydl_opts
+
+# --- Préchargement des informations complètes ---
+# L'analyse se contente d'une extraction "à plat" (id, titre) : sans préchargement, chaque
+# download() refait une extraction complète (page du lecteur, négociation du client) au moment
+# où le worker prend le job. Quelques threads résolvent donc à l'avance les infos complètes
+# (formats, tailles, durées) des jobs en tête de file, et le worker télécharge directement à
+# partir de ces infos tant que les URLs de flux sont encore valides.
+PREFETCH_WORKERS = 2
+PREFETCH_AHEAD = 8          # Jobs en tête de file dont les infos sont préchargées
+PREFETCH_MAX_AGE = 1800     # Durée de validité supposée des URLs de flux sans "expire=", en secondes
+PREFETCH_EXPIRY_MARGIN = 300
+
+def info_expiry(info, fetched):
+    # Les URLs de flux YouTube portent leur date d'expiration ("expire=<timestamp>")
+    expiries = [
+        int(match.group(1))
+        for fmt in info.get('formats') or [info]
+        for match in [re.search(r'[?&/]expire[=/](\d+)', fmt.get('url') or '')] if match
+    ]
+    if expiries:
+        return min(expiries) - PREFETCH_EXPIRY_MARGIN
+    return fetched + PREFETCH_MAX_AGE
+
+# --- Classification des erreurs et reprises ---
+# Les erreurs de yt-dlp n'arrivent le plus souvent que sous forme de message (ignoreerrors) :
+# elles sont rangées par classe d'après ce texte. Les classes permanentes échouent tout de
+# suite ; les transitoires repartent dans la file après une attente exponentielle avec gigue,
+# sans bloquer de worker pendant ce temps.
+class ErrorClass:
+    # Permanentes
+    PRIVATE = "private"
+    UNAVAILABLE = "unavailable"
+    GEO = "geo"
+    AGE = "age_restricted"
+    DISK = "disk"
+    POSTPROCESS = "postprocess"
+    # Transitoires
+    RATE_LIMITED = "rate_limited"
+    SERVER = "server"
+    NETWORK = "network"
+    FORBIDDEN = "forbidden"     # 403 sur un flux : URL expirée, une extraction fraîche suffit souvent
+    UNKNOWN = "unknown"
+
+# La première correspondance l'emporte : "Sign in to confirm you're not a bot" est un
+# ralentissement imposé, pas une vidéo privée
+ERROR_PATTERNS = [
+    (ErrorClass.RATE_LIMITED, re.compile(r"HTTP Error 429|Too Many Requests|not a bot|rate.?limit|throttl", re.I)),
+    (ErrorClass.AGE, re.compile(r"confirm your age|age.restricted|inappropriate for some users", re.I)),
+    (ErrorClass.PRIVATE, re.compile(r"Private video|Sign in", re.I)),
+    (ErrorClass.GEO, re.compile(r"in your country|geo.?restrict", re.I)),
+    (ErrorClass.UNAVAILABLE, re.compile(r"Video unavailable|has been removed|no longer available|terminated|copyright|members.only|Join this channel|does not exist|HTTP Error 40[14]|HTTP Error 410|Unsupported URL|Requested format is not available", re.I)),
+    (ErrorClass.DISK, re.compile(r"No space left|Disk quota|Permission denied|Read-only file system|ENOSPC|EACCES", re.I)),
+    (ErrorClass.POSTPROCESS, re.compile(r"Postprocessing|ffmpeg|ffprobe|conversion failed", re.I)),
+    (ErrorClass.SERVER, re.compile(r"HTTP Error 5\d\d|Internal Server Error|Bad Gateway|Service Unavailable|Gateway Time", re.I)),
+    (ErrorClass.FORBIDDEN, re.compile(r"HTTP Error 403|Forbidden", re.I)),
+    (ErrorClass.NETWORK, re.compile(r"timed? ?out|Connection (?:reset|refused|aborted)|Remote end closed|IncompleteRead|name resolution|Name or service not known|getaddrinfo|Network is unreachable|EOF occurred|SSL|Unable to download|giving up after", re.I)),
+]
+
+# Reprises par classe transitoire : (nombre de reprises, attente de base, plafond), en secondes
+RETRY_POLICIES = {
+    ErrorClass.RATE_LIMITED: (5, 30, 900),
+    ErrorClass.SERVER: (4, 5, 120),
+    ErrorClass.NETWORK: (4, 2, 60),
+    ErrorClass.FORBIDDEN: (2, 2, 30),
+    ErrorClass.UNKNOWN: (1, 5, 30),
+}
+
+def classify_error(message):
+    for error_class, pattern in ERROR_PATTERNS:
+        if pattern.search(message or ""):
+            return error_class
+    return ErrorClass.UNKNOWN
+
+def retry_delay(policy, attempt):
+    # Exponentielle plafonnée, avec gigue : la moitié fixe, l'autre tirée au hasard, pour que
+    # les jobs refusés en même temps ne reviennent pas tous ensemble
+    _, base, cap = policy
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# --- Élément de la file de téléchargement ---
+# Chaque vidéo sélectionnée a son propre état, ce qui permet à plusieurs workers de traiter
+# la file en parallèle. Les interfaces y accrochent leurs propres contrôles (row, ...).
+class DownloadJob:
+    def __init__(self, entry, index, options):
+        self.entry = entry
+        self.index = index
+        self.url = entry.url
+        self.title = entry.title
+        self.options = options   # Réglages du lot (format, résolution, compatibilité)
+        self.journal_id = None
+        self.part_path = None    # Fichier .part en cours, pour la reprise après crash
+        self.staged_dir = None   # Sous-dossier de préparation à vider dans out_dir (staging_dir)
+        self.info = None         # Infos complètes préchargées (consommées au téléchargement)
+        self.info_expires = None
+        self.downloaded = None   # Octets du fichier en cours déjà décomptés par le limiteur de débit
+        # Métriques : secondes passées dans chaque phase (voir PHASES) et octets reçus
+        self.phases = {}
+        self.phase = None
+        self.phase_since = None
+        self.bytes = 0
+        self.out_dir = None
+        self.state = DownloadState.QUEUED
+        self.error = None
+        self.error_class = None
+        self.attempts = 0        # Reprises déjà programmées après une erreur transitoire
+        self.speed = 0
+        self.row = None
+        # Pause individuelle : le worker attend sur cet événement sans lâcher le transfert
+        self.unpaused = threading.Event()
+        self.unpaused.set()
+        self.paused_from = None
+        self.finished = False
+
+# --- Moteur ---
+class EngineListener:
+    # Rappels du moteur vers son client (interface Flet, ligne de commande). Ils sont appelés
+    # depuis les threads du moteur ; ceux qui ne sont pas fournis ne font rien.
+    EVENTS = ('on_job_started', 'on_job_progress', 'on_job_paused', 'on_job_resumed',
+              'on_job_converting', 'on_job_retrying', 'on_job_finished', 'on_fallback', 'on_batch_finished')
+
+    def __init__(self, **callbacks):
+        for name in self.EVENTS:
+            setattr(self, name, callbacks.pop(name, None) or (lambda *args: None))
+        if callbacks:
+            raise TypeError(f"Événements inconnus : {', '.join(callbacks)}")
+
+# Messages d'erreur indiquant un dossier de sortie inaccessible en écriture
+PERMISSION_ERRORS = ("Permission denied", "EACCES", "OSError")
+
+# --- Dossiers de sortie ---
+# Sur le stockage partagé d'Android, os.access() répond oui alors que l'écriture échoue : on
+# vérifie donc une fois, avant le lot, en créant réellement un fichier. Avec un dossier de
+# préparation (staging_dir), chaque job est téléchargé dans un sous-dossier toujours accessible
+# puis déplacé vers la destination : un refus d'écriture ne coûte plus qu'un déplacement.
+STAGING_DIR = os.path.join(APP_DATA_DIR, 'staging')
+STAGING_SUBDIR = '%(id)s'   # Un sous-dossier par vidéo : le .part y est repris après un crash
+
+def is_writable(path):
+    try:
+        os.makedirs(path, exist_ok=True)
+        fd, probe = tempfile.mkstemp(prefix='.ydp-probe-', dir=path)
+        os.close(fd)
+        os.remove(probe)
+        return True
+    except OSError:
+        return False
+
+def first_writable(candidates):
+    for path in candidates:
+        if path and is_writable(path):
+            return path
+    return None
+
+# --- Espace disque ---
+# Avant le lot, la taille de chaque vidéo est estimée d'après l'analyse (taille annoncée, sinon
+# durée x débit typique du format) : le lot est réduit aux vidéos qui tiennent dans l'espace libre
+# au lieu de découvrir un disque plein après des Go téléchargés pour rien. Les fichiers dont la
+# taille est connue sont ensuite pré-alloués (moins de fragmentation, disque plein détecté d'emblée).
+DISK_RESERVE = 256 * 1024 * 1024        # Marge laissée libre (fichiers temporaires, système)
+UNKNOWN_VIDEO_SIZE = 64 * 1024 * 1024   # Sans durée ni taille connues
+# Débits moyens en octets/s : audio 192 kbit/s, vidéo H.264 + AAC selon la hauteur maximale
+AUDIO_BYTES_PER_SECOND = 24 * 1024
+VIDEO_BYTES_PER_SECOND = {"240": 40 * 1024, "360": 80 * 1024, "480": 140 * 1024, "720": 320 * 1024, "1080": 640 * 1024}
+
+def estimate_size(entry, options):
+    audio = options.get("format") in AUDIO_FORMATS
+    if entry.filesize and not audio:
+        return entry.filesize
+    if not entry.duration:
+        return None
+    if audio:
+        return int(entry.duration * AUDIO_BYTES_PER_SECOND)
+    rate = VIDEO_BYTES_PER_SECOND.get(str(options.get("resolution")), VIDEO_BYTES_PER_SECOND["720"])
+    return int(entry.duration * rate)
+
+def free_space(path):
+    # Le dossier peut ne pas encore exister : on remonte jusqu'au premier parent existant
+    while path and not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path: break
+        path = parent
+    try:
+        return shutil.disk_usage(path or '.').free
+    except OSError as e:
+        print(f"Erreur espace disque ({path}): {e}", file=sys.stderr)
+        return None
+
+class DiskBudget:
+    # Admet les vidéos dans l'ordre tant que leur taille estimée tient dans l'espace libre
+    def __init__(self, path, reserve=DISK_RESERVE):
+        free = free_space(path)
+        self.free = None if free is None else max(0, free - reserve)
+        self.needed = 0     # Total estimé des vidéos admises
+        self.refused = 0
+
+    def admit(self, entry, options):
+        size = estimate_size(entry, options)
+        size = UNKNOWN_VIDEO_SIZE if size is None else size
+        if self.free is not None and self.needed + size > self.free:
+            self.refused += 1
+            return False
+        self.needed += size
+        return True
+
+def preallocate(f, size):
+    # Réserve réellement les blocs (posix_fallocate : Linux, Android) ; ailleurs, ou sur un système de
+    # fichiers qui ne le permet pas, le fichier est simplement étendu à sa taille finale.
+    # Un disque plein lève OSError (ENOSPC) tout de suite.
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL): raise
+    f.truncate(size)
+
+def publish_files(src_dir, dest_dir):
+    # Déplace le contenu d'un dossier de préparation ; un simple renommage sur le même volume
+    os.makedirs(dest_dir, exist_ok=True)
+    moved = []
+    for name in sorted(os.listdir(src_dir)):
+        src = os.path.join(src_dir, name)
+        if not os.path.isfile(src): continue
+        dest = os.path.join(dest_dir, name)
+        shutil.move(src, dest)
+        moved.append(dest)
+    try:
+        os.rmdir(src_dir)
+    except OSError:
+        pass
+    return moved
+
+class DownloadEngine:
+    def __init__(self, out_dir, workers=1, listener=None, ffmpeg_path=None, journal=None, archive=None, fallback_dir=None, ydl_params=None, limiter=None, metrics_file=None, summary_file=None, prefetch=PREFETCH_WORKERS, staging_dir=None, connections=DEFAULT_CONNECTIONS, stream_merge=True):
+        self.out_dir = out_dir
+        self.fallback_dir = fallback_dir    # Dossier de secours si out_dir refuse l'écriture
+        self.staging_dir = staging_dir      # Dossier de préparation des téléchargements (None : direct)
+        self.workers = workers
+        self.listener = listener or EngineListener()
+        self.ffmpeg_path = ffmpeg_path
+        self.journal = journal
+        self.archive = archive
+        self.ydl_params = ydl_params or {}  # Options yt-dlp propres à une plateforme
+        self.prefetch = prefetch            # Threads de préchargement (0 : désactivé)
+        self.connections = connections      # Connexions parallèles par fichier (plages ou fragments)
+        self.stream_merge = stream_merge    # Vidéo et audio fusionnés à la volée par ffmpeg, sans fichiers intermédiaires
+        self.limiter = limiter if limiter is not None else BandwidthLimiter()
+        self.metrics = EngineMetrics()
+        self.metrics_file = metrics_file  # Fichier texte Prometheus, réécrit à chaque fin de lot
+        self.summary_file = summary_file  # Résumés JSON des lots, une ligne par lot
+        self.last_summary = None          # Résumé du dernier lot terminé
+        self.pool = YoutubeDLPool()
+        self.stage = PostProcessStage(lambda task: self._post_process(*task), POSTPROCESS_WORKERS, POSTPROCESS_BACKLOG)
+        self.state = DownloadState.IDLE
+        self.jobs = []            # Tous les DownloadJob du lot en cours
+        self.finished = 0
+        self.more_coming = False  # L'analyse peut encore ajouter des jobs au lot
+        self._pending = deque()   # Jobs en attente d'un worker libre
+        self._active = set()      # Jobs actuellement entre les mains d'un worker
+        self._active_workers = 0
+        self._parked_workers = 0  # Workers bloqués sur un job mis en pause individuellement
+        self._prefetching = {}    # Job -> Event, pour les extractions en cours
+        self._prefetch_threads = 0
+        self._lock = threading.Lock()
+        self._unpaused = threading.Event()
+        self._unpaused.set()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    # --- Lot ---
+    def start(self, jobs, more_coming=False):
+        self._record_new(jobs)
+        self.metrics.begin_batch()
+        for job in jobs:
+            self._enter_phase(job, "queue")
+        with self._lock:
+            self.jobs = list(jobs)
+            self.finished = 0
+            self.more_coming = more_coming
+            self._pending.clear()
+            self._pending.extend(self.jobs)
+            self._active.clear()
+            self.state = DownloadState.RUNNING
+            self._unpaused.set()
+            self._idle.clear()
+        self.start_workers()
+
+    def add(self, jobs):
+        # Nouvelles entrées (analyse en continu) qui rejoignent le lot en cours
+        if not jobs: return
+        self._record_new(jobs)
+        for job in jobs:
+            self._enter_phase(job, "queue")
+        with self._lock:
+            self.jobs.extend(jobs)
+            self._pending.extend(jobs)
+        if self.state == DownloadState.RUNNING:
+            self.start_workers()
+
+    def end_of_input(self):
+        self.more_coming = False
+        # Le lot a pu se vider pendant que la pagination continuait
+        self._check_drained()
+
+    def wait(self, timeout=None):
+        return self._idle.wait(timeout)
+
+    def set_workers(self, workers):
+        self.workers = workers
+        # Si un lot est en cours, on ajuste le pool à chaud
+        if self.state == DownloadState.RUNNING:
+            self.start_workers()
+
+    def active_jobs(self):
+        with self._lock:
+            return list(self._active)
+
+    def is_archived(self, entry, options):
+        # Consulté avant tout accès réseau : une vidéo déjà récupérée dans ce profil est ignorée
+        key = archive_key(entry, options)
+        return self.archive is not None and key is not None and key in self.archive
+
+    def resume_jobs(self, first_index=0):
+        # Jobs laissés en suspens par une fermeture ou un crash, reconstruits sans ré-analyser.
+        # yt-dlp reprend de lui-même les fichiers .part présents dans le dossier de sortie.
+        if self.journal is None: return []
+        try:
+            self.journal.purge_finished()
+            rows = self.journal.unfinished()
+        except Exception as e:
+            print(f"Erreur lecture journal: {e}", file=sys.stderr)
+            return []
+        jobs = []
+        for row in rows:
+            entry = VideoEntry(first_index + len(jobs), row["video_id"], row["title"] or row["url"], row["url"], row["extractor"])
+            job = DownloadJob(entry, len(jobs), row["options"])
+            job.journal_id = row["id"]
+            job.part_path = row["part_path"]
+            jobs.append(job)
+        return jobs
+
+    # --- Contrôles globaux (tout le pool) ---
+    def pause(self):
+        if self.state != DownloadState.RUNNING: return
+        self.state = DownloadState.PAUSED
+        self._unpaused.clear()
+
+    def resume(self):
+        if self.state != DownloadState.PAUSED: return
+        self.state = DownloadState.RUNNING
+        self._unpaused.set()
+        self.start_workers()
+        # Rien à relancer (tout le reste est en pause individuelle ou terminé)
+        self._check_drained()
+
+    def cancel_all(self):
+        self.state = DownloadState.CANCELLED
+        self._unpaused.set()
+        with self._lock:
+            self._pending.clear()
+        for job in list(self.jobs):
+            if job.state in FINAL_STATES: continue
+            if not self._is_held_by_worker(job):
+                self._finish(job, DownloadState.CANCELLED)
+            job.unpaused.set()
+        self._check_drained()
+
+    # --- Contrôles individuels (par élément) ---
+    def pause_job(self, job):
+        if job.state not in (DownloadState.QUEUED, DownloadState.RUNNING): return
+        job.paused_from = job.state
+        job.unpaused.clear()
+        job.state = DownloadState.PAUSED
+        job.speed = 0
+        self.listener.on_job_paused(job)
+
+    def resume_job(self, job):
+        if job.state != DownloadState.PAUSED: return
+        if job.paused_from == DownloadState.RUNNING:
+            # Le worker est toujours bloqué dans le hook : on le libère, le transfert continue
+            job.state = DownloadState.RUNNING
+            self.listener.on_job_resumed(job)
+            job.unpaused.set()
+            return
+        job.state = DownloadState.QUEUED
+        self._enter_phase(job, "queue")
+        self.listener.on_job_resumed(job)
+        job.unpaused.set()
+        with self._lock:
+            self._pending.appendleft(job)
+        if self.state == DownloadState.RUNNING:
+            self.start_workers()
+
+    def cancel_job(self, job):
+        if job.state in FINAL_STATES: return
+        was_running = self._is_held_by_worker(job)
+        job.state = DownloadState.CANCELLED
+        job.unpaused.set()
+        if not was_running:
+            # Le job n'est pas entre les mains d'un worker : on le clôture ici
+            self._finish(job, DownloadState.CANCELLED)
+            self._check_drained()
+
+    def _is_held_by_worker(self, job):
+        return job.state == DownloadState.RUNNING or (job.state == DownloadState.PAUSED and job.paused_from == DownloadState.RUNNING)
+
+    def _is_cancelled(self, job):
+        return job.state == DownloadState.CANCELLED or self.state == DownloadState.CANCELLED
+
+    # --- Workers ---
+    def start_workers(self):
+        with self._lock:
+            wanted = min(self.workers, len(self._pending))
+            to_start = max(0, wanted - (self._active_workers - self._parked_workers))
+            self._active_workers += to_start
+        for _ in range(to_start):
+            threading.Thread(target=self._worker, daemon=True).start()
+        self._start_prefetch()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                # Le worker s'arrête si le lot est en pause/annulé, si la file est vide
+                # ou si le nombre de workers a été réduit entre temps
+                if self.state != DownloadState.RUNNING or not self._pending or self._active_workers - self._parked_workers > self.workers:
+                    self._active_workers -= 1
+                    break
+                job = self._pending.popleft()
+            if job.state != DownloadState.QUEUED: continue
+            # La tête de file a avancé : un job de plus entre dans la fenêtre de préchargement
+            self._start_prefetch()
+            self._download(job)
+        self._check_drained()
+
+    # --- Préchargement ---
+    def _prefetch_candidate(self):
+        # Appelé sous self._lock : premier job de la fenêtre encore sans infos
+        for i, job in enumerate(self._pending):
+            if i >= PREFETCH_AHEAD: break
+            if job.state == DownloadState.QUEUED and job.info is None and job not in self._prefetching:
+                return job
+        return None
+
+    def _start_prefetch(self):
+        with self._lock:
+            if self.state != DownloadState.RUNNING or self._prefetch_threads >= self.prefetch or self._prefetch_candidate() is None:
+                return
+            self._prefetch_threads += 1
+        threading.Thread(target=self._prefetcher, daemon=True).start()
+
+    def _prefetcher(self):
+        while True:
+            with self._lock:
+                job = self._prefetch_candidate() if self.state == DownloadState.RUNNING else None
+                if job is None:
+                    self._prefetch_threads -= 1
+                    return
+                done = self._prefetching[job] = threading.Event()
+            try:
+                self._prefetch_info(job)
+            except Exception as e:
+                # Le worker refera simplement l'extraction (et rapportera l'erreur s'il y a lieu)
+                print(f"Erreur préchargement ({job.url}): {e}", file=sys.stderr)
+            finally:
+                with self._lock:
+                    del self._prefetching[job]
+                done.set()
+
+    def _prefetch_info(self, job):
+        # Même profil (donc mêmes options d'extraction) que le téléchargement, sans les hooks
+        options, out_dir = job.options, self._work_dir(job)
+        with self.pool.lease(self._profile(options, out_dir), lambda: self._ydl_opts(options, out_dir)) as ydl:
+            info = ydl.extract_info(job.url, download=False, process=False)
+        # Redirection ou playlist : rien d'exploitable directement, le worker extraira
+        if not info or info.get('_type', 'video') != 'video': return
+        job.info_expires = info_expiry(info, time.time())
+        job.info = info
+
+    def _take_prefetched(self, job):
+        # Une extraction déjà en cours pour ce job : l'attendre coûte moins que la refaire
+        with self._lock:
+            done = self._prefetching.get(job)
+        while done is not None and not done.wait(0.5):
+            if job.state == DownloadState.CANCELLED or self.state == DownloadState.CANCELLED: break
+        info, job.info = job.info, None
+        if info is None or time.time() > job.info_expires: return None
+        return info
+
+    def _check_drained(self):
+        # Appelé par les workers, l'étape de conversion, les annulations et la fin de l'analyse
+        with self._lock:
+            if self.state == DownloadState.IDLE or self._active_workers: return
+            if self.state == DownloadState.CANCELLED:
+                outcome = DownloadState.CANCELLED
+            elif self.finished == len(self.jobs) and not self.more_coming:
+                outcome = DownloadState.DONE
+            else:
+                return
+            self.state = DownloadState.IDLE
+        self.last_summary = self.metrics.batch_summary(outcome)
+        self._export_metrics()
+        self.listener.on_batch_finished(outcome)
+        self._idle.set()
+
+    def _wait_while_paused(self, job):
+        # Pause "en place" : on bloque le worker dans le hook au lieu de lever une exception.
+        # Le YoutubeDL, les URLs de flux déjà résolues et le fichier .part / les fragments
+        # restent intacts ; à la reprise, yt-dlp continue depuis l'offset déjà écrit
+        # (requête Range si la connexion a été fermée entre temps).
+        parked = False
+        try:
+            while True:
+                if self.state == DownloadState.CANCELLED or job.state == DownloadState.CANCELLED:
+                    raise Exception("CANCELLED")
+                if self.state == DownloadState.PAUSED:
+                    self._unpaused.wait(0.5)
+                elif job.state == DownloadState.PAUSED:
+                    if not parked:
+                        # Le worker est immobilisé : un worker de remplacement prend la suite de la file
+                        parked = True
+                        with self._lock:
+                            self._parked_workers += 1
+                        self.start_workers()
+                    job.unpaused.wait(0.5)
+                else:
+                    break
+        finally:
+            if parked:
+                with self._lock:
+                    self._parked_workers -= 1
+
+    def _progress_hook(self, job, d):
+        self._wait_while_paused(job)
+
+        if d['status'] == 'downloading':
+            # Le chemin du .part n'est journalisé qu'à son apparition, pas à chaque tick
+            part_path = d.get('tmpfilename')
+            if part_path and part_path != job.part_path:
+                job.part_path = part_path
+                self._record(job)
+                if self.staging_dir:
+                    job.staged_dir = os.path.dirname(part_path)
+            if job.phase != "transfer":
+                self._enter_phase(job, "transfer")
+            # Débit instantané, lu par les clients pour la vitesse totale du lot
+            job.speed = d.get('speed') or 0
+            self.listener.on_job_progress(job, d)
+            self._throttle(job, d.get('downloaded_bytes') or 0)
+        elif d['status'] == 'finished':
+            # Le compteur d'octets de yt-dlp repart de zéro au fichier suivant (vidéo puis audio)
+            job.downloaded = None
+            job.speed = 0
+            job.bytes += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            if self.staging_dir and d.get('filename'):
+                job.staged_dir = os.path.dirname(d['filename'])
+            self._enter_phase(job, "postprocess")
+
+    def _pp_hook(self, job, d):
+        # Hooks de post-traitement yt-dlp : fusion, extraction audio, déplacement des fichiers...
+        if d['status'] == 'started':
+            self._enter_phase(job, POSTPROCESSOR_PHASES.get(d.get('postprocessor'), "postprocess"))
+        elif d['status'] == 'finished':
+            self._enter_phase(job, "postprocess")
+
+    def _enter_phase(self, job, phase):
+        # Clôt la phase en cours du job et en ouvre une nouvelle (None : fin du job)
+        now = time.monotonic()
+        if job.phase is not None:
+            job.phases[job.phase] = job.phases.get(job.phase, 0) + now - job.phase_since
+        job.phase, job.phase_since = phase, now
+
+    def _throttle(self, job, downloaded):
+        # Le premier appel sert de référence : un .part repris n'est pas décompté une seconde fois
+        previous, job.downloaded = job.downloaded, downloaded
+        if previous is None or not self.limiter: return
+        cancelled = lambda: job.state == DownloadState.CANCELLED or self.state == DownloadState.CANCELLED
+        self.limiter.consume(job, downloaded - previous, cancelled)
+
+    def _work_dir(self, job):
+        # Dossier où yt-dlp écrit : la destination, ou le sous-dossier de préparation du job
+        if self.staging_dir:
+            return os.path.join(self.staging_dir, STAGING_SUBDIR)
+        return job.out_dir or self.out_dir
+
+    def _profile(self, options, out_dir):
+        # Clé du pool : deux lots avec les mêmes réglages partagent les mêmes instances
+        return (json.dumps(options, sort_keys=True), out_dir)
+
+    def _ydl_opts(self, options, out_dir):
+        ydl_opts = build_ydl_opts(options, out_dir, self.ffmpeg_path, ffmpeg_capabilities(self.ffmpeg_path))
+        ydl_opts['concurrent_fragment_downloads'] = self.connections
+        ydl_opts['ydp_stream_merge'] = self.stream_merge and bool(self.ffmpeg_path)
+        return dict(ydl_opts, **self.ydl_params)
+
+    def _run_ydl(self, job, tasks):
+        options, out_dir = job.options, self._work_dir(job)
+        info = self._take_prefetched(job)
+        with self.pool.lease(self._profile(options, out_dir), lambda: self._ydl_opts(options, out_dir), hook=lambda d: self._progress_hook(job, d), pp_hook=lambda d: self._pp_hook(job, d)) as ydl:
+            ydl.deferred = tasks
+            try:
+                retcode = None
+                if info is not None:
+                    # Pas de seconde extraction : sélection du format et téléchargement directs
+                    try:
+                        ydl.process_ie_result(info, download=True)
+                        retcode = ydl._download_retcode
+                    except Exception as e:
+                        if self._is_cancelled(job): raise
+                        print(f"Infos préchargées inutilisables ({job.url}): {e}", file=sys.stderr)
+                    if retcode and self._is_cancelled(job): return False
+                    if retcode and classify_error(ydl.last_error or "") != ErrorClass.FORBIDDEN:
+                        # 429, 5xx, réseau... : une seconde extraction ne ferait que doubler la
+                        # charge, l'échec revient au moteur qui applique son attente
+                        job.error = ydl.last_error
+                        return False
+                if retcode != 0:
+                    # Pas d'infos, infos inutilisables ou URL de flux expirée (403) : extraction
+                    # fraîche, comme le fait yt-dlp avec --load-info-json
+                    ydl._download_retcode = 0
+                    ydl.last_error = None
+                    tasks.clear()
+                    retcode = ydl.download([job.url])
+            finally:
+                ydl.deferred = None
+            job.error = None if retcode == 0 else ydl.last_error
+        return retcode == 0
+
+    def _download(self, job):
+        job.state = DownloadState.RUNNING
+        job.error = None
+        job.out_dir = self.out_dir
+        job.downloaded = None
+        self._enter_phase(job, "extract")
+        self._record(job)
+        with self._lock:
+            self._active.add(job)
+        self.listener.on_job_started(job)
+
+        tasks = []
+        try:
+            ok = self._run_ydl(job, tasks)
+        except Exception as e:
+            ok = False
+            job.error = str(e)
+            if self.fallback_dir and job.out_dir != self.fallback_dir and any(m in job.error for m in PERMISSION_ERRORS):
+                # Dossier de sortie refusé : on retente dans le dossier de secours
+                try:
+                    os.makedirs(self.fallback_dir, exist_ok=True)
+                    # Les workers suivants écriront directement dans le dossier de secours
+                    self.out_dir = job.out_dir = self.fallback_dir
+                    self.listener.on_fallback(job, self.fallback_dir)
+                    tasks = []
+                    job.downloaded = None
+                    ok = self._run_ydl(job, tasks)
+                except Exception as e2:
+                    print(f"Echec fallback: {e2}", file=sys.stderr)
+                    job.error = str(e2)
+
+        # Avec 'ignoreerrors', l'exception levée par le hook peut être absorbée par yt-dlp :
+        # on se fie donc aux états pour savoir pourquoi le téléchargement s'est arrêté.
+        if self.state == DownloadState.CANCELLED or job.state == DownloadState.CANCELLED:
+            self._finish(job, DownloadState.CANCELLED)
+        elif not ok:
+            self._fail_or_retry(job)
+        elif tasks:
+            self._hand_over_to_stage(job, tasks)
+        else:
+            self._complete(job)
+
+    def _fail_or_retry(self, job):
+        job.error_class = classify_error(job.error)
+        policy = RETRY_POLICIES.get(job.error_class)
+        retried = policy is not None and job.attempts < policy[0]
+        self.metrics.observe_error(job.error_class, retried)
+        if not retried:
+            self._finish(job, DownloadState.FAILED)
+            return
+        # Le job quitte le worker, qui passe aussitôt au suivant ; un minuteur le remet en file
+        job.attempts += 1
+        delay = retry_delay(policy, job.attempts)
+        job.state = DownloadState.QUEUED
+        job.speed = 0
+        self.limiter.release(job)
+        self._enter_phase(job, "retry_wait")
+        self._record(job)
+        with self._lock:
+            self._active.discard(job)
+        self.listener.on_job_retrying(job, delay)
+        timer = threading.Timer(delay, self._requeue, (job, job.attempts))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, job, attempt):
+        # Rien à faire si le job a été annulé, mis en pause, relancé ou repris entre temps
+        with self._lock:
+            if job.state != DownloadState.QUEUED or job.attempts != attempt or job in self._pending: return
+            self._pending.appendleft(job)
+        self._enter_phase(job, "queue")
+        if self.state == DownloadState.RUNNING:
+            self.start_workers()
+
+    def _hand_over_to_stage(self, job, tasks):
+        job.state = DownloadState.CONVERTING
+        job.speed = 0
+        self._enter_phase(job, "stage_wait")
+        self._record(job)
+        with self._lock:
+            self._active.discard(job)
+        self.listener.on_job_converting(job, False)
+        # Contre-pression : le worker réseau reste ici tant que l'étape est saturée
+        cancelled = lambda: job.state == DownloadState.CANCELLED or self.state == DownloadState.CANCELLED
+        if not self.stage.submit((job, tasks), cancelled) and not job.finished:
+            self._finish(job, DownloadState.CANCELLED)
+
+    def _post_process(self, job, tasks):
+        # Exécuté par un worker de l'étape de post-traitement
+        if job.finished: return
+        self._enter_phase(job, "postprocess")
+        self.listener.on_job_converting(job, True)
+        options, out_dir = job.options, self._work_dir(job)
+        try:
+            with self.pool.lease(("postprocess",) + self._profile(options, out_dir), lambda: self._ydl_opts(options, out_dir), pp_hook=lambda d: self._pp_hook(job, d)) as ydl:
+                for filename, info, files_to_move in tasks:
+                    # La fusion MP4 a été préparée par l'instance de téléchargement : on la rattache à
+                    # celle-ci, sans les hooks de l'instance d'origine (qui sert peut-être déjà un autre job)
+                    for pp in info.get('__postprocessors') or []:
+                        pp._progress_hooks.clear()
+                        pp.set_downloader(ydl)
+                    ydl.post_process(filename, info, files_to_move)
+                ok = ydl._download_retcode == 0
+                job.error = None if ok else ydl.last_error
+        except Exception as e:
+            ok = False
+            job.error = str(e)
+
+        if not job.finished:
+            if ok:
+                self._complete(job)
+            else:
+                # Le fichier est déjà téléchargé : un échec de conversion n'est pas repris
+                job.error_class = classify_error(job.error)
+                self.metrics.observe_error(job.error_class, False)
+                self._finish(job, DownloadState.FAILED)
+        self._check_drained()
+
+    def _complete(self, job):
+        if job.staged_dir and not self._publish(job):
+            return
+        key = archive_key(job.entry, job.options)
+        if self.archive is not None and key is not None:
+            try:
+                self.archive.add(key)
+            except Exception as e:
+                print(f"Erreur archive: {e}", file=sys.stderr)
+        self._finish(job, DownloadState.DONE)
+
+    def _publish(self, job):
+        # Le fichier est complet dans le dossier de préparation : seul le déplacement peut
+        # être refusé, et le dossier de secours le reçoit alors sans nouveau téléchargement
+        self._enter_phase(job, "move")
+        try:
+            publish_files(job.staged_dir, job.out_dir)
+            return True
+        except OSError as e:
+            job.error = str(e)
+        if self.fallback_dir and job.out_dir != self.fallback_dir and any(m in job.error for m in PERMISSION_ERRORS):
+            try:
+                # Les jobs suivants seront déplacés directement dans le dossier de secours
+                if self.out_dir != self.fallback_dir:
+                    self.out_dir = self.fallback_dir
+                    self.listener.on_fallback(job, self.fallback_dir)
+                job.out_dir = self.fallback_dir
+                publish_files(job.staged_dir, job.out_dir)
+                job.error = None
+                return True
+            except OSError as e2:
+                print(f"Echec fallback: {e2}", file=sys.stderr)
+                job.error = str(e2)
+        # Le fichier reste dans le dossier de préparation
+        job.error_class = ErrorClass.DISK
+        self.metrics.observe_error(job.error_class, False)
+        self._finish(job, DownloadState.FAILED)
+        return False
+
+    def _finish(self, job, state):
+        with self._lock:
+            if job.finished: return
+            job.finished = True
+            self.finished += 1
+            self._active.discard(job)
+        job.state = state
+        job.speed = 0
+        self.limiter.release(job)
+        self._enter_phase(job, None)
+        self.metrics.observe(job)
+        self._record(job)
+        self.listener.on_job_finished(job)
+
+    def _export_metrics(self):
+        try:
+            if self.metrics_file:
+                self.metrics.write_textfile(self.metrics_file)
+            if self.summary_file:
+                with open(self.summary_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(self.last_summary, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Erreur export métriques: {e}", file=sys.stderr)
+
+    # --- Journal ---
+    def _record_new(self, jobs):
+        if self.journal is None: return
+        try:
+            self.journal.add([job for job in jobs if job.journal_id is None])
+        except Exception as e:
+            print(f"Erreur journal: {e}", file=sys.stderr)
+
+    def _record(self, job):
+        if self.journal is None: return
+        try:
+            self.journal.update(job)
+        except Exception as e:
+            print(f"Erreur journal: {e}", file=sys.stderr)
+
+# --- Synchronisation incrémentale ---
+# Pour les chaînes revérifiées chaque semaine : les identifiants les plus récents de chaque
+# source sont gardés, et l'analyse s'arrête dès qu'elle retombe sur des vidéos connues, sans
+# charger les pages suivantes. Seules les nouveautés sont mises en file. Suppose un ordre du plus
+# récent au plus ancien (onglet Vidéos d'une chaîne) ; la première synchronisation parcourt tout.
+# L'état n'est enregistré qu'à la fin du lot, et le point de synchronisation n'avance pas au-delà
+# d'une vidéo ni téléchargée ni archivée (échec, annulation, décochée, espace disque) : elle sera
+# reproposée la fois suivante.
+SYNC_FILE = os.path.join(APP_DATA_DIR, 'sync_state.sqlite3')
+SYNC_KEEP_IDS = 100     # Identifiants gardés par source : une vidéo supprimée n'empêche pas l'arrêt
+SYNC_STOP_AFTER = 3     # Vidéos connues d'affilée avant d'arrêter (une seule peut être remontée)
+
+class SyncState:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " key TEXT PRIMARY KEY, url TEXT NOT NULL, ids TEXT NOT NULL, synced REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def known(self, key):
+        # Clés (entry_key) déjà vues, de la plus récente à la plus ancienne ; None : jamais synchronisée
+        with self._lock:
+            row = self._db.execute("SELECT ids FROM sources WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, key, url, seen, known=None):
+        # seen : clés rencontrées cette fois, dans l'ordre de la source ; les anciennes complètent
+        ids = list(dict.fromkeys([*seen, *(known or [])]))[:SYNC_KEEP_IDS]
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (key, url, json.dumps(ids), time.time()))
+
+# --- Analyse de plusieurs sources ---
+# Une douzaine de playlists ou de chaînes collées d'un coup sont résolues en parallèle (pool
+# borné), mais la liste reste groupée par source. Une seule source à la fois y est "ouverte" et
+# reçoit ses entrées au fil de la pagination ; les autres mettent les leurs de côté et sont
+# versées d'un bloc à leur tour, les sources déjà terminées en premier. Une vidéo déjà vue dans
+# une source précédente est écartée (entry_key).
+ANALYZE_WORKERS = 4
+
+class AnalysisListener(EngineListener):
+    # on_entries et on_source_opened/finished sont appelés un à la fois, dans l'ordre de la liste ;
+    # on_source_started/progress depuis n'importe quel thread d'analyse
+    EVENTS = ('on_source_started', 'on_source_progress', 'on_source_opened', 'on_entries', 'on_source_finished')
+
+class AnalysisSource:
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.title = None       # Titre de la playlist ou de la chaîne, dès que yt-dlp le donne
+        self.state = self.QUEUED
+        self.error = None
+        self.cached = False
+        self.found = 0          # Entrées reçues de yt-dlp (ou du cache)
+        self.added = 0          # Entrées versées dans la liste, doublons exclus
+        self.duplicates = 0
+        self.synced = False     # Déjà synchronisée : seules les nouveautés sont comptées dans found
+        self.known = 0          # Vidéos connues rencontrées avant l'arrêt
+        self.stopped = False    # Pagination arrêtée sur des vidéos connues
+        self.prior = None       # Clés connues avant cette analyse (None : jamais synchronisée)
+        self.seen = []          # Clés rencontrées, dans l'ordre de la source
+        self.start = None       # Index de sa première entrée dans la liste (None : pas encore ouverte)
+        self.closed = False
+        self.pending = []       # Entrées en attente de leur tour
+
+class MultiSourceAnalysis:
+    def __init__(self, pool, urls, listener=None, cache=None, refresh=False, workers=ANALYZE_WORKERS, batch_size=ANALYZE_BATCH_SIZE, sync=None):
+        self.pool = pool
+        self.sources = [AnalysisSource(i, url) for i, url in enumerate(urls)]
+        self.listener = listener or AnalysisListener()
+        self.cache = cache
+        self.refresh = refresh      # Ignore le cache à la lecture (il est tout de même mis à jour)
+        self.sync = sync            # SyncState : seules les nouveautés de chaque source (None : tout)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.count = 0              # Entrées versées dans la liste
+        self.duplicates = 0
+        self._seen = set()
+        self._todo = deque(self.sources)
+        self._open = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        # Bloquant : revient quand toutes les sources ont été versées dans la liste
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(min(self.workers, len(self.sources)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.sources
+
+    def save_sync(self, settled):
+        # Appelé par le client une fois le lot terminé ; settled(clé) : vidéo téléchargée ou archivée.
+        # Seules les clés plus anciennes que la dernière vidéo non réglée sont retenues : la
+        # prochaine analyse ne peut donc pas s'arrêter avant de l'avoir reproposée.
+        if not self.sync: return
+        for source in self.sources:
+            if source.state != AnalysisSource.DONE: continue
+            prior = set(source.prior or ())
+            unsettled = [i for i, key in enumerate(source.seen) if key not in prior and not settled(key)]
+            seen = source.seen[unsettled[-1] + 1:] if unsettled else source.seen
+            try:
+                self.sync.update(canonical_url(source.url), source.url, seen, source.prior)
+            except Exception as e:
+                print(f"Erreur état de synchronisation ({source.url}): {e}", file=sys.stderr)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._todo: return
+                source = self._todo.popleft()
+            self._resolve(source)
+
+    def _resolve(self, source):
+        source.state = AnalysisSource.RUNNING
+        self.listener.on_source_started(source)
+        try:
+            cache_key = canonical_url(source.url)
+            known = source.prior = self.sync.known(cache_key) if self.sync else None
+            source.synced = known is not None
+            # Une source déjà synchronisée est relue en ligne : le cache n'aurait pas les nouveautés
+            cached = self.cache.get(cache_key) if self.cache and not self.refresh and known is None else None
+            source.cached = cached is not None
+            if isinstance(cached, dict):
+                source.title = cached.get('title')
+                cached = cached['entries']
+            on_info = lambda info: setattr(source, 'title', info.get('title'))
+            entries = cached if cached is not None else iter_entries(self.pool, source.url, on_info)
+            known_keys = set(known or ())
+            streak = 0
+            analysed = []
+            batch = []
+            try:
+                for vid in entries:
+                    if self.sync:
+                        key = entry_key(vid)
+                        source.seen.append(key)
+                        if key in known_keys:
+                            source.known += 1
+                            streak += 1
+                            if streak >= SYNC_STOP_AFTER:
+                                source.stopped = True
+                                break
+                            continue
+                        streak = 0
+                    analysed.append(vid)
+                    batch.append(vid)
+                    if len(batch) >= self.batch_size:
+                        self._push(source, batch)
+                        batch = []
+            finally:
+                # Fermer le générateur arrête la pagination de yt-dlp et rend l'instance au pool
+                if cached is None: entries.close()
+            self._push(source, batch)
+            # Liste partielle (nouveautés seulement) : elle ne remplace pas celle du cache
+            if cached is None and self.cache and known is None:
+                self.cache.put(cache_key, {"title": source.title, "entries": analysed})
+            source.state = AnalysisSource.DONE
+        except Exception as e:
+            source.error = str(e)
+            source.state = AnalysisSource.FAILED
+        with self._lock:
+            if self._open is source:
+                self._close(source)
+            self._advance()
+
+    def _push(self, source, batch):
+        source.found += len(batch)
+        with self._lock:
+            if self._open is None:
+                self._advance()
+                if self._open is None: self._open_source(source)
+            if self._open is source:
+                self._deliver(source, batch)
+            else:
+                source.pending.extend(batch)
+        self.listener.on_source_progress(source)
+
+    def _advance(self):
+        # Appelé sous self._lock quand aucune source n'est ouverte : les sources terminées sont
+        # versées d'un bloc, puis la première qui a des entrées en attente est ouverte
+        while self._open is None:
+            waiting = [s for s in self.sources if not s.closed and s.state in (AnalysisSource.DONE, AnalysisSource.FAILED)]
+            if not waiting:
+                waiting = [s for s in self.sources if not s.closed and s.pending]
+            if not waiting: return
+            source = waiting[0]
+            self._open_source(source)
+            batch, source.pending = source.pending, []
+            self._deliver(source, batch)
+            if source.state in (AnalysisSource.DONE, AnalysisSource.FAILED):
+                self._close(source)
+
+    def _open_source(self, source):
+        source.start = self.count
+        self._open = source
+        self.listener.on_source_opened(source)
+
+    def _close(self, source):
+        source.closed = True
+        self._open = None
+        self.listener.on_source_finished(source)
+
+    def _deliver(self, source, batch):
+        new = []
+        for vid in batch:
+            key = entry_key(vid)
+            if key in self._seen:
+                source.duplicates += 1
+                continue
+            self._seen.add(key)
+            new.append(vid)
+        self.duplicates += len(batch) - len(new)
+        source.added += len(new)
+        self.count += len(new)
+        if new: self.listener.on_entries(source, new)
+
+# --- Mode sans interface ---
+# python downloader_engine.py --batch urls.txt --workers 8 --format mp3 --out DIR
+# Une ligne JSON par vidéo sur la sortie standard ({"event": "job", ...}), puis un résumé
+# ({"event": "summary", ...}). Les messages de yt-dlp vont sur la sortie d'erreur.
+EXIT_OK = 0             # Tout a été téléchargé (ou était déjà dans l'archive)
+EXIT_FAILED = 1         # Au moins une vidéo ou une URL a échoué
+EXIT_USAGE = 2          # Arguments ou fichier de lot invalides
+EXIT_INTERRUPTED = 130  # Ctrl+C : les téléchargements en cours ont été annulés
+
+CLI_JOURNAL_FILE = os.path.join(APP_DATA_DIR, 'jobs-cli.sqlite3')
+CLI_DEFAULT_WORKERS = 3
+
+class JsonLinesReporter:
+    def __init__(self, out):
+        self.out = out
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.out.flush()
+
+    def job(self, job, state=None):
+        self.emit({
+            "event": "job",
+            "url": job.url,
+            "id": job.entry.id,
+            "title": job.title,
+            "state": state or job.state,
+            "error": job.error,
+            "error_class": job.error_class,
+            "attempts": job.attempts,
+            "bytes": job.bytes,
+            "phases": {phase: round(seconds, 3) for phase, seconds in job.phases.items()},
+        })
+
+def read_batch_file(path):
+    f = sys.stdin if path == "-" else open(path, 'r', encoding='utf-8')
+    try:
+        return parse_url_list(f.read())
+    finally:
+        if f is not sys.stdin: f.close()
+
+def open_optional(factory, *args):
+    try:
+        return factory(*args)
+    except Exception as e:
+        print(f"{factory.__name__} indisponible: {e}", file=sys.stderr)
+        return None
+
+def run_batch(argv=None):
+    parser = argparse.ArgumentParser(description="YouTube Downloader Pro : téléchargement en lot sans interface.")
+    parser.add_argument("--batch", required=True, metavar="FICHIER", help="fichier d'URLs, une par ligne ('-' pour l'entrée standard)")
+    parser.add_argument("--out", required=True, metavar="DOSSIER", help="dossier de destination")
+    parser.add_argument("--workers", type=int, default=CLI_DEFAULT_WORKERS, help=f"téléchargements simultanés (défaut : {CLI_DEFAULT_WORKERS})")
+    parser.add_argument("--format", type=str.upper, choices=["MP4", *AUDIO_FORMATS], default="MP4", help="MP4, AUDIO (codec de la source, sans réencodage), M4A, OPUS (copie du flux si la source le permet) ou MP3 (réencodé)")
+    parser.add_argument("--resolution", default="720", help="hauteur maximale en MP4 (défaut : 720)")
+    parser.add_argument("--compat", action="store_true", help="mode compatibilité (H.264/AAC)")
+    parser.add_argument("--no-archive", action="store_true", help="retélécharger même les vidéos déjà archivées")
+    parser.add_argument("--no-cache", action="store_true", help="ignorer le cache des analyses")
+    parser.add_argument("--no-stream-merge", action="store_true", help="fusionner vidéo et audio après leur téléchargement complet, par fichiers")
+    parser.add_argument("--no-space-check", action="store_true", help="ne pas écarter les vidéos qui dépasseraient l'espace libre estimé")
+    parser.add_argument("--resume", action="store_true", help="reprendre d'abord les jobs interrompus d'une exécution précédente")
+    parser.add_argument("--limit-rate", metavar="DÉBIT", help="débit total maximal (ex : 2M), hors plages horaires")
+    parser.add_argument("--job-limit-rate", metavar="DÉBIT", help="débit maximal par téléchargement")
+    parser.add_argument("--metrics-file", metavar="FICHIER", help="écrit les métriques au format texte Prometheus en fin de lot (collecteur textfile)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="sert les métriques sur http://127.0.0.1:PORT/metrics pendant l'exécution")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, metavar="N", help=f"connexions parallèles par fichier, réduites automatiquement sur HTTP 429 (défaut : {DEFAULT_CONNECTIONS}, 1 : une seule)")
+    parser.add_argument("--analyze-workers", type=int, default=ANALYZE_WORKERS, metavar="N", help=f"URLs (playlists, chaînes) analysées en parallèle (défaut : {ANALYZE_WORKERS})")
+    parser.add_argument("--sync", action="store_true", help="nouveautés seulement : l'analyse de chaque URL s'arrête sur les vidéos déjà vues lors d'une synchronisation précédente")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_WORKERS, metavar="N", help=f"extractions complètes menées à l'avance en tête de file (défaut : {PREFETCH_WORKERS}, 0 : désactivé)")
+    parser.add_argument("--window", action="append", default=[], metavar="HH:MM-HH:MM=DÉBIT", help="débit total sur une plage horaire (ex : 08:00-19:00=2M, 0 = illimité) ; répétable")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers doit être supérieur ou égal à 1")
+    try:
+        limiter = BandwidthLimiter(parse_rate(args.limit_rate), [parse_bandwidth_window(w) for w in args.window], parse_rate(args.job_limit_rate))
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        urls = read_batch_file(args.batch)
+    except OSError as e:
+        print(f"Erreur lecture {args.batch}: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    options = {"format": args.format, "resolution": args.resolution.lower().rstrip("p"), "compatibility": args.compat}
+    ffmpeg_path = find_ffmpeg()
+    if args.format == "MP3" and not ffmpeg_path:
+        print("Erreur : ffmpeg est nécessaire pour le format MP3", file=sys.stderr)
+        return EXIT_USAGE
+    capabilities = ffmpeg_capabilities(ffmpeg_path)
+    if args.format == "MP3" and capabilities and not capabilities.can_encode("libmp3lame"):
+        print(f"Attention : ffmpeg {capabilities.version} n'a pas d'encodeur MP3, l'audio sera gardé en AAC (.m4a)", file=sys.stderr)
+    try:
+        os.makedirs(args.out, exist_ok=True)
+    except OSError as e:
+        print(f"Erreur dossier {args.out}: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    reporter = JsonLinesReporter(sys.stdout)
+    engine = DownloadEngine(
+        args.out, args.workers,
+        listener=EngineListener(on_job_finished=reporter.job),
+        ffmpeg_path=ffmpeg_path,
+        journal=open_optional(JobJournal, CLI_JOURNAL_FILE),
+        archive=None if args.no_archive else open_optional(DownloadArchive, ARCHIVE_FILE),
+        ydl_params={'quiet': True, 'noprogress': True},
+        limiter=limiter,
+        metrics_file=args.metrics_file,
+        prefetch=max(0, args.prefetch),
+        connections=max(1, min(MAX_CONNECTIONS, args.connections)),
+        stream_merge=not args.no_stream_merge,
+    )
+    if args.metrics_port:
+        try:
+            serve_metrics(engine.metrics, args.metrics_port)
+        except OSError as e:
+            print(f"Erreur port {args.metrics_port}: {e}", file=sys.stderr)
+            return EXIT_USAGE
+    cache = None if args.no_cache else open_optional(MetadataCache, CACHE_FILE, 24 * 3600, 64 * 1024 * 1024)
+    budget = None if args.no_space_check else DiskBudget(args.out)
+    sync = open_optional(SyncState, SYNC_FILE) if args.sync else None
+    settled = set()     # Clés des vidéos téléchargées ou déjà archivées (point de synchronisation)
+
+    started = time.time()
+    skipped = 0
+    interrupted = False
+    engine.start(engine.resume_jobs() if args.resume else [], more_coming=True)
+    index = len(engine.jobs)
+
+    def add_entries(source, entries):
+        # Appelé un lot à la fois, dans l'ordre des sources : index reste contigu
+        nonlocal index, skipped
+        batch = []
+        for vid in entries:
+            entry = entry_from_info(index, vid)
+            index += 1
+            job = DownloadJob(entry, entry.index, options)
+            if engine.is_archived(entry, options):
+                skipped += 1
+                settled.add(video_entry_key(entry))
+                reporter.job(job, state="skipped")
+                continue
+            if budget and not budget.admit(entry, options):
+                job.error, job.error_class = "Espace disque insuffisant", ErrorClass.DISK
+                reporter.job(job, state=DownloadState.FAILED)
+                continue
+            batch.append(job)
+        engine.add(batch)
+
+    def source_finished(source):
+        if source.state == AnalysisSource.FAILED:
+            reporter.emit({"event": "analysis_error", "url": source.url, "error": source.error})
+        else:
+            event = {"event": "source", "url": source.url, "title": source.title, "entries": source.found, "duplicates": source.duplicates, "cached": source.cached}
+            if source.synced:
+                event.update(known=source.known, stopped=source.stopped)
+            reporter.emit(event)
+
+    analysis = MultiSourceAnalysis(engine.pool, urls, AnalysisListener(on_entries=add_entries, on_source_finished=source_finished), cache=cache, workers=max(1, args.analyze_workers), sync=sync)
+    try:
+        # Ctrl+C reste pris en compte pendant l'analyse : elle tourne dans son propre thread
+        analysis_thread = threading.Thread(target=analysis.run, daemon=True)
+        analysis_thread.start()
+        while analysis_thread.is_alive():
+            analysis_thread.join(0.5)
+        engine.end_of_input()
+        # Attente par tranches : Ctrl+C reste pris en compte
+        while not engine.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        interrupted = True
+        engine.cancel_all()
+        engine.wait(10)
+    settled.update(video_entry_key(job.entry) for job in engine.jobs if job.state == DownloadState.DONE)
+    analysis.save_sync(settled.__contains__)
+
+    analysis_errors = sum(source.state == AnalysisSource.FAILED for source in analysis.sources)
+    counts = {state: 0 for state in FINAL_STATES}
+    for job in engine.jobs:
+        if job.state in counts: counts[job.state] += 1
+    reporter.emit({
+        "event": "summary",
+        "done": counts[DownloadState.DONE],
+        "failed": counts[DownloadState.FAILED],
+        "cancelled": counts[DownloadState.CANCELLED],
+        "skipped": skipped,
+        "no_space": budget.refused if budget else 0,
+        "analysis_errors": analysis_errors,
+        "duplicates": analysis.duplicates,
+        "elapsed": round(time.time() - started, 2),
+        # Temps par phase (total, moyenne, médiane, max) sur tout le lot
+        "bytes": engine.last_summary["bytes"] if engine.last_summary else None,
+        "phases": engine.last_summary["phases"] if engine.last_summary else None,
+        # Erreurs par classe : reprises (transitoires) et échecs définitifs
+        "errors": engine.last_summary["errors"] if engine.last_summary else None,
+    })
+    engine.pool.close()
+    if interrupted:
+        return EXIT_INTERRUPTED
+    if counts[DownloadState.FAILED] or analysis_errors or (budget and budget.refused):
+        return EXIT_FAILED
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(run_batch())
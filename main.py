@@ -1,16 +1,19 @@
 import flet as ft
-import yt_dlp
 import os
 import threading
 import platform
-import time
 import certifi # FIX: Import obligatoire pour que le module soit inclus dans l'APK
+from downloader_engine import (
+    DownloadState, DownloadEngine, EngineListener, DownloadJob, ProgressBus, DiskBudget, ErrorClass,
+    MultiSourceAnalysis, AnalysisListener, AnalysisSource, load_config, save_config, warm_up, first_writable, entry_from_info, parse_url_list,
+    ANSI_ESCAPE, STAGING_DIR,
+)
 
 # --- Système de Traduction Simplifié (FR/EN) ---
 TRANSLATIONS = {
     "fr": {
         "window_title": "YouTube Downloader PRO",
-        "url_label": "Lien (Vidéo/Playlist)",
+        "url_label": "Liens (vidéos, playlists, chaînes)",
         "analyze_btn": "ANALYSER",
         "col_left_title": "Vidéos",
         "select_all": "Tout cocher",
@@ -31,11 +34,18 @@ TRANSLATIONS = {
         "error_perm": "Permission refusée -> Tentative dossier secours...",
         "fallback_ok": "Sauvegardé dans dossier privé (Android/data)",
         "skipped": "Ignorée...",
-        "processing": "{} / {}"
+        "processing": "{} / {}",
+        "workers_label": "Simultanés",
+        "queued": "En attente",
+        "batch_progress": "{} / {} terminés",
+        "retrying": "Nouvel essai dans {} s...",
+        "no_space": "Espace insuffisant : {} vidéos écartées",
+        "analyzing_sources": "Analyse : {} / {} sources, {} vidéos",
+        "sources_found": "{} vidéos, {} sources ({} doublons)"
     },
     "en": {
         "window_title": "YouTube Downloader PRO",
-        "url_label": "Link (Video/Playlist)",
+        "url_label": "Links (videos, playlists, channels)",
         "analyze_btn": "ANALYZE",
         "col_left_title": "Videos",
         "select_all": "Select All",
@@ -56,7 +66,14 @@ TRANSLATIONS = {
         "error_perm": "Permission denied -> Trying fallback folder...",
         "fallback_ok": "Saved in private folder (Android/data)",
         "skipped": "Skipped...",
-        "processing": "{} / {}"
+        "processing": "{} / {}",
+        "workers_label": "Parallel",
+        "queued": "Queued",
+        "batch_progress": "{} / {} done",
+        "retrying": "Retrying in {} s...",
+        "no_space": "Not enough space: {} videos left out",
+        "analyzing_sources": "Analyzing: {} / {} sources, {} videos",
+        "sources_found": "{} videos, {} sources ({} duplicates)"
     }
 }
 
@@ -70,11 +87,11 @@ def tr(key, *args):
     return text
 
 # --- Configuration Globale ---
-class DownloadState:
-    RUNNING = "running"
-    PAUSED = "paused"
-    CANCELLED = "cancelled"
-    IDLE = "idle"
+MAX_WORKERS = 4
+DEFAULT_CONFIG = {
+    "workers": 2,
+    "connections": 4,
+}
 
 def main(page: ft.Page):
     # --- FIX CRITIQUE SSL ---
@@ -100,11 +117,18 @@ def main(page: ft.Page):
     public_download_path = "/storage/emulated/0/Download"
     # Chemin privé spécifique à l'app (toujours accessible sans permission)
     private_download_path = "/storage/emulated/0/Android/data/com.example.apk_project/files"
+    # Téléchargement dans un dossier privé, puis déplacement vers la destination : un refus
+    # d'écriture sur le dossier public ne fait jamais retélécharger la vidéo
+    staging_candidates = [os.path.join(private_download_path, ".staging"), STAGING_DIR]
 
-    current_state = DownloadState.IDLE
+    config = load_config(DEFAULT_CONFIG, MAX_WORKERS)
     video_list_data = []
-    download_queue = []
-    current_video_index = 0
+    progress_bus = ProgressBus(lambda batch: apply_progress(batch), fps=10)
+    # File et workers : tout passe par le moteur partagé avec la version bureau
+    android_ydl_params = {
+        'nocheckcertificate': True,
+    }
+    engine = DownloadEngine(public_download_path, config["workers"], fallback_dir=private_download_path, ydl_params=android_ydl_params, connections=config["connections"])
 
     # --- UI : Header ---
     title_text = ft.Text(tr("window_title"), size=20, weight="bold")
@@ -168,7 +192,21 @@ def main(page: ft.Page):
         on_change=on_format_change
     )
 
-    options_row = ft.Row([format_dropdown], alignment="center")
+    def on_workers_change(e):
+        config["workers"] = int(workers_dropdown.value)
+        save_config(config)
+        engine.set_workers(config["workers"])
+
+    workers_dropdown = ft.Dropdown(
+        label=tr("workers_label"),
+        expand=True,
+        text_size=14,
+        options=[ft.dropdown.Option(str(n)) for n in range(1, MAX_WORKERS + 1)],
+        value=str(config["workers"]),
+        on_change=on_workers_change
+    )
+
+    options_row = ft.Row([format_dropdown, workers_dropdown], alignment="center")
 
     start_download_btn = ft.ElevatedButton(
         text=tr("dl_mp4_btn"),
@@ -195,7 +233,10 @@ def main(page: ft.Page):
     speed_text = status_row.controls[0]
     eta_text = status_row.controls[1]
 
-    btn_cancel = ft.IconButton(icon="stop", icon_size=30, icon_color="red", on_click=lambda e: set_state(DownloadState.CANCELLED))
+    # Une ligne de progression par téléchargement actif
+    jobs_list_view = ft.ListView(height=120, spacing=5)
+
+    btn_cancel = ft.IconButton(icon="stop", icon_size=30, icon_color="red", on_click=lambda e: engine.cancel_all())
     
     folder_info_text = ft.Text(tr("folder_label", "..."), size=10, color="grey")
 
@@ -210,6 +251,7 @@ def main(page: ft.Page):
             current_video_label,
             progress_bar,
             status_row,
+            jobs_list_view,
             ft.Container(height=10),
             btn_cancel,
             folder_info_text
@@ -220,14 +262,9 @@ def main(page: ft.Page):
 
     # --- Logique Métier ---
 
-    def set_state(new_state):
-        nonlocal current_state
-        current_state = new_state
-        page.update()
-
     def analyze_button_click(e):
-        url = url_input.value
-        if not url: return
+        urls = parse_url_list(url_input.value or "")
+        if not urls: return
 
         analyze_btn.disabled = True
         list_info_text.value = tr("analyzing")
@@ -236,181 +273,223 @@ def main(page: ft.Page):
         list_container.visible = True
         page.update()
 
-        threading.Thread(target=run_analyze, args=(url,), daemon=True).start()
+        threading.Thread(target=run_analyze, args=(urls,), daemon=True).start()
 
-    def run_analyze(url):
+    def run_analyze(urls):
         nonlocal video_list_data
-        ydl_opts = {'extract_flat': True, 'quiet': True}
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if 'entries' in info: video_list_data = list(info['entries'])
-                else: video_list_data = [info]
-            
-            videos_list_view.controls.clear()
-            for vid in video_list_data:
-                title = vid.get('title', 'Sans titre')
-                vid_id = vid.get('id')
-                vid_url = vid.get('url')
-                final_url = vid_url if vid_url and "youtube" in vid_url else f"https://www.youtube.com/watch?v={vid_id}"
-
-                cb = ft.Checkbox(label=title, value=True, data=final_url)
-                videos_list_view.controls.append(cb)
-
-            list_info_text.value = tr("videos_found", len(video_list_data))
-            analyze_btn.disabled = False
-            controls_column.visible = True
+        video_list_data = []
+        headers = {}
+        lock = threading.Lock()
+
+        def source_label(source):
+            name = source.title or source.url
+            if source.state == AnalysisSource.FAILED:
+                return f"❌ {name} : {ANSI_ESCAPE.sub('', source.error or '')}"
+            return f"📂 {name} ({source.added})"
+
+        def show_progress(source):
+            finished = sum(s.state in (AnalysisSource.DONE, AnalysisSource.FAILED) for s in analysis.sources)
+            list_info_text.value = tr("analyzing_sources", finished, len(analysis.sources), len(video_list_data))
             page.update()
 
+        def on_source_opened(source):
+            # Plusieurs sources : un en-tête (texte, hors sélection) avant leurs vidéos
+            if len(analysis.sources) > 1:
+                headers[source.index] = ft.Text(source_label(source), size=12, weight="bold", color="blue")
+                videos_list_view.controls.append(headers[source.index])
+
+        def on_entries(source, entries):
+            with lock:
+                for vid in entries:
+                    entry = entry_from_info(len(video_list_data), vid)
+                    video_list_data.append(vid)
+                    videos_list_view.controls.append(ft.Checkbox(label=entry.title, value=True, data=entry))
+            show_progress(source)
+
+        def on_source_finished(source):
+            if source.index in headers:
+                headers[source.index].value = source_label(source)
+            show_progress(source)
+
+        listener = AnalysisListener(on_source_progress=show_progress, on_source_opened=on_source_opened, on_entries=on_entries, on_source_finished=on_source_finished)
+        analysis = MultiSourceAnalysis(engine.pool, urls, listener)
+        try:
+            analysis.run()
+            source = analysis.sources[0]
+            if len(analysis.sources) > 1:
+                list_info_text.value = tr("sources_found", len(video_list_data), len(analysis.sources), analysis.duplicates)
+            elif source.state == AnalysisSource.FAILED:
+                list_info_text.value = tr("error", source.error)
+            else:
+                list_info_text.value = tr("videos_found", len(video_list_data))
+            controls_column.visible = bool(video_list_data)
         except Exception as e:
             list_info_text.value = tr("error", str(e))
-            analyze_btn.disabled = False
-            page.update()
+        analyze_btn.disabled = False
+        page.update()
 
     def toggle_select_all(e):
         for ctrl in videos_list_view.controls:
             if isinstance(ctrl, ft.Checkbox): ctrl.value = select_all_checkbox.value
         page.update()
 
-    def progress_hook(d):
-        if current_state == DownloadState.CANCELLED: raise Exception("CANCELLED")
-
-        if d['status'] == 'downloading':
+    def build_job_row(job):
+        # --- Ligne de progression individuelle ---
+        job.title_text = ft.Text(job.title, size=10, no_wrap=True, expand=True)
+        job.progress_bar = ft.ProgressBar(value=0, color="blue", bgcolor="grey")
+        job.status_text = ft.Text(tr("queued"), size=10, color="grey")
+        job.btn_cancel = ft.IconButton(icon="close", icon_size=16, icon_color="red", on_click=lambda e: engine.cancel_job(job))
+        job.row = ft.Column([
+            ft.Row([job.title_text, job.btn_cancel], spacing=0),
+            job.progress_bar,
+            job.status_text
+        ], spacing=2)
+        return job.row
+
+    def update_batch_status():
+        done = engine.finished
+        total = len(engine.jobs)
+        progress_bar.value = done / total if total else 0
+        eta_text.value = tr("batch_progress", done, total)
+
+    def apply_progress(batch):
+        # Exécuté par la pompe du ProgressBus : une seule mise à jour pour tous les jobs
+        changed = []
+        for job, (percent_str, speed_str, eta_str) in batch.items():
+            if job.state != DownloadState.RUNNING: continue
+            percent_str = ANSI_ESCAPE.sub('', percent_str or '').strip()
             try:
-                p = d.get('_percent_str', '0%').replace('%', '')
-                try:
-                    progress_bar.value = float(p) / 100
-                except: pass
-
-                current_video_label.value = f"{d.get('_percent_str', '')}"
-                speed_text.value = d.get('_speed_str', '-')
-                eta_text.value = d.get('_eta_str', '-')
-                page.update()
-            except: pass
-
-    def run_download_loop():
-        nonlocal current_video_index, current_state
-        
-        selected_format = format_dropdown.value
-        
-        # Choix initial du dossier (Public)
-        target_dir = public_download_path
-        folder_info_text.value = tr("folder_label", "Download (Public)")
+                job.progress_bar.value = float(percent_str.replace('%', '')) / 100
+            except ValueError: pass
+            job.status_text.value = f"{percent_str} - {ANSI_ESCAPE.sub('', speed_str or '-')} - {ANSI_ESCAPE.sub('', eta_str or '-')}"
+            changed.extend([job.progress_bar, job.status_text])
+        # Vitesse totale du lot : somme des téléchargements actifs
+        from yt_dlp.utils import format_bytes
+        total_speed = sum(job.speed for job in engine.active_jobs())
+        speed_text.value = format_bytes(total_speed) + "/s" if total_speed else "-"
+        changed.append(speed_text)
+        if changed:
+            page.update(*changed)
+
+    # --- Rappels du moteur (appelés depuis ses threads) ---
+    def on_job_started(job):
+        # --- UI : EN COURS (⏩) ---
+        job.checkbox.label = f"⏩ {job.title}"
+        job.checkbox.update()
+        build_job_row(job)
+        job.status_text.value = tr("processing", job.index + 1, len(engine.jobs))
+        jobs_list_view.controls.append(job.row)
         page.update()
 
-        while current_video_index < len(download_queue):
-            if current_state == DownloadState.CANCELLED: break
+    def on_job_progress(job, d):
+        # Pas d'accès à l'UI depuis le worker : on publie, la pompe affiche
+        progress_bus.publish(job, (d.get('_percent_str'), d.get('_speed_str'), d.get('_eta_str')))
 
-            current_checkbox_item = download_queue[current_video_index]
-            url = current_checkbox_item.data
-
-            # --- UI : EN COURS (⏩) ---
-            clean_title = current_checkbox_item.label.replace("⏩ ", "").replace("✔️ ", "").replace("❌ ", "")
-            current_checkbox_item.label = f"⏩ {clean_title}"
-            current_checkbox_item.update()
+    def on_fallback(job, out_dir):
+        # Permission refusée sur le dossier public : le moteur retente dans le dossier privé
+        current_video_label.value = tr("error_perm")
+        current_video_label.color = "orange"
+        folder_info_text.value = tr("folder_label", "Android/data/... (Private)")
+        page.update()
 
-            current_video_label.value = tr("processing", current_video_index + 1, len(download_queue))
-            current_video_label.color = "white"
-            progress_bar.value = 0 
-            page.update()
+    def on_job_retrying(job, delay):
+        # Erreur passagère (réseau, 429...) : le moteur remet le job en file après l'attente
+        job.checkbox.label = f"🔁 {job.title}"
+        job.checkbox.update()
+        job.status_text.value = tr("retrying", round(delay))
+        # La ligne sera reconstruite au prochain démarrage du job
+        if job.row in jobs_list_view.controls:
+            jobs_list_view.controls.remove(job.row)
+        page.update()
 
-            # Configuration de base
-            ydl_opts = {
-                'outtmpl': os.path.join(target_dir, '%(title)s.%(ext)s'),
-                'progress_hooks': [progress_hook],
-                'noplaylist': True,
-                'nocheckcertificate': True,
-                'ignoreerrors': True,
-                'extractor_args': {'youtube': {'player_client': ['default']}}
-            }
-
-            if selected_format == "AUDIO":
-                ydl_opts.update({'format': 'bestaudio/best'})
-            else:
-                ydl_opts.update({'format': 'best[ext=mp4]'})
+    def on_job_finished(job):
+        job.checkbox.value = False
+        if job.state == DownloadState.DONE:
+            job.checkbox.label = f"✔️ {job.title}"
+        elif job.state == DownloadState.FAILED:
+            job.checkbox.label = f"❌ {job.title}"
+        else:
+            job.checkbox.label = job.title
+        job.checkbox.update()
+        if job.out_dir == private_download_path and current_video_label.value == tr("error_perm"):
+            current_video_label.value = tr("fallback_ok")
+        elif job.state == DownloadState.FAILED and current_video_label.color != "orange":
+            current_video_label.value = tr("error_private") if job.error_class in (ErrorClass.PRIVATE, ErrorClass.AGE) else f"Erreur."
+            current_video_label.color = "red"
+        if job.row in jobs_list_view.controls:
+            jobs_list_view.controls.remove(job.row)
+        update_batch_status()
+        page.update()
 
-            success = False
-            
-            # TENTATIVE 1 : Dossier Public
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                success = True
-            except Exception as e:
-                error_msg = str(e)
-                # Si erreur de permission, on tente le dossier privé
-                if "Permission denied" in error_msg or "EACCES" in error_msg or "OSError" in error_msg:
-                    current_video_label.value = tr("error_perm")
-                    current_video_label.color = "orange"
-                    page.update()
-                    time.sleep(1)
-                    
-                    # TENTATIVE 2 : Dossier Privé (Secours)
-                    try:
-                        if not os.path.exists(private_download_path):
-                            os.makedirs(private_download_path, exist_ok=True)
-                        
-                        target_dir = private_download_path
-                        ydl_opts['outtmpl'] = os.path.join(target_dir, '%(title)s.%(ext)s')
-                        folder_info_text.value = tr("folder_label", "Android/data/... (Private)")
-                        page.update()
-                        
-                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                            ydl.download([url])
-                        
-                        success = True
-                        current_video_label.value = tr("fallback_ok")
-                        time.sleep(1)
-                        
-                    except Exception as e2:
-                        print(f"Echec fallback: {e2}")
-                        success = False
-                
-                elif "CANCELLED" in error_msg:
-                    break
-                else:
-                    success = False
-
-            # Résultat Final
-            if success:
-                current_checkbox_item.value = False
-                current_checkbox_item.label = f"✔️ {clean_title}"
-                current_checkbox_item.update()
-            else:
-                current_checkbox_item.value = False
-                current_checkbox_item.label = f"❌ {clean_title}"
-                current_checkbox_item.update()
-                if current_video_label.color != "orange":
-                    current_video_label.value = f"Erreur."
-                    current_video_label.color = "red"
-                    page.update()
-                    time.sleep(1.5)
-
-            current_video_index += 1 
-
-        current_video_label.value = tr("finished")
-        current_video_label.color = "green"
+    def on_batch_finished(outcome):
+        if outcome == DownloadState.DONE:
+            current_video_label.value = tr("finished")
+            current_video_label.color = "green"
+        progress_bus.stop()
+        jobs_list_view.controls.clear()
         start_download_btn.disabled = False
         analyze_btn.disabled = False
         page.update()
 
+    engine.listener = EngineListener(
+        on_job_started=on_job_started,
+        on_job_progress=on_job_progress,
+        on_fallback=on_fallback,
+        on_job_retrying=on_job_retrying,
+        on_job_finished=on_job_finished,
+        on_batch_finished=on_batch_finished,
+    )
+
     def start_download_sequence(e):
-        nonlocal download_queue, current_video_index
-        download_queue = []
+        options = {"format": format_dropdown.value}
+        jobs = []
         for ctrl in videos_list_view.controls:
             if isinstance(ctrl, ft.Checkbox) and ctrl.value:
-                download_queue.append(ctrl)
+                job = DownloadJob(ctrl.data, len(jobs), options)
+                job.checkbox = ctrl
+                jobs.append(job)
         
-        if not download_queue: return
+        if not jobs: return
 
-        current_video_index = 0
-        set_state(DownloadState.RUNNING)
+        # Vérification unique des dossiers avant le lot : Public si l'écriture y est possible
+        engine.staging_dir = first_writable(staging_candidates)
+        if first_writable([public_download_path]):
+            engine.out_dir = public_download_path
+            folder_info_text.value = tr("folder_label", "Download (Public)")
+        else:
+            engine.out_dir = private_download_path
+            folder_info_text.value = tr("folder_label", "Android/data/... (Private)")
+
+        # Espace libre : seules les vidéos qui tiennent (taille estimée d'après l'analyse) sont lancées
+        budget = DiskBudget(engine.staging_dir or engine.out_dir)
+        admitted = []
+        for job in jobs:
+            if budget.admit(job.entry, options):
+                job.index = len(admitted)
+                admitted.append(job)
+            else:
+                job.checkbox.label = f"💾 {job.title}"
+        jobs = admitted
+        if budget.refused:
+            current_video_label.value = tr("no_space", budget.refused)
+            current_video_label.color = "orange"
+        if not jobs:
+            page.update()
+            return
+
+        jobs_list_view.controls.clear()
+        progress_bus.start()
+
+        if not budget.refused:
+            current_video_label.value = tr("waiting")
+            current_video_label.color = "white"
         
         start_download_btn.disabled = True
         analyze_btn.disabled = True
         
+        engine.start(jobs)
+        update_batch_status()
         page.update()
-        threading.Thread(target=run_download_loop, daemon=True).start()
 
     # --- Assemblage ---
     page.add(
@@ -423,6 +502,8 @@ def main(page: ft.Page):
             controls_column
         ])
     )
+    # yt-dlp se charge en arrière-plan, une fois l'écran affiché
+    warm_up()
 
 if __name__ == "__main__":
     ft.app(target=main)
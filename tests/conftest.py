@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_engine import MediaHandler, MediaServer
+
+SIZE = 4 * 1024 * 1024
+
+# --- Serveur de médias local qui compte les octets servis ---
+class CountingWriter:
+    # Ne compte que le corps des réponses (les en-têtes sont déjà envoyés)
+    def __init__(self, wfile, handler):
+        self.wfile = wfile
+        self.handler = handler
+
+    def write(self, data):
+        written = self.wfile.write(data)
+        self.handler.body += len(data)
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.wfile, name)
+
+class CountingHandler(MediaHandler):
+    rate = 1024 * 1024  # Assez lent pour agir en plein transfert
+
+    def setup(self):
+        super().setup()
+        self.body = 0
+
+    def end_headers(self):
+        super().end_headers()
+        self.wfile.flush()
+        self.wfile = CountingWriter(self.wfile, self)
+
+    def do_GET(self, head=False):
+        # fault : panne injectée par le test, qui renvoie True si elle a répondu à la place du serveur
+        try:
+            if not (self.server.fault and self.server.fault(self)):
+                super().do_GET(head)
+        finally:
+            self.server.requests.append((self.headers.get("Range"), self.body))
+
+class LocalMedia:
+    def __init__(self, server, path):
+        self.server = server
+        self.path = path
+        self.url = f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(path)}"
+        self.requests = server.requests
+
+    def set_fault(self, fault):
+        self.server.fault = fault
+
+    def served_bytes(self, expected=SIZE):
+        # Octets du fichier servis au téléchargement : l'extracteur générique lit le début de la
+        # page sans Range, et la sonde "bytes=0-0" vérifie seulement le support des plages.
+        # Les derniers handlers peuvent finir juste après le job : on les attend un peu.
+        deadline = time.monotonic() + 5
+        while True:
+            total = sum(body for byte_range, body in list(self.requests) if byte_range and byte_range != "bytes=0-0")
+            if total >= expected or time.monotonic() > deadline:
+                return total
+            time.sleep(0.05)
+
+@pytest.fixture
+def media_server(tmp_path):
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    path = media_dir / "clip.mp4"
+    path.write_bytes(os.urandom(SIZE))
+    handler = type("Handler", (CountingHandler,), {"media_dir": str(media_dir)})
+    server = MediaServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    server.fault = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield LocalMedia(server, str(path))
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,84 @@
+from downloader_engine import MultiSourceAnalysis, AnalysisListener, VideoEntry, entry_key, entry_from_info, archive_key
+
+OPTIONS = {"format": "MP4", "resolution": None, "compatibility": False}
+
+class DictCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.data[key] = value
+
+# --- Identité des vidéos ---
+def test_feed_entry_and_direct_analysis_share_key():
+    # Entrée à plat d'un flux RSS (sans id) et même fichier analysé directement (extracteur générique)
+    feed_entry = {"url": "http://127.0.0.1:8768/a0.m4a", "title": "a0.m4a"}
+    direct = {"id": "a0", "title": "a0", "webpage_url": "http://127.0.0.1:8768/a0.m4a", "extractor_key": "Generic"}
+    assert entry_key(feed_entry) == entry_key(direct)
+    assert archive_key(entry_from_info(0, feed_entry), OPTIONS) == archive_key(entry_from_info(1, direct), OPTIONS)
+    assert archive_key(entry_from_info(0, feed_entry), OPTIONS) is not None
+
+def test_youtube_key_uses_extractor_id():
+    flat = {"id": "abc", "ie_key": "Youtube", "title": "x"}
+    assert entry_key(flat) == "youtube:abc"
+    assert archive_key(VideoEntry(0, "abc", "x", "https://www.youtube.com/watch?v=abc", "youtube"), OPTIONS)[:2] == ("youtube", "abc")
+
+# --- Cache des analyses ---
+def test_cached_source_keeps_its_title(monkeypatch):
+    import downloader_engine
+
+    def fake_iter_entries(pool, url, on_info=None):
+        on_info({"title": "Ma playlist"})
+        yield {"id": "v1", "ie_key": "Youtube", "title": "Video 1"}
+
+    monkeypatch.setattr(downloader_engine, "iter_entries", fake_iter_entries)
+    cache = DictCache()
+    first = MultiSourceAnalysis(None, ["https://www.youtube.com/playlist?list=PL1"], cache=cache)
+    first.run()
+    found = []
+    second = MultiSourceAnalysis(None, ["https://www.youtube.com/playlist?list=PL1"], AnalysisListener(on_entries=lambda s, e: found.extend(e)), cache=cache)
+    second.run()
+    assert second.sources[0].cached
+    assert second.sources[0].title == "Ma playlist"
+    assert [vid["id"] for vid in found] == ["v1"]
+
+# --- Synchronisation incrémentale ---
+def sync_run(sync, settled):
+    found = []
+    analysis = MultiSourceAnalysis(None, ["https://www.youtube.com/@chaine/videos"], AnalysisListener(on_entries=lambda s, e: found.extend(vid["id"] for vid in e)), sync=sync)
+    analysis.run()
+    analysis.save_sync(lambda key: key.split(":")[1] in settled)
+    return found
+
+def test_sync_stops_at_known_and_keeps_unsettled(monkeypatch, tmp_path):
+    import downloader_engine
+
+    channel = [f"v{i}" for i in range(20, 0, -1)]  # Du plus récent au plus ancien
+    read = []
+
+    def fake_iter_entries(pool, url, on_info=None):
+        for vid in channel:
+            read.append(vid)
+            yield {"id": vid, "ie_key": "Youtube", "title": vid}
+
+    monkeypatch.setattr(downloader_engine, "iter_entries", fake_iter_entries)
+    sync = downloader_engine.SyncState(str(tmp_path / "sync.sqlite3"))
+
+    # Tout échoue : rien n'est tenu pour connu, la synchronisation suivante repropose tout
+    assert len(sync_run(sync, set())) == 20
+    assert len(sync_run(sync, set(channel))) == 20
+
+    # Tout est réglé : aucune nouveauté, la lecture s'arrête après quelques vidéos connues
+    read.clear()
+    assert sync_run(sync, set()) == []
+    assert len(read) == downloader_engine.SYNC_STOP_AFTER
+
+    # Trois nouveautés dont une échoue : elle revient, avec la plus récente qu'elle (que le
+    # client écarte grâce à l'archive), mais pas la plus ancienne
+    channel[:0] = ["n3", "n2", "n1"]
+    assert sync_run(sync, {"n3", "n1"}) == ["n3", "n2", "n1"]
+    assert sync_run(sync, {"n3", "n2"}) == ["n3", "n2"]
+    assert sync_run(sync, set()) == []
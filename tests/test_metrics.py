@@ -0,0 +1,9 @@
+from downloader_engine import EngineMetrics
+
+def test_batch_summary_keeps_outcome_with_errors():
+    metrics = EngineMetrics()
+    metrics.observe_error("network", True)
+    metrics.observe_error("server", False)
+    summary = metrics.batch_summary("done")
+    assert summary["outcome"] == "done"
+    assert summary["errors"] == {"network": {"retried": 1}, "server": {"failed": 1}}
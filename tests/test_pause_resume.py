@@ -0,0 +1,33 @@
+import os
+import threading
+
+import pytest
+
+from conftest import SIZE
+from downloader_engine import DownloadEngine, EngineListener, DownloadJob, DownloadState, VideoEntry
+
+# --- Pause / reprise ---
+@pytest.mark.parametrize("connections", [1, 4])
+def test_pause_resume_fetches_each_byte_once(tmp_path, media_server, connections):
+    paused = []
+
+    def on_job_progress(job, d):
+        # Pause au quart du fichier, reprise un peu plus tard depuis un autre thread
+        if not paused and (d.get("downloaded_bytes") or 0) > SIZE // 4:
+            paused.append(job)
+            engine.pause()
+            threading.Timer(1.0, engine.resume).start()
+
+    engine = DownloadEngine(
+        str(tmp_path / "out"), 1, listener=EngineListener(on_job_progress=on_job_progress),
+        ydl_params={"quiet": True, "noprogress": True}, connections=connections,
+    )
+    job = DownloadJob(VideoEntry(0, "clip", "clip", media_server.url), 0, {"format": "MP4", "resolution": None, "compatibility": False})
+    engine.start([job])
+    engine.wait()
+    engine.pool.close()
+
+    assert paused
+    assert job.state == DownloadState.DONE, job.error
+    assert os.path.getsize(tmp_path / "out" / "clip.mp4") == SIZE
+    assert media_server.served_bytes() == SIZE
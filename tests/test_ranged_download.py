@@ -0,0 +1,73 @@
+import os
+import re
+import threading
+
+import pytest
+
+from conftest import SIZE
+from downloader_engine import DownloadEngine, DownloadJob, DownloadState, VideoEntry
+
+def download(tmp_path, url, connections):
+    engine = DownloadEngine(str(tmp_path / "out"), 1, ydl_params={"quiet": True, "noprogress": True}, connections=connections)
+    job = DownloadJob(VideoEntry(0, "clip", "clip", url), 0, {"format": "MP4", "resolution": None, "compatibility": False})
+    engine.start([job])
+    engine.wait()
+    engine.pool.close()
+    return job
+
+def fail_first_range(respond):
+    # Panne sur la première plage demandée (pas la sonde "bytes=0-0"), puis service normal
+    lock = threading.Lock()
+    failed = []
+
+    def fault(handler):
+        byte_range = handler.headers.get("Range")
+        with lock:
+            if failed or not byte_range or byte_range == "bytes=0-0": return False
+            failed.append(byte_range)
+        respond(handler)
+        return True
+    return fault
+
+def error_response(status):
+    def respond(handler):
+        handler.send_response(status)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+    return respond
+
+def cut_halfway(path):
+    # Réponse 206 correcte dont la connexion se coupe à la moitié de la plage
+    def respond(handler):
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", handler.headers["Range"]).groups())
+        handler.send_response(206)
+        handler.send_header("Content-Range", f"bytes {start}-{end}/{SIZE}")
+        handler.send_header("Content-Length", str(end - start + 1))
+        handler.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            handler.wfile.write(f.read((end - start + 1) // 2))
+        handler.close_connection = True
+    return respond
+
+def assert_downloaded(tmp_path, media_server, job):
+    assert job.state == DownloadState.DONE, job.error
+    with open(media_server.path, "rb") as src, open(tmp_path / "out" / "clip.mp4", "rb") as out:
+        assert src.read() == out.read()
+    assert os.listdir(tmp_path / "out") == ["clip.mp4"]
+
+# --- Téléchargement par plages ---
+@pytest.mark.parametrize("connections", [1, 4])
+@pytest.mark.parametrize("status", [503, 403])
+def test_retry_after_range_error(tmp_path, media_server, connections, status):
+    # 503 : reprise de la plage dans le transfert ; 403 : le transfert échoue et le moteur le
+    # relance, qui doit repartir du .part pré-alloué grâce à son fichier d'état
+    media_server.server.RequestHandlerClass.rate = None
+    media_server.set_fault(fail_first_range(error_response(status)))
+    assert_downloaded(tmp_path, media_server, download(tmp_path, media_server.url, connections))
+
+@pytest.mark.parametrize("connections", [1, 4])
+def test_cut_range_resumes_from_received_bytes(tmp_path, media_server, connections):
+    media_server.set_fault(fail_first_range(cut_halfway(media_server.path)))
+    assert_downloaded(tmp_path, media_server, download(tmp_path, media_server.url, connections))
+    assert media_server.served_bytes() == SIZE
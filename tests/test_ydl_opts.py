@@ -0,0 +1,24 @@
+import pytest
+
+from downloader_engine import FFmpegCapabilities, build_ydl_opts
+
+MUXERS = ["ipod", "mp4", "opus", "ogg"]
+
+def audio_codec(options, encoders):
+    capabilities = FFmpegCapabilities("/usr/bin/ffmpeg", "7.0", encoders, MUXERS)
+    opts = build_ydl_opts(options, "/tmp", "/usr/bin/ffmpeg", capabilities)
+    return [pp["preferredcodec"] for pp in opts.get("postprocessors", [])]
+
+# --- Profils audio selon les encodeurs de ffmpeg ---
+@pytest.mark.parametrize("audio_format, encoders, expected", [
+    ("OPUS", ["libopus", "aac"], ["opus"]),
+    ("OPUS", ["aac"], ["best"]),
+    ("M4A", ["aac"], ["m4a"]),
+    ("M4A", ["libopus"], ["best"]),
+    ("MP3", ["libmp3lame"], ["mp3"]),
+    ("MP3", ["aac"], ["m4a"]),
+    ("MP3", [], ["best"]),
+])
+def test_audio_profile_falls_back_without_encoder(audio_format, encoders, expected):
+    options = {"format": audio_format, "resolution": None, "compatibility": False}
+    assert audio_codec(options, encoders) == expected